@@ -0,0 +1,136 @@
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from metrics import ADMISSION_QUEUE_SECONDS, ADMISSION_IN_FLIGHT, ADMISSION_QUEUED
+
+
+class AdmissionController:
+    """
+    Bounded admission queue in front of plan generation.
+
+    At most ``max_concurrent`` generations run at once. Up to ``max_queue``
+    more wait (for at most ``queue_timeout`` seconds) for a slot; anything
+    beyond that is turned away immediately, so a burst is shed instead of
+    slowing every request down.
+    """
+
+    def __init__(self, max_concurrent, max_queue, queue_timeout):
+        """
+        Args:
+            max_concurrent (int): Generations allowed to run at the same time
+            max_queue (int): Requests allowed to wait for a slot
+            queue_timeout (float): Seconds a queued request waits before giving up
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._in_flight = 0
+        self._queued = 0
+        self._condition = threading.Condition()
+
+        ADMISSION_IN_FLIGHT.set(0)
+        ADMISSION_QUEUED.set(0)
+
+    @contextmanager
+    def slot(self, wait=True):
+        """
+        Wait for a generation slot.
+
+        Yields True once admitted (the slot is released when the block exits)
+        or False straight away if the queue is full or the wait timed out.
+        With ``wait=False`` a busy controller yields False without queueing,
+        for background work that should never hold up a user.
+        """
+        admitted = self._acquire(wait)
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                self._release()
+
+    def _acquire(self, wait=True):
+        started = time.perf_counter()
+        with self._condition:
+            if self._in_flight < self.max_concurrent:
+                self._in_flight += 1
+                ADMISSION_IN_FLIGHT.set(self._in_flight)
+                ADMISSION_QUEUE_SECONDS.observe(0.0, outcome='admitted')
+                return True
+            if not wait or self._queued >= self.max_queue:
+                return False
+
+            self._queued += 1
+            ADMISSION_QUEUED.set(self._queued)
+            deadline = started + self.queue_timeout
+            try:
+                while self._in_flight >= self.max_concurrent:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        ADMISSION_QUEUE_SECONDS.observe(time.perf_counter() - started, outcome='timeout')
+                        return False
+                    self._condition.wait(remaining)
+            finally:
+                self._queued -= 1
+                ADMISSION_QUEUED.set(self._queued)
+
+            self._in_flight += 1
+            ADMISSION_IN_FLIGHT.set(self._in_flight)
+        ADMISSION_QUEUE_SECONDS.observe(time.perf_counter() - started, outcome='admitted')
+        return True
+
+    def _release(self):
+        with self._condition:
+            self._in_flight -= 1
+            ADMISSION_IN_FLIGHT.set(self._in_flight)
+            self._condition.notify()
+
+
+class PlanPool:
+    """
+    Recently generated plan sets, served when generation is overloaded.
+
+    Plan sets are keyed by target calories (rounded to ``bucket`` calories)
+    and the user's exclusions, so a fallback plan never contains foods the
+    user has excluded. Only catalog plans belong here: plans with a user's
+    custom foods must not be shown to anyone else.
+    """
+
+    def __init__(self, bucket=100, per_key=8, max_keys=512):
+        """
+        Args:
+            bucket (int): Calorie granularity of the target key
+            per_key (int): Plan sets kept per key (oldest dropped first)
+            max_keys (int): Keys kept overall (least recently added dropped first)
+        """
+        self.bucket = bucket
+        self.per_key = per_key
+        self.max_keys = max_keys
+        self._entries = OrderedDict()  # key -> deque of plan sets
+        self._lock = threading.Lock()
+
+    def _key(self, target_calories, exclusions):
+        return int(round(target_calories / self.bucket)), exclusions or ''
+
+    def add(self, target_calories, exclusions, meal_plans):
+        """Remember a generated plan set (diet type -> tuple of food ids)."""
+        key = self._key(target_calories, exclusions)
+        with self._lock:
+            plans = self._entries.get(key)
+            if plans is None:
+                plans = self._entries[key] = deque(maxlen=self.per_key)
+            plans.append(meal_plans)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+
+    def get(self, target_calories, exclusions):
+        """A random recent plan set for this target and exclusions, or None."""
+        key = self._key(target_calories, exclusions)
+        with self._lock:
+            plans = self._entries.get(key)
+            if not plans:
+                return None
+            return random.choice(plans)
@@ -1,35 +1,99 @@
-from flask import Flask, render_template, redirect, url_for, request, flash, session, jsonify
+from flask import Flask, render_template, redirect, url_for, request, flash, session, jsonify, g, Response, stream_with_context, abort, make_response
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
 import json
-import pandas as pd
+import time
+import hashlib
+import hmac
+import io
 from datetime import datetime, timedelta
+from functools import partial
 import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import plotly.io as pio
-from data_processor import load_and_process_data
-from meal_generator import generate_meal_plans
+from sqlalchemy import event, inspect, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from catalog import load_catalog
+from meal_generator import generate_meal_plans, generate_weekly_meal_plans, build_diet_pools, build_pair_indexes, swap_plan_item
+from metrics import render_metrics, REQUEST_SECONDS, DB_COMMIT_SECONDS, ADMISSION_SHED
+from tracing import init_tracing
+from profiling import init_profiling
+from food_search import FoodSearchIndex
+from food_overlay import OverlayCache, CatalogView
+from exclusions import EXCLUSION_TAGS, exclusion_mask, parse_exclusions, exclude_from_pools
+from history_io import EXPORT_FORMATS, MAX_PLAN_CALORIES, chunked, read_entries
+from admission import AdmissionController, PlanPool
+from prefetch import PlanPrefetcher
+from cooccurrence import CooccurrenceModel
+from diets import DIETS
+from history_shards import (
+    HISTORY_BIND, HistoryRoutingSession, history_binds, init_history_routing,
+    create_history_shards, each_history_shard
+)
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'calorie-buddy-flask-app-secret-key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///calorie_buddy.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('CALORIE_BUDDY_DATABASE_URI', 'sqlite:///calorie_buddy.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Optional: spread meal history over several SQLite files by user hash (0 keeps it in the main database)
+app.config['HISTORY_SHARDS'] = int(os.environ.get('CALORIE_BUDDY_HISTORY_SHARDS', 0))
+app.config['HISTORY_SHARD_URI'] = os.environ.get('CALORIE_BUDDY_HISTORY_SHARD_URI', 'sqlite:///calorie_buddy_history_{shard}.db')
+app.config['SQLALCHEMY_BINDS'] = history_binds(app.config['HISTORY_SHARDS'], app.config['HISTORY_SHARD_URI'])
+# Token for the admin-wide history summary (unset disables the endpoint)
+app.config['ADMIN_TOKEN'] = os.environ.get('CALORIE_BUDDY_ADMIN_TOKEN')
+app.config['TRACE_SLOW_REQUEST_MS'] = int(os.environ.get('CALORIE_BUDDY_SLOW_REQUEST_MS', 500))
+app.config['TRACE_LOG_FILE'] = os.environ.get('CALORIE_BUDDY_TRACE_LOG', 'slow_requests.log')
+app.config['TRACE_SERVER_TIMING'] = os.environ.get('CALORIE_BUDDY_TRACE_SERVER_TIMING', '').lower() in ('1', 'true', 'yes')
+# Opt-in per-request profiling (off unless a token or sampling rate is set)
+app.config['PROFILE_TOKEN'] = os.environ.get('CALORIE_BUDDY_PROFILE_TOKEN')
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('CALORIE_BUDDY_PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_DIR'] = os.environ.get('CALORIE_BUDDY_PROFILE_DIR', 'profiles')
+# Per-diet time budget for the anytime plan solver; unset keeps the greedy best-of-five
+app.config['GENERATION_DEADLINE_MS'] = (
+    float(os.environ['CALORIE_BUDDY_GENERATION_DEADLINE_MS'])
+    if os.environ.get('CALORIE_BUDDY_GENERATION_DEADLINE_MS') else None
+)
+# Candidates per diet for the vectorized sampled solver; when set it replaces both solvers above
+app.config['GENERATION_SAMPLES'] = (
+    int(os.environ['CALORIE_BUDDY_GENERATION_SAMPLES'])
+    if os.environ.get('CALORIE_BUDDY_GENERATION_SAMPLES') else None
+)
+# Look plans up in a per-pool pair-sum index before running the solvers above
+app.config['GENERATION_PAIR_INDEX'] = os.environ.get('CALORIE_BUDDY_GENERATION_PAIR_INDEX', '').lower() in ('1', 'true', 'yes')
+# Admission control: concurrent generations, requests allowed to wait, how long they wait
+app.config['GENERATION_MAX_CONCURRENT'] = int(os.environ.get('CALORIE_BUDDY_GENERATION_MAX_CONCURRENT', 4))
+app.config['GENERATION_MAX_QUEUE'] = int(os.environ.get('CALORIE_BUDDY_GENERATION_MAX_QUEUE', 16))
+app.config['GENERATION_QUEUE_TIMEOUT_MS'] = int(os.environ.get('CALORIE_BUDDY_GENERATION_QUEUE_TIMEOUT_MS', 1000))
+app.config['GENERATION_RETRY_AFTER_S'] = int(os.environ.get('CALORIE_BUDDY_GENERATION_RETRY_AFTER_S', 2))
+# Background generation of each user's next refresh (0 workers turns it off)
+app.config['PREFETCH_WORKERS'] = int(os.environ.get('CALORIE_BUDDY_PREFETCH_WORKERS', 1))
+app.config['PREFETCH_TTL_S'] = int(os.environ.get('CALORIE_BUDDY_PREFETCH_TTL_S', 300))
+app.config['PREFETCH_MAX_ENTRIES'] = int(os.environ.get('CALORIE_BUDDY_PREFETCH_MAX_ENTRIES', 1000))
 
 # Remove the custom JSON encoder approach and handle NumPy types directly in our code
 
-# Initialize database
-db = SQLAlchemy(app)
+# Initialize database (history statements are routed to a shard when history is sharded)
+db = SQLAlchemy(app, session_options={'class_': HistoryRoutingSession})
+HISTORY_SHARDED = app.config['HISTORY_SHARDS'] > 0
+
+# Send each logged-in user's history reads and writes to their shard
+init_history_routing(app)
+
+# Record SQL statement counts and time per request
+init_tracing(app)
+
+# Capture cProfile/tracemalloc data for requests that ask for it
+init_profiling(app)
 
 # Initialize login manager
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+# Prefix marking unsalted SHA-256 hashes migrated from the old user.json store
+LEGACY_HASH_PREFIX = 'legacy-sha256$'
+
 # User model
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -37,48 +101,543 @@ class User(db.Model, UserMixin):
     email = db.Column(db.String(120), nullable=False)
     password_hash = db.Column(db.String(128))
     created_at = db.Column(db.String(50), default=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-    meal_plans = db.relationship('MealPlan', backref='user', lazy=True)
+    exclusions = db.Column(db.String(255), default='')  # Comma-separated EXCLUSION_TAGS names
+    meal_plans = db.relationship('MealPlan', primaryjoin='User.id == foreign(MealPlan.user_id)', backref='user', lazy=True)
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
         
     def check_password(self, password):
+        if self.password_hash and self.password_hash.startswith(LEGACY_HASH_PREFIX):
+            legacy_hash = hashlib.sha256(password.encode('utf-8')).hexdigest()
+            return hmac.compare_digest(self.password_hash[len(LEGACY_HASH_PREFIX):], legacy_hash)
         return check_password_hash(self.password_hash, password)
+    
+    @property
+    def has_legacy_password(self):
+        return bool(self.password_hash) and self.password_hash.startswith(LEGACY_HASH_PREFIX)
+
+# PlanContent model storing each distinct plan once, keyed by its content hash
+class PlanContent(db.Model):
+    __bind_key__ = HISTORY_BIND if HISTORY_SHARDED else None
+    hash = db.Column(db.String(64), primary_key=True)  # SHA-256 of food_ids
+    food_ids = db.Column(db.LargeBinary, nullable=False)  # Packed food ids, see encode_food_ids
 
 # MealPlan model to store saved and history meal plans
 class MealPlan(db.Model):
+    __bind_key__ = HISTORY_BIND if HISTORY_SHARDED else None
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Users stay in the main database, so sharded history can't reference them
+    user_id = db.Column(db.Integer, nullable=False) if HISTORY_SHARDED else db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     date = db.Column(db.String(10), nullable=False, default=datetime.now().strftime("%Y-%m-%d"))
     target_calories = db.Column(db.Integer, nullable=False)
     diet_type = db.Column(db.String(20), nullable=False)
     actual_calories = db.Column(db.Integer, nullable=False)
-    foods = db.Column(db.Text, nullable=False)  # Stored as JSON string
+    content_hash = db.Column(db.String(64), db.ForeignKey('plan_content.hash'))
     is_saved = db.Column(db.Boolean, default=False)  # False = history, True = saved
+    content = db.relationship('PlanContent', lazy='joined')
+    
+    # "How many users saved this plan" is a single lookup on this index
+    __table_args__ = (db.Index('ix_meal_plan_content_saved', 'content_hash', 'is_saved'),)
+    
+    @property
+    def food_ids(self):
+        """Food ids of the plan, in plan order"""
+        return decode_food_ids(self.content.food_ids)
+
+# CustomFood model for foods a user adds on top of the shared catalog
+class CustomFood(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    subcategory = db.Column(db.String(80), nullable=False)
+    food = db.Column(db.String(120), nullable=False)
+    serving = db.Column(db.String(40), nullable=False, default='1 serving')
+    calories = db.Column(db.Integer, nullable=False)
+
+# Tables kept in the history shards when history is sharded
+HISTORY_TABLES = {'meal_plan', 'plan_content'}
+
+# Columns added after the first release, as (table, column, DDL type)
+ADDED_COLUMNS = [
+    ('meal_plan', 'content_hash', 'VARCHAR(64) REFERENCES plan_content (hash)'),
+    ('user', 'exclusions', "VARCHAR(255) DEFAULT ''"),
+    ('plan_content', 'food_ids', 'BLOB'),
+]
+
+# Version of the stored data, kept in SQLite's PRAGMA user_version and
+# bumped by one-time data migrations (see repair_legacy_meal_plans)
+DATA_VERSION = 1
+
+def upgrade_schema():
+    """Add columns and indexes introduced after a database was first created"""
+    inspector = inspect(db.engine)
+    for table, column, ddl in ADDED_COLUMNS:
+        if HISTORY_SHARDED and table in HISTORY_TABLES:
+            continue  # Shards are always created with the current schema
+        columns = {existing['name'] for existing in inspector.get_columns(table)}
+        if column not in columns:
+            with db.engine.begin() as connection:
+                connection.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+    
+    if not HISTORY_SHARDED:
+        for index in MealPlan.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
 
 # Create tables in the database
 with app.app_context():
-    db.create_all()
+    db.create_all(bind_key=None)
+    upgrade_schema()
+    for shard_engine in create_history_shards(db):
+        with shard_engine.begin() as connection:
+            # New shards start with the current data, so no migration applies to them
+            if connection.execute(text('PRAGMA user_version')).scalar() == 0:
+                connection.execute(text(f'PRAGMA user_version = {DATA_VERSION}'))
+
+def encode_food_ids(food_ids):
+    """Pack food ids as little-endian int32, 4 bytes per food"""
+    return np.asarray(food_ids, dtype='<i4').tobytes()
+
+def decode_food_ids(blob):
+    """Unpack food ids packed by encode_food_ids"""
+    return tuple(np.frombuffer(blob, dtype='<i4').tolist())
+
+def plan_content_key(food_ids):
+    """Return the (content hash, packed food ids) pair for a plan"""
+    packed = encode_food_ids(food_ids)
+    return hashlib.sha256(packed).hexdigest(), packed
+
+def store_plan_content(food_ids):
+    """
+    Store a plan's food ids once under the hash of its content.
+    
+    Identical plans (across users, history and saved copies) share one
+    PlanContent row; inserting a plan that already exists is a no-op.
+    
+    Args:
+        food_ids (list): Food ids in plan order (negative for custom foods)
+        
+    Returns:
+        str: Content hash to store on MealPlan.content_hash
+    """
+    content_hash, packed = plan_content_key(food_ids)
+    
+    db.session.execute(
+        sqlite_insert(PlanContent)
+        .values(hash=content_hash, food_ids=packed)
+        .on_conflict_do_nothing(index_elements=['hash'])
+    )
+    return content_hash
+
+def store_plan_contents(plans):
+    """
+    Batch version of store_plan_content: one multi-row insert for many plans.
+    
+    Args:
+        plans (list): Food id lists
+        
+    Returns:
+        list: Content hash for each plan, in order
+    """
+    keys = [plan_content_key(food_ids) for food_ids in plans]
+    unique = dict(keys)
+    if unique:
+        db.session.execute(
+            sqlite_insert(PlanContent).on_conflict_do_nothing(index_elements=['hash']),
+            [{'hash': content_hash, 'food_ids': packed} for content_hash, packed in unique.items()]
+        )
+    return [content_hash for content_hash, _ in keys]
+
+def bulk_insert_meal_plans(user_id, entries, batch_size=1000, saved_plans=None):
+    """
+    Insert meal plans for a user in batches of executemany inserts.
+    
+    Entries are consumed lazily, so any iterable (a file being parsed, a
+    generator) can be imported in constant memory. Food names are resolved
+    against the user's foods and the catalog; unknown names are dropped.
+    Nothing is committed; the caller commits (or rolls back) the whole import.
+    
+    Args:
+        user_id (int): Owner of the plans
+        entries (iterable): Dicts with date, diet_type, target_calories,
+                            actual_calories, is_saved and foods
+        batch_size (int): Rows per insert statement
+        saved_plans (list): Collects the food ids of the saved plans, for the
+                            caller to count into plan_cooccurrence once committed
+        
+    Returns:
+        int: Number of plans inserted
+    """
+    today = datetime.now().strftime("%Y-%m-%d")
+    view = overlay_cache.view(user_id)
+    inserted = 0
+    
+    for batch in chunked(entries, batch_size):
+        food_ids = [view.ids_for_names(entry.get('foods', [])) for entry in batch]
+        content_hashes = store_plan_contents(food_ids)
+        if saved_plans is not None:
+            saved_plans.extend(ids for entry, ids in zip(batch, food_ids) if entry.get('is_saved'))
+        db.session.execute(db.insert(MealPlan), [
+            {
+                'user_id': user_id,
+                'date': entry.get('date') or today,
+                'target_calories': entry.get('target_calories', 0),
+                'diet_type': entry.get('diet_type', ''),
+                'actual_calories': entry.get('actual_calories', 0),
+                'content_hash': content_hash,
+                'is_saved': bool(entry.get('is_saved', False))
+            }
+            for entry, content_hash in zip(batch, content_hashes)
+        ])
+        inserted += len(batch)
+    
+    return inserted
+
+def store_meal_plan(user_id, food_ids, diet_type, target_calories, actual_calories, date=None, is_saved=True):
+    """
+    Insert and commit one meal plan; saved plans are then counted into plan_cooccurrence.
+    
+    Every single-plan save (the planner route, user_auth.save_meal_plan) goes
+    through here so the co-occurrence model never misses one.
+    
+    Args:
+        user_id (int): Owner of the plan (its history shard must be selected)
+        food_ids (list): Food ids in plan order (negative for custom foods)
+        diet_type (str): Diet the plan was generated for
+        target_calories (int): Target calories of the plan
+        actual_calories (int): Total calories of the plan
+        date (str): YYYY-MM-DD, today if omitted
+        is_saved (bool): Saved plan (True) or history entry
+        
+    Returns:
+        MealPlan: The committed plan
+    """
+    plan = MealPlan(
+        user_id=user_id,
+        date=date or datetime.now().strftime("%Y-%m-%d"),
+        target_calories=target_calories,
+        diet_type=diet_type,
+        actual_calories=actual_calories,
+        content_hash=store_plan_content(food_ids),
+        is_saved=is_saved
+    )
+    db.session.add(plan)
+    db.session.commit()
+    if is_saved:
+        plan_cooccurrence.add_plan(food_ids)
+    return plan
+
+def iter_meal_plan_rows(user_id, batch_size=500):
+    """Yield a user's meal plans as export rows, fetching batch_size rows at a time"""
+    view = overlay_cache.view(user_id)
+    statement = (
+        db.select(
+            MealPlan.date, MealPlan.diet_type, MealPlan.target_calories, MealPlan.actual_calories,
+            MealPlan.is_saved, PlanContent.food_ids
+        )
+        .join(PlanContent, MealPlan.content_hash == PlanContent.hash)
+        .where(MealPlan.user_id == user_id)
+        .order_by(MealPlan.id)
+        .execution_options(yield_per=batch_size)
+    )
+    
+    for row in db.session.execute(statement):
+        yield {
+            'date': row.date,
+            'diet_type': row.diet_type,
+            'target_calories': row.target_calories,
+            'actual_calories': row.actual_calories,
+            'is_saved': bool(row.is_saved),
+            'foods': [item['food'] for item in view.describe(decode_food_ids(row.food_ids))]
+        }
+
+# Time every commit so write contention shows up in /metrics
+@event.listens_for(db.session, 'before_commit')
+def _start_commit_timer(session):
+    session.info['commit_started'] = time.perf_counter()
+
+@event.listens_for(db.session, 'after_commit')
+def _record_commit_time(session):
+    started = session.info.pop('commit_started', None)
+    if started is not None:
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
 
 # User loader function for Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
-# Load food data at startup
-food_data = load_and_process_data('calories.csv')
+# Load the compact food catalog at startup
+food_catalog = load_catalog('calories.csv')
+
+def _legacy_calories(value):
+    """Decode a calorie value the way legacy rows stored it (int, numeric string or little-endian bytes)"""
+    if isinstance(value, bytes):
+        return int.from_bytes(value, byteorder='little')
+    return int(value)
+
+def _legacy_foods(value):
+    """Decode a legacy JSON food list, unwrapping double-encoded JSON; [] if unreadable"""
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', errors='replace')
+    try:
+        foods = json.loads(value) if value else []
+        while isinstance(foods, str):
+            foods = json.loads(foods)
+    except ValueError:
+        return []
+    return [str(food) for food in foods] if isinstance(foods, list) else []
+
+def repair_legacy_meal_plans(batch_size=1000):
+    """
+    One-time migration of legacy MealPlan rows to packed food id contents.
+    
+    Decodes calories stored as bytes or strings, unwraps double-encoded
+    food JSON, re-stores every plan's foods as packed food ids (custom foods
+    by their negative id, unknown names dropped) and drops the old JSON
+    columns. Rows whose calories can't be recovered (not a number, or
+    outside 0-10000) are deleted. Runs in one transaction, once per database.
+    """
+    with db.engine.begin() as connection:
+        if connection.execute(text('PRAGMA user_version')).scalar() >= DATA_VERSION:
+            return
+        
+        schema = inspect(connection)
+        plan_columns = {column['name'] for column in schema.get_columns('meal_plan')}
+        content_columns = {column['name'] for column in schema.get_columns('plan_content')}
+        
+        legacy_contents = {}
+        if 'foods' in content_columns:
+            legacy_contents = {
+                row.hash: _legacy_foods(row.foods)
+                for row in connection.execute(text('SELECT hash, foods FROM plan_content'))
+            }
+            connection.execute(text('ALTER TABLE plan_content DROP COLUMN foods'))
+        
+        custom_ids = {}
+        for row in connection.execute(text('SELECT id, user_id, food FROM custom_food')):
+            custom_ids.setdefault(row.user_id, {})[row.food] = -row.id
+        
+        inline_foods = ', foods' if 'foods' in plan_columns else ", '' AS foods"
+        last_id = 0
+        migrated = removed = 0
+        while True:
+            rows = connection.execute(text(
+                f'SELECT id, user_id, target_calories, actual_calories, content_hash{inline_foods} '
+                'FROM meal_plan WHERE id > :last_id ORDER BY id LIMIT :batch_size'
+            ), {'last_id': last_id, 'batch_size': batch_size}).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            
+            contents, updates, corrupt = {}, [], []
+            for row in rows:
+                try:
+                    target = _legacy_calories(row.target_calories)
+                    actual = _legacy_calories(row.actual_calories)
+                except (TypeError, ValueError):
+                    target = actual = -1
+                if not (0 <= target <= MAX_PLAN_CALORIES and 0 <= actual <= MAX_PLAN_CALORIES):
+                    corrupt.append({'id': row.id})
+                    continue
+                
+                names = legacy_contents.get(row.content_hash)
+                if names is None:
+                    names = _legacy_foods(row.foods)
+                user_foods = custom_ids.get(row.user_id, {})
+                food_ids = [
+                    food_id for food_id in
+                    (user_foods.get(name, food_catalog.id_for_name(name)) for name in names)
+                    if food_id is not None
+                ]
+                
+                content_hash, packed = plan_content_key(food_ids)
+                contents[content_hash] = packed
+                updates.append({'id': row.id, 'target': target, 'actual': actual, 'content_hash': content_hash})
+            
+            if contents:
+                connection.execute(
+                    sqlite_insert(PlanContent.__table__).on_conflict_do_nothing(index_elements=['hash']),
+                    [{'hash': content_hash, 'food_ids': packed} for content_hash, packed in contents.items()]
+                )
+            if updates:
+                connection.execute(text(
+                    'UPDATE meal_plan SET target_calories = :target, actual_calories = :actual, '
+                    'content_hash = :content_hash WHERE id = :id'
+                ), updates)
+            if corrupt:
+                connection.execute(text('DELETE FROM meal_plan WHERE id = :id'), corrupt)
+            migrated += len(updates)
+            removed += len(corrupt)
+        
+        # Old name-keyed contents are no longer referenced
+        connection.execute(text('DELETE FROM plan_content WHERE food_ids IS NULL'))
+        if 'foods' in plan_columns:
+            connection.execute(text('ALTER TABLE meal_plan DROP COLUMN foods'))
+        connection.execute(text(f'PRAGMA user_version = {DATA_VERSION}'))
+    
+    if migrated or removed:
+        print(f"Migrated {migrated} meal plans to packed food ids ({removed} unrecoverable rows removed)")
+
+if not HISTORY_SHARDED:
+    with app.app_context():
+        repair_legacy_meal_plans()
+
+def load_plan_cooccurrence(batch_size=1000):
+    """Count every saved plan (in every shard) into a new co-occurrence model"""
+    model = CooccurrenceModel()
+    for _ in each_history_shard():
+        rows = (
+            db.session.query(PlanContent.food_ids)
+            .join(MealPlan, MealPlan.content_hash == PlanContent.hash)
+            .filter(MealPlan.is_saved.is_(True))
+            .yield_per(batch_size)
+        )
+        for packed, in rows:
+            model.add_plan(decode_food_ids(packed))
+    return model
+
+# Foods users save together bias generation; loaded once, then kept current
+# by user_auth.save_meal_plan, history imports and delete_meal_plan
+with app.app_context():
+    plan_cooccurrence = load_plan_cooccurrence()
+
+# Typeahead index over food names and aliases
+food_search_index = FoodSearchIndex(food_catalog)
+
+def load_custom_foods(user_id):
+    """Load a user's custom foods as plain dicts for the overlay cache"""
+    return [
+        {
+            'id': food.id,
+            'food': food.food,
+            'serving': food.serving,
+            'calories': food.calories,
+            'subcategory': food.subcategory
+        }
+        for food in CustomFood.query.filter_by(user_id=user_id).all()
+    ]
+
+# Per-diet pools are filtered from the catalog once and shared by all users;
+# users with custom foods get a cached overlay on top of them
+base_diet_pools = build_diet_pools(food_catalog)
+if app.config['GENERATION_PAIR_INDEX']:
+    build_pair_indexes(base_diet_pools)
+overlay_cache = OverlayCache(load_custom_foods, food_catalog, base_diet_pools)
+
+def user_catalog_view(user):
+    """Catalog view for a user: shared catalog + their custom foods, minus their exclusions"""
+    view = overlay_cache.view(user.id)
+    mask = exclusion_mask(parse_exclusions(user.exclusions))
+    if not mask:
+        return view
+    return CatalogView(food_catalog, exclude_from_pools(view.diet_pools, mask), view.records)
+
+# Bursts of generation requests are queued up to a bound and shed beyond it;
+# shed /meal_planner requests get recently generated plans when there are some
+generation_admission = AdmissionController(
+    app.config['GENERATION_MAX_CONCURRENT'],
+    app.config['GENERATION_MAX_QUEUE'],
+    app.config['GENERATION_QUEUE_TIMEOUT_MS'] / 1000
+)
+pooled_plans = PlanPool()
+
+# While a user reads their plans, the next refresh for the same target is
+# generated in the background (only when a generation slot is free)
+plan_prefetcher = PlanPrefetcher(
+    workers=app.config['PREFETCH_WORKERS'],
+    ttl_seconds=app.config['PREFETCH_TTL_S'],
+    max_entries=app.config['PREFETCH_MAX_ENTRIES']
+) if app.config['PREFETCH_WORKERS'] > 0 else None
+
+def prefetch_meal_plans(diet_pools, target_calories, min_calories, max_calories):
+    """Background job: generate a plan set, or None if generation is busy"""
+    with generation_admission.slot(wait=False) as admitted:
+        if not admitted:
+            return None
+        return generate_meal_plans(
+            food_catalog,
+            target_calories=target_calories,
+            min_calories=min_calories,
+            max_calories=max_calories,
+            diet_pools=diet_pools,
+            deadline_ms=app.config['GENERATION_DEADLINE_MS'],
+            samples=app.config['GENERATION_SAMPLES'],
+            pair_index=app.config['GENERATION_PAIR_INDEX'],
+            cooccurrence=plan_cooccurrence
+        )
+
+def overloaded(response):
+    """Mark a response as shed load: 503 with a Retry-After hint"""
+    response = make_response(response, 503)
+    response.headers['Retry-After'] = str(app.config['GENERATION_RETRY_AFTER_S'])
+    return response
 
 # Context processor to inject date into all templates
 @app.context_processor
 def inject_now():
     return {'now': datetime.now()}
 
+# Registered diets (display order and colours) for every template
+@app.context_processor
+def inject_diets():
+    return {'diets': DIETS}
+
+# Per-route latency for /metrics
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=route,
+            status=response.status_code
+        )
+    return response
+
+def format_meal_plan(items):
+    """Convert a generated meal plan to template/session friendly Python types"""
+    if not items:
+        return {'foods': [], 'total_calories': 0}
+    
+    # Convert NumPy types to Python native types
+    formatted_items = []
+    for item in items:
+        formatted_items.append({
+            'food': item['food'],
+            'serving': item['serving'],
+            'calories': int(item['calories']),  # Convert np.int64 to regular int
+            'subcategory': item['subcategory']
+        })
+    
+    return {
+        'foods': formatted_items,
+        'total_calories': int(sum(item['calories'] for item in items))  # Convert sum to regular int
+    }
+
 # Routes
+@app.route('/metrics')
+def metrics():
+    """Expose generation, route and DB metrics in Prometheus text format"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def home():
     """Home page route"""
     return render_template('index.html')
 
+@app.route('/api/foods/search')
+def search_foods():
+    """Typeahead search over the food catalog"""
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    return jsonify({'query': query, 'results': food_search_index.search(query, limit=limit)})
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     """Login route"""
@@ -88,6 +647,11 @@ def login():
         user = User.query.filter_by(username=username).first()
         
         if user and user.check_password(password):
+            # Re-hash passwords migrated from user.json on first login
+            if user.has_legacy_password:
+                user.set_password(password)
+                db.session.commit()
+            
             login_user(user)
             flash('Logged in successfully!', 'success')
             return redirect(url_for('home'))
@@ -139,42 +703,50 @@ def meal_planner():
         min_calories = int(target_calories * 0.95)  # 5% below target
         max_calories = int(target_calories * 1.05)  # 5% above target
         
-        # Generate meal plans
-        meal_plans = generate_meal_plans(
-            food_data, 
-            target_calories=target_calories, 
-            min_calories=min_calories, 
-            max_calories=max_calories
-        )
+        # Serve the set prefetched after the last refresh, or generate meal plans (as food ids) once admitted
+        view = user_catalog_view(current_user)
+        prefetch_key = (current_user.id, target_calories, current_user.exclusions or '')
+        meal_plans = plan_prefetcher.take(prefetch_key) if plan_prefetcher is not None else None
+        admitted = meal_plans is not None
+        if not admitted:
+            with generation_admission.slot() as admitted:
+                if admitted:
+                    meal_plans = generate_meal_plans(
+                        food_catalog, 
+                        target_calories=target_calories, 
+                        min_calories=min_calories, 
+                        max_calories=max_calories,
+                        diet_pools=view.diet_pools,
+                        deadline_ms=app.config['GENERATION_DEADLINE_MS'],
+                        samples=app.config['GENERATION_SAMPLES'],
+                        pair_index=app.config['GENERATION_PAIR_INDEX'],
+                        cooccurrence=plan_cooccurrence
+                    )
+        
+        if admitted:
+            # Catalog-only plans can be served to others with the same exclusions when overloaded
+            if all(food_id >= 0 for food_ids in meal_plans.values() for food_id in food_ids):
+                pooled_plans.add(target_calories, current_user.exclusions, meal_plans)
+        else:
+            meal_plans = pooled_plans.get(target_calories, current_user.exclusions)
+            if meal_plans is None:
+                ADMISSION_SHED.inc(route='/meal_planner', action='rejected')
+                flash('The meal planner is busy right now, please try again in a few seconds', 'danger')
+                return overloaded(render_template('meal_planner.html', meal_plans=None, target_calories=target_calories))
+            
+            ADMISSION_SHED.inc(route='/meal_planner', action='pooled')
+            flash('The meal planner is busy, so these are recently generated plans for your target', 'danger')
         
         # Convert to a format easier to use in templates with explicit type conversion
         formatted_plans = {}
-        for diet_type, items in meal_plans.items():
-            if not items:
-                formatted_plans[diet_type] = {
-                    'foods': [],
-                    'total_calories': 0
-                }
-                continue
-            
-            # Convert NumPy types to Python native types
-            formatted_items = []
-            for item in items:
-                formatted_item = {
-                    'food': item['food'],
-                    'serving': item['serving'],
-                    'calories': int(item['calories']),  # Convert np.int64 to regular int
-                    'subcategory': item['subcategory']
-                }
-                formatted_items.append(formatted_item)
-                
-            formatted_plans[diet_type] = {
-                'foods': formatted_items,
-                'total_calories': int(sum(item['calories'] for item in items))  # Convert sum to regular int
-            }
+        for diet_type, food_ids in meal_plans.items():
+            items = view.describe(food_ids)
+            formatted_plans[diet_type] = format_meal_plan(items)
+            if not items or not admitted:
+                continue  # Pooled plans were already recorded for whoever generated them
             
             # Store in user's meal history
-            foods_json = json.dumps([item['food'] for item in items])
+            content_hash = store_plan_content(food_ids)
             total_calories = formatted_plans[diet_type]['total_calories']
             
             meal_plan = MealPlan(
@@ -183,7 +755,7 @@ def meal_planner():
                 target_calories=target_calories,
                 diet_type=diet_type,
                 actual_calories=total_calories,
-                foods=foods_json,
+                content_hash=content_hash,
                 is_saved=False
             )
             
@@ -197,12 +769,20 @@ def meal_planner():
         for diet_type, plan_data in formatted_plans.items():
             session_plans[diet_type] = {
                 'foods': plan_data['foods'],
-                'total_calories': plan_data['total_calories']
+                'total_calories': plan_data['total_calories'],
+                'food_ids': [int(food_id) for food_id in meal_plans[diet_type]]  # For single-item swaps
             }
             
         session['meal_plans'] = session_plans
         session['target_calories'] = int(target_calories)
         
+        # Get the next refresh ready while these plans are being read
+        if admitted and plan_prefetcher is not None:
+            plan_prefetcher.schedule(
+                prefetch_key,
+                partial(prefetch_meal_plans, view.diet_pools, target_calories, min_calories, max_calories)
+            )
+        
         return render_template('meal_planner.html', meal_plans=formatted_plans, target_calories=target_calories)
     
     # Check if there are meal plans in session
@@ -211,6 +791,97 @@ def meal_planner():
     
     return render_template('meal_planner.html', meal_plans=meal_plans, target_calories=target_calories)
 
+# Swapped-out foods remembered per plan (the list lives in the cookie session)
+SWAPPED_OUT_LIMIT = 20
+
+@app.route('/meal_planner/swap', methods=['POST'])
+@login_required
+def swap_meal_item():
+    """Replace one food of a plan on the meal planner, keeping its total near the target"""
+    diet_type = request.form.get('diet_type')
+    meal_plans = session.get('meal_plans') or {}
+    plan = meal_plans.get(diet_type)
+    view = user_catalog_view(current_user)
+    if not plan or not plan.get('food_ids') or diet_type not in view.diet_pools:
+        flash('Generate new meal plans to swap items', 'danger')
+        return redirect(url_for('meal_planner'))
+    
+    try:
+        slot = int(request.form.get('position', ''))
+    except ValueError:
+        flash('Could not tell which item to swap', 'danger')
+        return redirect(url_for('meal_planner'))
+    
+    # Foods swapped out recently aren't offered again for this plan
+    swapped_out = plan.get('swapped_out', [])
+    core_foods, side_foods, meat_ratio = view.diet_pools[diet_type]
+    swapped = swap_plan_item(
+        core_foods,
+        side_foods,
+        meat_ratio,
+        tuple(plan['food_ids']),
+        slot,
+        session.get('target_calories', 2000),
+        avoid=swapped_out
+    )
+    if swapped is None:
+        flash(f'No other food keeps the {diet_type} plan near your target', 'danger')
+        return redirect(url_for('meal_planner'))
+    
+    food_ids, _ = swapped
+    formatted = format_meal_plan(view.describe(food_ids))
+    meal_plans[diet_type] = {
+        'foods': formatted['foods'],
+        'total_calories': formatted['total_calories'],
+        'food_ids': list(food_ids),
+        'swapped_out': (swapped_out + [plan['food_ids'][slot]])[-SWAPPED_OUT_LIMIT:]
+    }
+    session['meal_plans'] = meal_plans
+    
+    flash(f"Swapped {plan['foods'][slot]['food']} for {formatted['foods'][slot]['food']}", 'success')
+    return redirect(url_for('meal_planner'))
+
+@app.route('/weekly_planner', methods=['POST'])
+@login_required
+def weekly_planner():
+    """Generate a full week of meal plans without repeated foods"""
+    target_calories = int(request.form.get('target_calories', 2000))
+    diet_type = request.form.get('diet_type')
+    min_calories = int(target_calories * 0.95)  # 5% below target
+    max_calories = int(target_calories * 1.05)  # 5% above target
+    
+    view = user_catalog_view(current_user)
+    if diet_type and diet_type not in view.diet_pools:
+        return jsonify({'error': f'Unknown diet type: {diet_type}'}), 400
+    
+    with generation_admission.slot() as admitted:
+        if admitted:
+            week = generate_weekly_meal_plans(
+                food_catalog,
+                target_calories=target_calories,
+                min_calories=min_calories,
+                max_calories=max_calories,
+                diet_types=[diet_type] if diet_type else None,
+                diet_pools=view.diet_pools
+            )
+    
+    if not admitted:
+        ADMISSION_SHED.inc(route='/weekly_planner', action='rejected')
+        return overloaded(jsonify({'error': 'The meal planner is busy, please try again shortly'}))
+    
+    days = []
+    for day_plan in week['days']:
+        days.append({
+            'day': day_plan['day'],
+            'plans': {diet: format_meal_plan(view.describe(food_ids)) for diet, food_ids in day_plan['plans'].items()}
+        })
+    
+    return jsonify({
+        'target_calories': target_calories,
+        'days': days,
+        'weekly_totals': week['weekly_totals']
+    })
+
 @app.route('/save_meal_plan', methods=['POST'])
 @login_required
 def save_meal_plan():
@@ -218,402 +889,317 @@ def save_meal_plan():
     diet_type = request.form.get('diet_type')
     target_calories = int(request.form.get('target_calories'))
     actual_calories = int(request.form.get('actual_calories'))
-    foods_json = request.form.get('foods')
     
-    # Create saved meal plan
-    saved_plan = MealPlan(
-        user_id=current_user.id,
-        date=datetime.now().strftime("%Y-%m-%d"),
-        target_calories=target_calories,
-        diet_type=diet_type,
-        actual_calories=actual_calories,
-        foods=foods_json,
-        is_saved=True
-    )
+    # The plan on the page is the one in the session; its food ids are saved as-is
+    plan = (session.get('meal_plans') or {}).get(diet_type)
+    if not plan or not plan.get('food_ids'):
+        flash('Generate new meal plans to save one', 'danger')
+        return redirect(url_for('meal_planner'))
     
-    db.session.add(saved_plan)
-    db.session.commit()
+    store_meal_plan(current_user.id, [int(food_id) for food_id in plan['food_ids']], diet_type,
+                    target_calories, actual_calories)
     
     flash(f'Saved {diet_type} meal plan successfully!', 'success')
     return redirect(url_for('meal_planner'))
 
-@app.route('/analytics')
-@login_required
-def analytics():
-    """Analytics route"""
-    # Get ALL user's meal plans (both history and saved) to have more data for analytics
-    meal_history = MealPlan.query.filter_by(user_id=current_user.id).order_by(MealPlan.date.desc()).all()
-    
-    if not meal_history:
-        return render_template('analytics.html', has_data=False)
+def collect_chart_data(user_id):
+    """Clean per-plan calorie rows for a user's analytics (history and saved plans)"""
+    # Only the columns the charts use; skips joining plan contents
+    meal_history = db.session.query(
+        MealPlan.date, MealPlan.diet_type, MealPlan.target_calories, MealPlan.actual_calories
+    ).filter(MealPlan.user_id == user_id).order_by(MealPlan.date.desc()).all()
     
-    # Process meal history for charts
     chart_data = []
     for entry in meal_history:
-        # Safely convert values to integers, handling different data types
-        try:
-            # Handle binary representation of calories
-            if isinstance(entry.target_calories, bytes):
-                target = int.from_bytes(entry.target_calories, byteorder='little')
-            else:
-                target = int(entry.target_calories)
-                
-            if isinstance(entry.actual_calories, bytes):
-                actual = int.from_bytes(entry.actual_calories, byteorder='little')
-            else:
-                actual = int(entry.actual_calories)
+        difference = entry.actual_calories - entry.target_calories
+        if entry.target_calories > 0:
+            accuracy_pct = abs(difference) / entry.target_calories * 100
+            accuracy = min(100, max(0, 100 - accuracy_pct))
+        else:
+            accuracy = 0
             
-            # Sanity check for unreasonable values (data corruption)
-            if target < 0 or target > 10000 or actual < 0 or actual > 10000:
-                print(f"Skipping entry with unreasonable calorie values: Target={target}, Actual={actual}")
-                continue
-                
-            difference = actual - target
-            if target > 0:
-                accuracy_pct = abs(difference) / target * 100
-                accuracy = min(100, max(0, 100 - accuracy_pct))
-            else:
-                accuracy = 0
-                
-            chart_data.append({
-                'Date': entry.date,
-                'Diet Type': entry.diet_type,
-                'Target': target,
-                'Actual': actual,
-                'Difference': difference,
-                'Accuracy': accuracy
-            })
-        except Exception as e:
-            print(f"Error processing meal plan data: {e}")
-            print(f"Problematic entry: {entry.id}, Type: {entry.diet_type}, Target: {type(entry.target_calories)}, Actual: {type(entry.actual_calories)}")
+        chart_data.append({
+            'Date': entry.date,
+            'Diet Type': entry.diet_type,
+            'Target': entry.target_calories,
+            'Actual': entry.actual_calories,
+            'Difference': difference,
+            'Accuracy': accuracy
+        })
     
-    # If we don't have enough data after processing, show the no data message
-    if len(chart_data) < 1:
-        return render_template('analytics.html', has_data=False)
-        
-    df = pd.DataFrame(chart_data)
-    
-    # Create chart 1: Calories by Diet Type - with manual aggregation
-    # Group by diet type and calculate mean of actual calories manually
-    diet_type_calories = {}
+    return chart_data
+
+def summarize_chart_data(chart_data):
+    """
+    Aggregate analytics rows into the per-diet series the charts and summary use
     
-    # Collect calorie values by diet type
-    for item in chart_data:
-        diet_type = item['Diet Type']
-        calories = item['Actual']
+    Args:
+        chart_data (list): Output of collect_chart_data
         
-        if diet_type not in diet_type_calories:
-            diet_type_calories[diet_type] = []
+    Returns:
+        dict: Diet types (sorted) with parallel average actual/target/accuracy
+              lists, plan counts, per-diet stats and the most popular diet
+    """
+    by_diet = {}
+    for item in chart_data:
+        values = by_diet.setdefault(item['Diet Type'], {'Target': [], 'Actual': [], 'Accuracy': []})
+        values['Target'].append(item['Target'])
+        values['Actual'].append(item['Actual'])
+        values['Accuracy'].append(item['Accuracy'])
+    
+    series = {
+        'diet_types': [],
+        'avg_actual': [],
+        'avg_target': [],
+        'avg_accuracy': [],
+        'counts': []
+    }
+    stats = []
+    for diet_type, values in sorted(by_diet.items()):
+        count = len(values['Actual'])
+        series['diet_types'].append(diet_type)
+        series['avg_actual'].append(int(sum(values['Actual']) / count))
+        series['avg_target'].append(int(sum(values['Target']) / count))
+        series['avg_accuracy'].append(int(sum(values['Accuracy']) / count))
+        series['counts'].append(count)
         
-        diet_type_calories[diet_type].append(calories)
-    
-    # Calculate average calories for each diet type
-    avg_calories_data = []
-    for diet_type, calories_list in diet_type_calories.items():
-        if calories_list:  # Check if we have data for this diet type
-            avg_calories = sum(calories_list) / len(calories_list)
-            avg_calories_data.append({
-                'Diet Type': diet_type, 
-                'Average Calories': int(avg_calories)
-            })
-    
-    # Sort by diet type for consistent ordering
-    avg_calories_data = sorted(avg_calories_data, key=lambda x: x['Diet Type'])
-    
-    # Create the figure using plain lists instead of DataFrame
-    diet_types = [item['Diet Type'] for item in avg_calories_data]
-    avg_calories = [item['Average Calories'] for item in avg_calories_data]
-    
-    # Create a simple bar chart using plotly graph objects directly
-    fig1 = go.Figure()
-    
-    # Add bars with colors
-    colors = px.colors.qualitative.Plotly  # Standard color sequence
-    
-    for i, (diet, calories) in enumerate(zip(diet_types, avg_calories)):
-        color = colors[i % len(colors)]
-        fig1.add_trace(go.Bar(
-            x=[diet],
-            y=[calories],
-            name=diet,
-            marker_color=color,
-            text=[calories],
-            textposition='outside'
-        ))
-    
-    # Update layout
-    fig1.update_layout(
-        title='Average Calories by Diet Type',
-        xaxis_title='Diet Type',
-        yaxis_title='Average Calories',
-        height=400,
-        showlegend=True
-    )
+        stats.append({
+            'Diet Type': diet_type,
+            'Average': int(round(sum(values['Actual']) / count)),
+            'Minimum': int(min(values['Actual'])),
+            'Maximum': int(max(values['Actual']))
+        })
     
-    # Create chart 2: Target vs Actual - using direct plotting approach
-    # First gather and calculate the data manually
-    target_actual_data = {}
+    # Most popular diet type (first seen wins ties, as in the history order)
+    most_popular = {'Diet Type': 'None', 'Count': 0, 'Percentage': 0}
+    total_count = len(chart_data)
+    for diet_type in dict.fromkeys(item['Diet Type'] for item in chart_data):
+        count = len(by_diet[diet_type]['Actual'])
+        if count > most_popular['Count']:
+            most_popular = {
+                'Diet Type': diet_type,
+                'Count': count,
+                'Percentage': round(count / total_count * 100, 1)
+            }
     
-    for item in chart_data:
-        diet_type = item['Diet Type']
-        if diet_type not in target_actual_data:
-            target_actual_data[diet_type] = {'Target': [], 'Actual': [], 'Accuracy': []}
-            
-        target_actual_data[diet_type]['Target'].append(item['Target'])
-        target_actual_data[diet_type]['Actual'].append(item['Actual'])
-        target_actual_data[diet_type]['Accuracy'].append(item['Accuracy'])
-    
-    # Calculate averages
-    diet_types = []
-    avg_targets = []
-    avg_actuals = []
-    avg_accuracies = []
-    
-    for diet_type, values in sorted(target_actual_data.items()):
-        if values['Target'] and values['Actual']:  # Only process if we have data
-            diet_types.append(diet_type)
-            avg_targets.append(int(sum(values['Target']) / len(values['Target'])))
-            avg_actuals.append(int(sum(values['Actual']) / len(values['Actual'])))
-            avg_accuracies.append(int(sum(values['Accuracy']) / len(values['Accuracy'])))
-    
-    # Create the subplot figure
-    fig2 = make_subplots(
-        rows=1, cols=2, 
-        subplot_titles=('Target vs Actual Calories', 'Accuracy by Diet Type'),
-        specs=[[{'type': 'bar'}, {'type': 'bar'}]]
-    )
+    return {'series': series, 'stats': stats, 'most_popular': most_popular}
+
+@app.route('/analytics')
+@login_required
+def analytics():
+    """Analytics route (charts are drawn client-side from /api/analytics/series)"""
+    # Get ALL user's meal plans (both history and saved) to have more data for analytics
+    chart_data = collect_chart_data(current_user.id)
     
-    # Add target vs actual bars with text labels
-    fig2.add_trace(
-        go.Bar(
-            name='Target', 
-            x=diet_types, 
-            y=avg_targets, 
-            marker_color='red',
-            text=avg_targets,
-            textposition='outside'
-        ),
-        row=1, col=1
-    )
+    # If we don't have enough data after processing, show the no data message
+    if len(chart_data) < 1:
+        return render_template('analytics.html', has_data=False)
+    
+    summary = summarize_chart_data(chart_data)
     
-    fig2.add_trace(
-        go.Bar(
-            name='Actual', 
-            x=diet_types, 
-            y=avg_actuals, 
-            marker_color='blue',
-            text=avg_actuals,
-            textposition='outside'
-        ),
-        row=1, col=1
+    return render_template(
+        'analytics.html', 
+        has_data=True,
+        stats=summary['stats'],
+        most_popular=summary['most_popular']
     )
+
+@app.route('/api/analytics/series')
+@login_required
+def analytics_series():
+    """Aggregated per-diet series for the analytics charts"""
+    summary = summarize_chart_data(collect_chart_data(current_user.id))
+    return jsonify(summary['series'])
+
+def collect_history_summary():
+    """
+    Per-diet totals over every user's meal plans, across all history shards
+
+    Returns:
+        list: One dict per diet type (sorted) with plan, saved plan and user
+              counts, average target/actual calories and the actual range
+    """
+    totals = {}
+    for _ in each_history_shard():
+        rows = db.session.query(
+            MealPlan.diet_type,
+            db.func.count(),
+            db.func.sum(db.cast(MealPlan.is_saved, db.Integer)),
+            db.func.count(db.distinct(MealPlan.user_id)),
+            db.func.sum(MealPlan.target_calories),
+            db.func.sum(MealPlan.actual_calories),
+            db.func.min(MealPlan.actual_calories),
+            db.func.max(MealPlan.actual_calories)
+        ).group_by(MealPlan.diet_type).all()
+
+        # Users never span shards, so every column but min/max simply adds up
+        for diet_type, plans, saved, users, target, actual, lowest, highest in rows:
+            total = totals.setdefault(diet_type, [0, 0, 0, 0, 0, lowest, highest])
+            for column, value in enumerate((plans, saved or 0, users, target or 0, actual or 0)):
+                total[column] += value
+            total[5] = min(total[5], lowest)
+            total[6] = max(total[6], highest)
+
+    return [
+        {
+            'diet_type': diet_type,
+            'plans': plans,
+            'saved_plans': saved,
+            'users': users,
+            'avg_target': int(round(target / plans)),
+            'avg_actual': int(round(actual / plans)),
+            'min_actual': lowest,
+            'max_actual': highest
+        }
+        for diet_type, (plans, saved, users, target, actual, lowest, highest) in sorted(totals.items())
+    ]
+
+@app.route('/api/admin/history_summary')
+def admin_history_summary():
+    """Admin-wide meal plan statistics (requires the admin token header)"""
+    token = app.config['ADMIN_TOKEN']
+    supplied = request.headers.get('X-Admin-Token')
+    if not token or not supplied or not hmac.compare_digest(supplied, token):
+        abort(404)
+
+    return jsonify({'shards': max(1, app.config['HISTORY_SHARDS']), 'diets': collect_history_summary()})
+
+@app.route('/export/history.<fmt>')
+@login_required
+def export_history(fmt):
+    """Stream the user's full meal plan history as CSV or NDJSON"""
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
     
-    # Add accuracy bars with text labels
-    fig2.add_trace(
-        go.Bar(
-            name='Accuracy (%)', 
-            x=diet_types, 
-            y=avg_accuracies, 
-            marker_color='green',
-            text=[f"{acc}%" for acc in avg_accuracies],
-            textposition='outside'
-        ),
-        row=1, col=2
+    mimetype, encode = EXPORT_FORMATS[fmt]
+    rows = iter_meal_plan_rows(current_user.id)
+    return Response(
+        stream_with_context(encode(rows)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=calorie_buddy_history.{fmt}'}
     )
+
+@app.route('/import/history', methods=['POST'])
+@login_required
+def import_history():
+    """Bulk-load meal plans from a CSV or NDJSON file in the export format"""
+    upload = request.files.get('history_file')
+    fmt = os.path.splitext(upload.filename)[1].lstrip('.').lower() if upload and upload.filename else ''
+    if fmt == 'jsonl':
+        fmt = 'ndjson'
+    if fmt not in EXPORT_FORMATS:
+        flash('Please choose a .csv or .ndjson history file', 'danger')
+        return redirect(url_for('profile'))
     
-    # Add a horizontal line at 90% accuracy
-    if diet_types:  # Only add line if we have data points
-        fig2.add_shape(
-            type='line',
-            x0=-0.5,
-            x1=len(diet_types)-0.5,
-            y0=90,
-            y1=90,
-            line=dict(color='red', width=2, dash='dash'),
-            row=1, col=2
-        )
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+    saved_plans = []
+    try:
+        imported = bulk_insert_meal_plans(current_user.id, read_entries(stream, fmt), saved_plans=saved_plans)
+    except ValueError as error:
+        db.session.rollback()
+        flash(f'Import failed, nothing was saved. {error}', 'danger')
+        return redirect(url_for('profile'))
     
-    # Update layout
-    fig2.update_layout(
-        height=400, 
-        showlegend=True,
-        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-    )
+    db.session.commit()
+    for food_ids in saved_plans:
+        plan_cooccurrence.add_plan(food_ids)
+    flash(f'Imported {imported} meal plans', 'success')
+    return redirect(url_for('profile'))
+
+@app.route('/profile')
+@login_required
+def profile():
+    """Profile page route"""
+    # Get user's saved meal plans
+    saved_plans = MealPlan.query.filter_by(user_id=current_user.id, is_saved=True).order_by(MealPlan.date.desc()).all()
     
-    # Adjust y-axis range to make room for labels
-    fig2.update_yaxes(range=[0, max(avg_targets + avg_actuals) * 1.15], row=1, col=1)
-    fig2.update_yaxes(range=[0, 110], row=1, col=2)
+    # Format saved plans for display
+    view = overlay_cache.view(current_user.id)
+    formatted_saved_plans = [
+        {
+            'id': plan.id,
+            'date': plan.date,
+            'diet_type': plan.diet_type,
+            'target_calories': plan.target_calories,
+            'actual_calories': plan.actual_calories,
+            'foods': [item['food'] for item in view.describe(plan.food_ids)]
+        }
+        for plan in saved_plans
+    ]
     
-    # Create chart 3: Diet Type Distribution
-    # Count occurrences of each diet type manually
-    diet_type_counts = {}
-    for item in chart_data:
-        diet_type = item['Diet Type']
-        if diet_type not in diet_type_counts:
-            diet_type_counts[diet_type] = 0
-        diet_type_counts[diet_type] += 1
-    
-    # Calculate percentages
-    total_count = sum(diet_type_counts.values())
-    labels = []
-    values = []
-    percentages = []
-    
-    for diet_type, count in sorted(diet_type_counts.items()):
-        percentage = (count / total_count * 100) if total_count > 0 else 0
-        labels.append(diet_type)
-        values.append(count)
-        percentages.append(round(percentage, 1))
-    
-    # Create pie chart using direct Plotly method
-    fig3 = go.Figure(data=[go.Pie(
-        labels=labels,
-        values=values,
-        hole=0.3,  # Creates a donut chart for better appearance
-        textinfo='label+percent',
-        hoverinfo='label+value+percent',
-        textposition='outside',
-        pull=[0.05] * len(labels),  # Slightly pull all slices for better visualization
-        marker=dict(
-            colors=px.colors.qualitative.Plotly[:len(labels)],
-            line=dict(color='white', width=2)
-        )
-    )])
+    custom_foods = CustomFood.query.filter_by(user_id=current_user.id).order_by(CustomFood.food).all()
+    subcategories = sorted(food_catalog.subcategory_names)
     
-    fig3.update_layout(
-        title='Diet Type Distribution',
-        height=400,
-        showlegend=True,
-        legend=dict(orientation="h", yanchor="top", y=-0.1, xanchor="center", x=0.5)
+    return render_template(
+        'profile.html',
+        saved_plans=formatted_saved_plans,
+        custom_foods=custom_foods,
+        subcategories=subcategories,
+        exclusion_tags=EXCLUSION_TAGS,
+        user_exclusions=parse_exclusions(current_user.exclusions)
     )
+
+@app.route('/exclusions', methods=['POST'])
+@login_required
+def update_exclusions():
+    """Save the foods/allergens a user never wants in generated plans"""
+    tags = [tag for tag in request.form.getlist('exclusions') if tag in EXCLUSION_TAGS]
+    current_user.exclusions = ','.join(tags)
+    db.session.commit()
     
-    # Convert figures to JSON for the template
-    chart1_json = pio.to_json(fig1)
-    chart2_json = pio.to_json(fig2)
-    chart3_json = pio.to_json(fig3)
+    flash('Food exclusions updated', 'success')
+    return redirect(url_for('profile'))
+
+@app.route('/custom_foods', methods=['POST'])
+@login_required
+def add_custom_food():
+    """Add a food to the user's personal catalog overlay"""
+    food = request.form.get('food', '').strip()
+    subcategory = request.form.get('subcategory', '').strip()
+    serving = request.form.get('serving', '').strip() or '1 serving'
     
-    # Get summary statistics manually without relying on pandas aggregation
-    stats_data = {}
-    for item in chart_data:
-        diet_type = item['Diet Type']
-        actual = item['Actual']
-        
-        if diet_type not in stats_data:
-            stats_data[diet_type] = {'values': []}
-        
-        stats_data[diet_type]['values'].append(actual)
+    try:
+        calories = int(request.form.get('calories', ''))
+    except ValueError:
+        calories = -1
     
-    stats = []
-    for diet_type, data in sorted(stats_data.items()):
-        values = data['values']
-        if values:
-            avg = int(round(sum(values) / len(values)))
-            min_val = int(min(values))
-            max_val = int(max(values))
-            
-            stats.append({
-                'Diet Type': diet_type,
-                'Average': avg,
-                'Minimum': min_val,
-                'Maximum': max_val
-            })
-    
-    # Get most popular diet type
-    most_popular_diet = None
-    max_count = 0
-    diet_counts = {}
+    if not food or not subcategory or calories < 0 or calories > 5000:
+        flash('Please enter a food name, subcategory and calories between 0 and 5000', 'danger')
+        return redirect(url_for('profile'))
     
-    # Count diet type occurrences
-    for item in chart_data:
-        diet_type = item['Diet Type']
-        if diet_type not in diet_counts:
-            diet_counts[diet_type] = 0
-        diet_counts[diet_type] += 1
-    
-    # Find the most popular one
-    for diet_type, count in diet_counts.items():
-        if count > max_count:
-            max_count = count
-            most_popular_diet = diet_type
-    
-    # Calculate total and percentage
-    total_count = sum(diet_counts.values())
-    
-    if most_popular_diet and total_count > 0:
-        percentage = (diet_counts[most_popular_diet] / total_count) * 100
-        most_popular = {
-            'Diet Type': most_popular_diet,
-            'Count': diet_counts[most_popular_diet],
-            'Percentage': round(percentage, 1)
-        }
-    else:
-        most_popular = {'Diet Type': 'None', 'Count': 0, 'Percentage': 0}
+    db.session.add(CustomFood(
+        user_id=current_user.id,
+        subcategory=subcategory,
+        food=food,
+        serving=serving,
+        calories=calories
+    ))
+    db.session.commit()
+    overlay_cache.invalidate(current_user.id)
+    if plan_prefetcher is not None:
+        plan_prefetcher.invalidate(current_user.id)
     
-    return render_template(
-        'analytics.html', 
-        has_data=True,
-        chart1_json=chart1_json,
-        chart2_json=chart2_json,
-        chart3_json=chart3_json,
-        stats=stats,
-        most_popular=most_popular
-    )
+    flash(f'Added {food} to your foods', 'success')
+    return redirect(url_for('profile'))
 
-@app.route('/profile')
+@app.route('/custom_foods/<int:food_id>/delete', methods=['POST'])
 @login_required
-def profile():
-    """Profile page route"""
-    # Get user's saved meal plans
-    saved_plans = MealPlan.query.filter_by(user_id=current_user.id, is_saved=True).order_by(MealPlan.date.desc()).all()
+def delete_custom_food(food_id):
+    """Remove a food from the user's personal catalog overlay"""
+    food = CustomFood.query.get_or_404(food_id)
     
-    # Format saved plans for display
-    formatted_saved_plans = []
-    for plan in saved_plans:
-        try:
-            # Safe JSON parsing with error handling
-            if isinstance(plan.foods, bytes):
-                # Handle case where foods is stored as binary
-                foods_str = plan.foods.decode('utf-8', errors='replace')
-            else:
-                foods_str = plan.foods
-                
-            # Check if the string starts with a quote (proper JSON)
-            if foods_str and foods_str[0] == '"':
-                # Handle double-encoded JSON (string within string)
-                foods_str = foods_str.strip('"')
-                
-            # Try to parse JSON, with fallback to empty list
-            try:
-                foods = json.loads(foods_str)
-            except:
-                print(f"Failed to parse foods JSON for plan {plan.id}: {foods_str}")
-                foods = []
-            
-            # Handle correct data types for calories
-            if isinstance(plan.target_calories, bytes):
-                target_calories = int.from_bytes(plan.target_calories, byteorder='little')
-            else:
-                target_calories = int(plan.target_calories)
-                
-            if isinstance(plan.actual_calories, bytes):
-                actual_calories = int.from_bytes(plan.actual_calories, byteorder='little')
-            else:
-                actual_calories = int(plan.actual_calories)
-            
-            formatted_saved_plans.append({
-                'id': plan.id,
-                'date': plan.date,
-                'diet_type': plan.diet_type,
-                'target_calories': target_calories,
-                'actual_calories': actual_calories,
-                'foods': foods
-            })
-        except Exception as e:
-            print(f"Error processing meal plan {plan.id}: {e}")
-            # Skip this plan if we can't process it
-            continue
-    
-    return render_template('profile.html', saved_plans=formatted_saved_plans)
+    if food.user_id != current_user.id:
+        flash('Not authorized to delete this food', 'danger')
+        return redirect(url_for('profile'))
+    
+    db.session.delete(food)
+    db.session.commit()
+    overlay_cache.invalidate(current_user.id)
+    if plan_prefetcher is not None:
+        plan_prefetcher.invalidate(current_user.id)
+    
+    flash('Food removed', 'success')
+    return redirect(url_for('profile'))
 
 @app.route('/delete_meal_plan/<int:plan_id>', methods=['POST'])
 @login_required
@@ -626,8 +1212,11 @@ def delete_meal_plan(plan_id):
         flash('Not authorized to delete this meal plan', 'danger')
         return redirect(url_for('profile'))
     
+    saved_food_ids = plan.food_ids if plan.is_saved and plan.content is not None else None
     db.session.delete(plan)
     db.session.commit()
+    if saved_food_ids is not None:
+        plan_cooccurrence.remove_plan(saved_food_ids)
     
     flash('Meal plan deleted successfully', 'success')
     return redirect(url_for('profile'))
@@ -0,0 +1,240 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from data_processor import load_and_process_data
+
+
+class FoodCatalog:
+    """
+    Read-only, column-oriented food catalog addressed by integer food id.
+
+    Food ids are stable: they come from a 'food_id' column when the source
+    has one, otherwise from the row's position in the source file (so they
+    stay stable as long as the source is only appended to). The same food
+    can be listed under several subcategories; those rows share a name id,
+    which is what plans use to avoid picking the same food twice.
+
+    Names, servings and subcategory labels are only needed when a plan is
+    rendered, so generation works on the compact numeric columns alone.
+    """
+
+    def __init__(self, food_data):
+        """
+        Build the catalog from processed food data.
+
+        Args:
+            food_data (pd.DataFrame): Output of data_processor.load_and_process_data
+        """
+        if 'food_id' in food_data.columns:
+            food_data = food_data.sort_values('food_id')
+            self.food_ids = food_data['food_id'].to_numpy(dtype=np.int32)
+        else:
+            self.food_ids = np.arange(len(food_data), dtype=np.int32)
+
+        self.names = food_data['food'].astype(object).to_numpy()
+        self.servings = food_data['serving'].astype(object).to_numpy()
+
+        # Rows listing the same food share a name id
+        self.name_ids = pd.factorize(self.names)[0].astype(np.int32)
+
+        subcategories = pd.Categorical(food_data['subcategory'].astype(object))
+        self.subcategory_names = list(subcategories.categories)
+        self.subcategories = subcategories.codes.astype(np.int16)
+
+        self.calories = food_data['calories'].to_numpy().clip(0, np.iinfo(np.int16).max).astype(np.int16)
+
+        self.diet_bits = food_data['diet_bits'].to_numpy(dtype=np.uint64)
+        self.exclusion_bits = food_data['exclusion_bits'].to_numpy(dtype=np.uint64)
+
+        # First id listed for each name, for resolving stored or imported food names
+        self._ids_by_name = {}
+        for food_id, name in zip(self.food_ids.tolist(), self.names):
+            self._ids_by_name.setdefault(name, food_id)
+
+    def __len__(self):
+        return len(self.food_ids)
+
+    def _lookup(self, food_ids):
+        """(row positions, found mask) for food ids; positions of ids not found are meaningless."""
+        food_ids = np.asarray(food_ids, dtype=np.int32)
+        positions = np.minimum(np.searchsorted(self.food_ids, food_ids), max(len(self.food_ids) - 1, 0))
+        found = (self.food_ids[positions] == food_ids) if len(self.food_ids) else np.zeros(len(food_ids), dtype=bool)
+        return positions, found
+
+    def contains(self, food_ids):
+        """Boolean mask of the food ids the catalog lists."""
+        return self._lookup(food_ids)[1]
+
+    def positions(self, food_ids):
+        """
+        Row positions for catalog food ids.
+
+        Raises:
+            KeyError: If the catalog doesn't list some of the ids (e.g. ids of
+                      a stored plan the catalog has since dropped)
+        """
+        positions, found = self._lookup(food_ids)
+        if not found.all():
+            raise KeyError(f"Unknown food ids: {np.asarray(food_ids)[~found].tolist()}")
+        return positions
+
+    def subcategory_code(self, subcategory):
+        """Integer code for a subcategory label, or None if the catalog has no such subcategory."""
+        try:
+            return self.subcategory_names.index(subcategory)
+        except ValueError:
+            return None
+
+    def id_for_name(self, name):
+        """Food id for a catalog food name, or None if the catalog doesn't list it."""
+        return self._ids_by_name.get(name)
+
+    def describe(self, food_ids):
+        """
+        Resolve food ids to display records.
+
+        Ids the catalog doesn't list are reported and left out, rather than
+        shown as whichever food sorts next to them.
+
+        Args:
+            food_ids (iterable): Catalog food ids
+
+        Returns:
+            list: Dicts with food, serving, calories and subcategory (plain Python types)
+                  for the known ids, in order
+        """
+        food_ids = list(food_ids)
+        positions, found = self._lookup(food_ids)
+        if not found.all():
+            print(f"Skipping unknown food ids: {np.asarray(food_ids)[~found].tolist()}")
+        return [
+            {
+                'food': self.names[position],
+                'serving': self.servings[position],
+                'calories': int(self.calories[position]),
+                'subcategory': self.subcategory_names[self.subcategories[position]]
+            }
+            for position in positions[found]
+        ]
+
+    def pool(self, mask):
+        """Candidate pool of the rows selected by a boolean mask."""
+        return FoodPool(
+            ids=self.food_ids[mask],
+            name_ids=self.name_ids[mask],
+            calories=self.calories[mask],
+            subcategories=self.subcategories[mask],
+            diet_bits=self.diet_bits[mask],
+            exclusion_bits=self.exclusion_bits[mask]
+        )
+
+
+class FoodPool:
+    """
+    Candidate foods for one diet as parallel numpy arrays.
+
+    Pools are small views of the catalog (or a user's overlay) holding only
+    what generation needs: ids, name ids, calories, subcategory codes and the
+    food class bits (see diets.py) used for meat-ratio plans.
+    """
+    __slots__ = ('ids', 'name_ids', 'calories', 'subcategories',
+                 'diet_bits', 'exclusion_bits')
+
+    def __init__(self, ids, name_ids, calories, subcategories, diet_bits, exclusion_bits):
+        self.ids = ids
+        self.name_ids = name_ids
+        self.calories = calories
+        self.subcategories = subcategories
+        self.diet_bits = diet_bits
+        self.exclusion_bits = exclusion_bits
+
+    def __len__(self):
+        return len(self.ids)
+
+    def subset(self, selector):
+        """Pool of the rows picked by a boolean mask or position array."""
+        return FoodPool(*(getattr(self, field)[selector] for field in self.__slots__))
+
+    def sample(self, frac, rng=None):
+        """Random subset of round(frac * len) rows, in pool order (drawn from rng, or fresh entropy)."""
+        rng = np.random.default_rng() if rng is None else rng
+        size = int(round(len(self) * frac))
+        positions = np.sort(rng.choice(len(self), size=size, replace=False))
+        return self.subset(positions)
+
+    @staticmethod
+    def concat(pools):
+        """Stack several pools into one."""
+        return FoodPool(*(
+            np.concatenate([getattr(pool, field) for pool in pools])
+            for field in FoodPool.__slots__
+        ))
+
+
+class PoolIndexCache:
+    """
+    Lookup structures built from pools, keyed by pool content.
+
+    Pools are rebuilt per request for users with exclusions, so entries are
+    keyed by a hash of the pool's columns rather than the pool object; users
+    with the same exclusions and no custom foods share an entry. Least
+    recently used entries are evicted first.
+    """
+
+    def __init__(self, build, max_entries=64):
+        """
+        Args:
+            build (callable): (pool, mask) -> index, or None if the pool can't be indexed
+            max_entries (int): Keep at most this many indexes
+        """
+        self.build = build
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, pool, mask=None):
+        """The index for a pool (and optional boolean mask over it), built on first use."""
+        key = self._key(pool, mask)
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None:
+                self._entries.move_to_end(key)
+                return index
+
+        # Built outside the lock; a concurrent build of the same pool just wins or loses the race
+        index = self.build(pool, mask)
+        if index is None:
+            return None
+        with self._lock:
+            self._entries[key] = index
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return index
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _key(pool, mask):
+        digest = hashlib.blake2b(digest_size=16)
+        for column in (pool.ids, pool.name_ids, pool.calories, pool.subcategories):
+            digest.update(np.ascontiguousarray(column).tobytes())
+        digest.update(b'' if mask is None else np.packbits(mask).tobytes())
+        return digest.digest()
+
+
+def load_catalog(file_path):
+    """
+    Load, classify and compact a catalog CSV.
+
+    Args:
+        file_path (str): Path to the CSV file
+
+    Returns:
+        FoodCatalog: Compact catalog (the intermediate DataFrame is discarded)
+    """
+    return FoodCatalog(load_and_process_data(file_path))
@@ -0,0 +1,212 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from collections import Counter
+
+# Columns of the processed catalog (what data_processor.load_and_process_data reads)
+OUTPUT_FIELDS = ['food_id', 'Subcategory', 'Food', 'Serving', 'Calories']
+
+_SEPARATORS = re.compile(r'[\W_]+')
+_CALORIES = re.compile(r'\s*(\d+)')
+
+
+def normalize_name(name):
+    """
+    Canonical form of a food or subcategory name, for matching only.
+
+    Case, accents, punctuation and spacing are ignored, so
+    'Crème Brûlée' and 'creme  brulee' normalize to the same string.
+    """
+    decomposed = unicodedata.normalize('NFKD', str(name))
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return _SEPARATORS.sub(' ', stripped.casefold()).strip()
+
+
+def name_key(name):
+    """8-byte hash of a normalized name; the dedup index holds these instead of the strings."""
+    return hashlib.blake2b(normalize_name(name).encode('utf-8'), digest_size=8).digest()
+
+
+def subcategory_filter(include=None, exclude=None):
+    """
+    Build the subcategory rule check.
+
+    Args:
+        include (list): Subcategories to keep (empty or None keeps all)
+        exclude (list): Subcategories to drop, applied after include
+
+    Returns:
+        function: subcategory -> bool
+    """
+    include = {normalize_name(subcategory) for subcategory in include or []}
+    exclude = {normalize_name(subcategory) for subcategory in exclude or []}
+
+    def allowed(subcategory):
+        key = normalize_name(subcategory)
+        return (not include or key in include) and key not in exclude
+
+    return allowed
+
+
+def _parse_calories(value):
+    """Leading integer of a '97 Cal' style value, or None."""
+    match = _CALORIES.match(str(value or ''))
+    return int(match.group(1)) if match else None
+
+
+def read_food_ids(path):
+    """
+    Food ids of an existing processed catalog, by food and subcategory.
+
+    Ids come from the 'food_id' column, or from row positions for catalogs
+    written before it existed (the ids FoodCatalog gives those rows).
+
+    Args:
+        path (str): Catalog CSV; a missing file has no ids
+
+    Returns:
+        dict: (name_key(food), normalized subcategory) -> food id
+    """
+    food_ids = {}
+    if not os.path.exists(path):
+        return food_ids
+    with open(path, newline='', encoding='utf-8') as f:
+        for position, row in enumerate(csv.DictReader(f)):
+            food_id = int(row['food_id']) if row.get('food_id') else position
+            key = (name_key((row.get('Food') or '').strip()), normalize_name((row.get('Subcategory') or '').strip()))
+            food_ids.setdefault(key, food_id)
+    return food_ids
+
+
+def merge_rows(sources, include=None, exclude=None, stats=None, food_ids=None):
+    """
+    Merge raw catalog sources into processed catalog rows in one pass.
+
+    Sources are read in priority order and rows are yielded as they are
+    read, so memory only grows with the dedup index, not the sources. A food
+    listed by an earlier source is dropped from later ones. Within a source
+    the same food may appear under several subcategories (the catalog keeps
+    those), but not twice under the same one.
+
+    Stored plans refer to foods by id, so a food the current catalog already
+    lists (same name and subcategory, see read_food_ids) keeps its id,
+    whatever the source order or rules. New foods get ids above every
+    existing one, so an id is never reused for a different food.
+
+    Args:
+        sources (list): Paths of CSV files with Subcategory, Food, Serving
+                        and Calories columns (other columns are ignored)
+        include (list): Subcategories to keep (see subcategory_filter)
+        exclude (list): Subcategories to drop
+        stats (Counter): Optional, counts rows by outcome (kept, excluded,
+                         duplicate, invalid) and kept rows given a new id (new)
+        food_ids (dict): Ids of the current catalog, from read_food_ids
+
+    Yields:
+        dict: Rows with OUTPUT_FIELDS keys
+    """
+    stats = Counter() if stats is None else stats
+    allowed = subcategory_filter(include, exclude)
+    owners = {}  # name hash -> index of the first source listing it
+    listed = set()  # (name hash, subcategory code) already emitted
+    subcategory_codes = {}
+    food_ids = food_ids or {}
+    next_id = max(food_ids.values(), default=-1) + 1
+
+    for source_index, path in enumerate(sources):
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                # Names are only trimmed here (displayed names and name lookups stay
+                # as the source has them); matching uses the normalized form
+                subcategory = (row.get('Subcategory') or '').strip()
+                food = (row.get('Food') or '').strip()
+                calories = _parse_calories(row.get('Calories'))
+                if not subcategory or not food or calories is None:
+                    stats['invalid'] += 1
+                    continue
+                if not allowed(subcategory):
+                    stats['excluded'] += 1
+                    continue
+
+                key = name_key(food)
+                code = subcategory_codes.setdefault(normalize_name(subcategory), len(subcategory_codes))
+                if owners.setdefault(key, source_index) != source_index or (key, code) in listed:
+                    stats['duplicate'] += 1
+                    continue
+                listed.add((key, code))
+
+                food_id = food_ids.get((key, normalize_name(subcategory)))
+                if food_id is None:
+                    food_id = next_id
+                    next_id += 1
+                    stats['new'] += 1
+
+                stats['kept'] += 1
+                yield {
+                    'food_id': food_id,
+                    'Subcategory': subcategory,
+                    'Food': food,
+                    'Serving': (row.get('Serving') or '').strip(),
+                    'Calories': f'{calories} Cal'
+                }
+
+
+def write_catalog(rows, path):
+    """Write merged rows to a CSV, replacing the file only once every row is written."""
+    partial = f'{path}.partial'
+    with open(partial, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(partial, path)
+
+
+def merge_catalog(config_path, output=None):
+    """
+    Run the merge described by a JSON config file.
+
+    The config lists ``sources`` in priority order, the ``output`` path and
+    optional ``include_subcategories`` / ``exclude_subcategories``. Relative
+    paths are resolved against the config file's directory. Foods already in
+    the config's output catalog keep their ids (see merge_rows).
+
+    Args:
+        config_path (str): Path to the config
+        output (str): Overrides the config's output path
+
+    Returns:
+        Counter: Rows by outcome (see merge_rows)
+    """
+    with open(config_path, encoding='utf-8') as f:
+        config = json.load(f)
+
+    base = os.path.dirname(os.path.abspath(config_path))
+    sources = [os.path.join(base, source) for source in config['sources']]
+    catalog = os.path.join(base, config['output'])
+    output = output or catalog
+
+    stats = Counter()
+    rows = merge_rows(
+        sources,
+        include=config.get('include_subcategories'),
+        exclude=config.get('exclude_subcategories'),
+        stats=stats,
+        food_ids=read_food_ids(catalog)  # Read before the output replaces it
+    )
+    write_catalog(rows, output)
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Merge raw food sources into the processed catalog.')
+    parser.add_argument('config', nargs='?', default='catalog_sources.json', help='Path to the merge config')
+    parser.add_argument('--output', help='Write here instead of the config\'s output path')
+    args = parser.parse_args()
+
+    result = merge_catalog(args.config, args.output)
+    print(f"Kept {result['kept']} foods, {result['new']} of them new ({result['duplicate']} duplicates, "
+          f"{result['excluded']} excluded, {result['invalid']} invalid rows dropped)")
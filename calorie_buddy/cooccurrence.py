@@ -0,0 +1,104 @@
+import threading
+from collections import Counter, defaultdict
+from itertools import combinations
+
+import numpy as np
+
+
+class CooccurrenceModel:
+    """
+    How often foods are saved together, as a sparse symmetric matrix.
+
+    Rows are kept dictionary-of-keys style (food id -> Counter of the food
+    ids saved with it); the diagonal holds how often each food was saved at
+    all. The model is loaded once from saved plans and then updated one plan
+    at a time as plans are saved, imported or deleted, never recomputed.
+
+    Lookups turn rows into count vectors over a pool's positions, which is
+    what generation uses to favour foods that go with the plan so far.
+    """
+
+    def __init__(self):
+        self._rows = defaultdict(Counter)
+        self._arrays = {}  # food id -> (sorted other ids, counts), rebuilt after the row changes
+        self._saves = None  # (sorted ids, save counts) of the diagonal, rebuilt after any change
+        self._lock = threading.Lock()
+
+    def add_plan(self, food_ids, count=1):
+        """Count one saved plan (a negative count takes a plan back out)."""
+        foods = sorted(set(int(food_id) for food_id in food_ids))
+        with self._lock:
+            for food_id in foods:
+                self._bump(food_id, food_id, count)
+            for first, second in combinations(foods, 2):
+                self._bump(first, second, count)
+                self._bump(second, first, count)
+            for food_id in foods:
+                self._arrays.pop(food_id, None)
+            self._saves = None
+
+    def remove_plan(self, food_ids):
+        """Take a deleted saved plan back out of the counts."""
+        self.add_plan(food_ids, count=-1)
+
+    def _bump(self, food_id, other_id, count):
+        row = self._rows[food_id]
+        row[other_id] += count
+        if row[other_id] <= 0:
+            del row[other_id]
+            if not row:
+                del self._rows[food_id]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def row(self, food_id):
+        """(ids, counts) arrays of the foods saved with a food, ids sorted; diagonal included."""
+        with self._lock:
+            arrays = self._arrays.get(food_id)
+            if arrays is None:
+                row = self._rows.get(food_id, {})
+                ids = np.fromiter(sorted(row), dtype=np.int64, count=len(row))
+                arrays = (ids, np.array([row[other_id] for other_id in ids.tolist()], dtype=np.float64))
+                self._arrays[food_id] = arrays
+            return arrays
+
+    def saves(self):
+        """(ids, counts) arrays of how often each food was saved, ids sorted."""
+        with self._lock:
+            if self._saves is None:
+                ids = np.fromiter(sorted(self._rows), dtype=np.int64, count=len(self._rows))
+                counts = np.array([self._rows[food_id][food_id] for food_id in ids.tolist()], dtype=np.float64)
+                self._saves = (ids, counts)
+            return self._saves
+
+    def affinity(self, pool_ids, food_ids=None):
+        """
+        Counts over a pool's positions.
+
+        Args:
+            pool_ids (np.ndarray): Food ids of the pool
+            food_ids (iterable): Foods already chosen; None gives each pool
+                                 food's save count instead
+
+        Returns:
+            np.ndarray: For each pool position, the times it was saved with
+                        the chosen foods (summed over them)
+        """
+        result = np.zeros(len(pool_ids), dtype=np.float64)
+        rows = [self.saves()] if food_ids is None else [self.row(int(food_id)) for food_id in food_ids]
+        for ids, counts in rows:
+            if len(ids):
+                found = np.clip(np.searchsorted(ids, pool_ids), 0, len(ids) - 1)
+                hit = ids[found] == pool_ids
+                result[hit] += counts[found[hit]]
+        return result
+
+    def __getstate__(self):
+        # Process pools get a copy of the counts; the lock and caches stay behind
+        with self._lock:
+            return {'rows': {food_id: Counter(row) for food_id, row in self._rows.items()}}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self._rows.update(state['rows'])
@@ -0,0 +1,315 @@
+import re
+
+import numpy as np
+
+# Food classes every catalog row is checked against. A class lists
+# 'include' rules (the row needs to match one of them; no rules means every
+# row) and 'exclude' rules (it must match none), plus the classes it
+# 'requires'. A rule matches a row when any of its matchers does:
+#   'subcategories' - the row's subcategory is one of these
+#   'words'         - one of these is a whole (whitespace-delimited) word of the name
+#   'substrings'    - one of these appears anywhere in the name
+#   'classes'       - the row is in one of these (earlier) classes
+# optionally narrowed by a 'when' rule that must also match and an 'unless'
+# rule that must not. Names are matched lowercased. A class may only refer to
+# classes listed before it; its position is its bit in 'diet_bits'.
+MEAT_SUBCATEGORIES = [
+    'Meat', 'Beef & Veal', 'Pork & Ham', 'Poultry', 'Game Meats',
+    'Sausages & Cold Cuts'
+]
+
+MEAT_KEYWORDS = [
+    # Red meat
+    'beef', 'pork', 'lamb', 'mutton', 'veal', 'goat', 'venison', 'deer',
+    'elk', 'buffalo', 'bison', 'rabbit', 'horse', 'boar', 'ham', 'bacon',
+
+    # Processed meats
+    'sausage', 'salami', 'pepperoni', 'prosciutto', 'bologna', 'pastrami',
+    'corned beef', 'hotdog', 'hot dog', 'bratwurst', 'chorizo', 'steak',
+    'jerky', 'meatloaf', 'meatball', 'hamburger', 'burger', 'pate',
+
+    # Poultry
+    'chicken', 'turkey', 'duck', 'goose', 'quail', 'pheasant', 'pigeon',
+    'guinea fowl', 'ostrich', 'emu', 'drumstick', 'wing', 'poultry',
+
+    # Fish
+    'fish', 'salmon', 'tuna', 'tilapia', 'sardine', 'anchovy', 'mackerel',
+    'cod', 'halibut', 'trout', 'snapper', 'haddock', 'catfish', 'bass',
+    'herring', 'swordfish', 'mahi-mahi', 'flounder', 'perch', 'sole',
+
+    # Seafood
+    'shrimp', 'prawn', 'lobster', 'crab', 'oyster', 'mussel', 'clam',
+    'scallop', 'squid', 'octopus', 'calamari', 'crawfish', 'shellfish',
+    'seafood',
+
+    # Other meats
+    'offal', 'liver', 'kidney', 'heart', 'tongue', 'brain', 'tripe',
+    'sweetbread', 'bone marrow', 'foie gras',
+
+    # Generic terms
+    'meat', 'carne', 'flesh', 'animal', 'bbq', 'barbecue'
+]
+
+# Dishes that typically contain meat
+NON_VEGETARIAN_DISHES = [
+    'bolognese', 'carbonara', 'meatlovers', 'meat lovers', 'pepperoni',
+    'al pastor', 'carnitas', 'carnivore', 'hunters', 'cacciatore',
+    'barbacoa', 'birria', 'cottage pie', 'shepherd', 'meatball',
+    'beef wellington', 'stroganoff', 'schnitzel', 'gyro', 'shawarma',
+    'kebab', 'meatloaf', 'cheeseburger', 'hamburger', 'slider',
+    'salisbury', 'surf and turf'
+]
+
+# Pizza counts as vegetarian unless it names one of these toppings
+PIZZA_MEAT_KEYWORDS = [
+    'pepperoni', 'sausage', 'meat lover', 'supreme', 'ham',
+    'bacon', 'prosciutto', 'seafood', 'anchovy', 'hawaiian'
+]
+
+# Categories that are vegan apart from a few processed foods
+VEGAN_SUBCATEGORIES = ['Fruit', 'Vegetables & Legumes', 'Nuts & Seeds']
+
+POTENTIALLY_NON_VEGAN_KEYWORDS = ['honey', 'butter', 'cheese', 'creamy', 'creamed']
+
+NON_VEGAN_SUBCATEGORIES = [
+    'Dairy', 'Eggs', 'Milk & Yogurt', 'Cheese', 'Milk',
+    'Ice Cream & Desserts', 'Pastry', 'Desserts', 'Sweets',
+    'Snacks', 'Chocolate', 'Cake', 'Cookie', 'Biscuit',
+    'Breakfast Cereals', 'Pie'
+]
+
+NON_VEGAN_KEYWORDS = [
+    'milk', 'cheese', 'cream', 'yogurt', 'butter', 'ghee', 'egg',
+    'honey', 'dairy', 'whey', 'casein', 'lactose', 'mozzarella',
+    'parmesan', 'cheddar', 'ricotta', 'pizza', 'mayo', 'mayonnaise',
+    'custard', 'pudding', 'ice cream', 'gelato', 'frosting',
+    'chocolate', 'cake', 'cookie', 'cheesecake', 'pancake', 'waffle',
+    'brioche', 'croissant', 'pastry', 'danish', 'milk chocolate'
+]
+
+# Foods outside the vegan categories that are known to be vegan (anything
+# else there is conservatively left out)
+VEGAN_FOODS = [
+    'bread', 'whole wheat bread', 'whole grain bread', 'pita', 'pasta',
+    'rice', 'brown rice', 'white rice', 'noodles', 'cereal', 'oatmeal',
+    'quinoa', 'couscous', 'barley', 'bulgur', 'farro', 'millet',
+    'tempeh', 'tofu', 'seitan', 'hummus', 'tahini', 'falafel',
+    'tabbouleh', 'sorbet', 'maple syrup', 'jam', 'jelly', 'marmalade',
+    'peanut butter', 'almond butter', 'cashew butter', 'olive oil',
+    'coconut oil', 'vegetable oil', 'canola oil', 'sunflower oil',
+    'dark chocolate', 'soy milk', 'almond milk', 'oat milk', 'rice milk',
+    'coconut milk', 'soy yogurt', 'coconut yogurt'
+]
+
+SEAFOOD_KEYWORDS = [
+    'fish', 'salmon', 'tuna', 'tilapia', 'sardine', 'herring', 'anchovy',
+    'mackerel', 'cod', 'halibut', 'trout', 'snapper', 'shrimp', 'prawn',
+    'lobster', 'crab', 'oyster', 'mussel', 'clam', 'scallop', 'squid',
+    'octopus', 'calamari', 'seafood'
+]
+
+FOOD_CLASSES = {
+    'vegetarian': {
+        'exclude': [
+            {
+                'subcategories': MEAT_SUBCATEGORIES + ['Fish & Seafood', 'Meat & Poultry', 'Processed Meats'],
+                'words': MEAT_KEYWORDS,
+                # Short keywords ('ham', 'cod', ...) only count as whole words
+                'substrings': [keyword for keyword in MEAT_KEYWORDS if len(keyword) > 3] + NON_VEGETARIAN_DISHES
+            },
+            {
+                'substrings': PIZZA_MEAT_KEYWORDS,
+                'when': {'subcategories': ['Pizza'], 'substrings': ['pizza']}
+            }
+        ]
+    },
+    'vegan': {
+        'requires': ['vegetarian'],
+        'include': [
+            {
+                'subcategories': VEGAN_SUBCATEGORIES,
+                'unless': {'substrings': POTENTIALLY_NON_VEGAN_KEYWORDS}
+            },
+            {
+                'substrings': VEGAN_FOODS,
+                'unless': {
+                    'subcategories': VEGAN_SUBCATEGORIES + NON_VEGAN_SUBCATEGORIES,
+                    'substrings': NON_VEGAN_KEYWORDS
+                }
+            }
+        ]
+    },
+    'seafood': {
+        'include': [{'subcategories': ['Fish & Seafood'], 'substrings': SEAFOOD_KEYWORDS}]
+    },
+    'non_vegetarian': {
+        # Meat but not seafood
+        'include': [{
+            'subcategories': MEAT_SUBCATEGORIES,
+            'substrings': ['beef', 'pork', 'chicken', 'turkey', 'duck', 'goose', 'lamb', 'mutton',
+                           'veal', 'ham', 'bacon', 'sausage', 'steak', 'ribs', 'venison', 'deer',
+                           'elk', 'buffalo', 'bison', 'pepperoni', 'salami', 'prosciutto']
+        }],
+        'exclude': [{'classes': ['vegetarian', 'seafood']}]
+    },
+}
+
+CLASS_BITS = {name: np.uint64(1) << np.uint64(bit) for bit, name in enumerate(FOOD_CLASSES)}
+
+# Diets offered by the planner, in display order. A diet's 'core' foods are
+# always in its pool and its 'side' foods (or None) are sampled in on each
+# attempt; both select food classes by the ones rows must be in ('all') and
+# must not be in ('none'). Meat-ratio diets take that share of their calories
+# from meat (see meat_mask). Names are stored with saved plans, so they must
+# fit MealPlan.diet_type (20 characters) and shouldn't be renamed.
+SIDE_VEGETARIAN = {'all': ['vegetarian'], 'none': ['vegan']}
+
+DIETS = {
+    'Vegetarian': {
+        'core': {'all': ['vegetarian']},
+        'side': None,
+        'meat_ratio': 0.0,
+        'color': '#4CAF50',
+        'tint': 'rgba(76, 175, 80, 0.1)'
+    },
+    'Non-Vegetarian': {
+        'core': {'all': ['non_vegetarian']},
+        'side': SIDE_VEGETARIAN,
+        'meat_ratio': 0.4,
+        'color': '#F44336',
+        'tint': 'rgba(244, 67, 54, 0.1)'
+    },
+    'Seafood Mix': {
+        'core': {'all': ['seafood']},
+        'side': SIDE_VEGETARIAN,
+        'meat_ratio': 0.35,
+        'color': '#2196F3',
+        'tint': 'rgba(33, 150, 243, 0.1)'
+    },
+    'Vegan': {
+        'core': {'all': ['vegan']},
+        'side': None,
+        'meat_ratio': 0.0,
+        'color': '#9C27B0',
+        'tint': 'rgba(156, 39, 176, 0.1)'
+    },
+}
+
+# Classes counted as meat in meat-ratio plans, in order of preference
+MEAT_CLASSES = ['seafood', 'non_vegetarian']
+
+
+def _class_mask(names):
+    mask = np.uint64(0)
+    for name in names:
+        mask |= CLASS_BITS[name]
+    return mask
+
+
+def _pattern(keywords, whole_words=False):
+    pattern = '|'.join(re.escape(keyword) for keyword in keywords)
+    return re.compile(rf'(?<!\S)(?:{pattern})(?!\S)' if whole_words else pattern)
+
+
+def _compile_rule(rule):
+    """Precompile a rule's keyword lists into one regex per matcher."""
+    compiled = {
+        'subcategories': list(rule.get('subcategories', [])),
+        'patterns': [],
+        'classes': _class_mask(rule.get('classes', [])),
+        'when': _compile_rule(rule['when']) if 'when' in rule else None,
+        'unless': _compile_rule(rule['unless']) if 'unless' in rule else None
+    }
+    if rule.get('words'):
+        compiled['patterns'].append(_pattern(rule['words'], whole_words=True))
+    if rule.get('substrings'):
+        compiled['patterns'].append(_pattern(rule['substrings']))
+    return compiled
+
+
+_COMPILED_CLASSES = {
+    name: {
+        'requires': _class_mask(definition.get('requires', [])),
+        'include': [_compile_rule(rule) for rule in definition.get('include', [])],
+        'exclude': [_compile_rule(rule) for rule in definition.get('exclude', [])]
+    }
+    for name, definition in FOOD_CLASSES.items()
+}
+
+
+def _rule_matches(rule, names, subcategories, bits):
+    matches = subcategories.isin(rule['subcategories']).to_numpy()
+    for pattern in rule['patterns']:
+        matches = matches | names.str.contains(pattern, regex=True).to_numpy()
+    if rule['classes']:
+        matches = matches | ((bits & rule['classes']) != 0)
+    if rule['when'] is not None:
+        matches = matches & _rule_matches(rule['when'], names, subcategories, bits)
+    if rule['unless'] is not None:
+        matches = matches & ~_rule_matches(rule['unless'], names, subcategories, bits)
+    return matches
+
+
+def compute_diet_bits(food_names, subcategories):
+    """
+    Pack every food class each row is in into one uint64.
+
+    All classes are evaluated in a single pass over the registry, each
+    keyword list as one vectorized regex over the whole column; classes
+    that build on others read the bits already set instead of re-checking
+    the rows.
+
+    Args:
+        food_names (pd.Series): Food names
+        subcategories (pd.Series): Subcategories, aligned with food_names
+
+    Returns:
+        np.ndarray: uint64 bitset per row
+    """
+    names = food_names.astype(str).str.lower()
+    bits = np.zeros(len(names), dtype=np.uint64)
+
+    for name, definition in _COMPILED_CLASSES.items():
+        matches = (bits & definition['requires']) == definition['requires']
+        if definition['include']:
+            included = np.zeros(len(names), dtype=bool)
+            for rule in definition['include']:
+                included |= _rule_matches(rule, names, subcategories, bits)
+            matches &= included
+        for rule in definition['exclude']:
+            matches &= ~_rule_matches(rule, names, subcategories, bits)
+        bits[matches] |= CLASS_BITS[name]
+
+    return bits
+
+
+def select(bits, selector):
+    """Boolean mask of the rows a diet's core or side selector picks."""
+    required = _class_mask(selector.get('all', []))
+    excluded = _class_mask(selector.get('none', []))
+    return ((bits & required) == required) & ((bits & excluded) == 0)
+
+
+def diet_masks(bits, diet_type):
+    """
+    Rows of a diet's core and side foods.
+
+    Args:
+        bits (np.ndarray): 'diet_bits' of the rows
+        diet_type (str): Name of a diet in DIETS
+
+    Returns:
+        tuple: (core mask, side mask or None)
+    """
+    diet = DIETS[diet_type]
+    side = None if diet['side'] is None else select(bits, diet['side'])
+    return select(bits, diet['core']), side
+
+
+def meat_mask(bits):
+    """Rows counted as meat: the first of MEAT_CLASSES any row is in (all False if none)."""
+    for name in MEAT_CLASSES:
+        mask = (bits & CLASS_BITS[name]) != 0
+        if mask.any():
+            return mask
+    return np.zeros(len(bits), dtype=bool)
@@ -0,0 +1,166 @@
+import re
+
+import numpy as np
+
+# Exclusion tags a user can opt out of. Each tag matches catalog rows by
+# subcategory and/or by word patterns in the food name. The position in
+# this dict is the tag's bit in the packed 'exclusion_bits' column (users
+# store tag names, not bits, so at most 64 tags but any order is safe).
+EXCLUSION_TAGS = {
+    'peanuts': {
+        'label': 'Peanuts',
+        'subcategories': [],
+        'patterns': [r'peanut']
+    },
+    'tree_nuts': {
+        'label': 'Tree nuts',
+        'subcategories': [],
+        'patterns': [r'almond', r'cashew', r'walnut', r'pecan', r'hazelnut', r'pistachio',
+                     r'macadamia', r'brazil nut', r'pine nut', r'chestnut', r'praline']
+    },
+    'dairy': {
+        'label': 'Dairy',
+        'subcategories': ['Milk & Dairy Products', 'Yogurt'],
+        'patterns': [r'(?<!soy )(?<!almond )(?<!oat )(?<!rice )(?<!coconut )milk', r'(?<!soy )cheese',
+                     r'cream', r'yogh?urt', r'(?<!peanut )(?<!almond )(?<!cashew )(?<!nut )(?<!sun)butter(?!nut|fish)',
+                     r'whey', r'ghee', r'mozzarella', r'parmesan', r'cheddar', r'ricotta', r'feta', r'custard',
+                     r'quesadilla']
+    },
+    'eggs': {
+        'label': 'Eggs',
+        'subcategories': [],
+        'patterns': [r'\beggs?\b', r'omelet', r'mayo', r'meringue', r'mcmuffin', r'quiche']
+    },
+    'gluten': {
+        'label': 'Gluten',
+        'subcategories': ['Bread, Bread Rolls & Pastries', 'Pasta & Noodles', 'Pizza', 'Cakes & Pies'],
+        'patterns': [r'wheat', r'bread(?!fruit)', r'\bbun\b', r'bagel', r'pasta', r'noodle', r'cous ?cous',
+                     r'barley', r'\brye\b', r'seitan', r'sandwich', r'burger', r'whopper', r'\bbig mac\b',
+                     r'pizza', r'tortilla', r'burrito', r'croissant', r'muffin', r'pancake', r'waffle']
+    },
+    'soy': {
+        'label': 'Soy',
+        'subcategories': [],
+        'patterns': [r'\bsoy', r'tofu', r'tempeh', r'edamame', r'miso', r'bean curd']
+    },
+    'fish': {
+        'label': 'Fish',
+        'subcategories': ['Sushi'],
+        'patterns': [r'fish', r'salmon', r'tuna', r'tilapia', r'sardine', r'anchov', r'mackerel',
+                     r'\bcod\b', r'halibut', r'trout', r'herring', r'\beel\b']
+    },
+    'shellfish': {
+        'label': 'Shellfish',
+        'subcategories': [],
+        'patterns': [r'shrimp', r'prawn', r'lobster', r'crab', r'oyster', r'mussel', r'clam\b',
+                     r'scallop', r'squid', r'octopus', r'calamari', r'crawfish', r'shellfish']
+    },
+    'pork': {
+        'label': 'Pork',
+        'subcategories': ['Pork'],
+        'patterns': [r'pork', r'\bham\b', r'bacon', r'sausage', r'salami', r'pepperoni',
+                     r'prosciutto', r'chorizo', r'\bblt\b', r'baconator', r'\bbmt\b', r'hot ?dog']
+    },
+    'fast_food': {
+        'label': 'Fast food',
+        'subcategories': ['Fast Food & Burgers'],
+        'patterns': []
+    },
+    'mcdonalds': {
+        'label': "McDonald's items",
+        'subcategories': [],
+        'patterns': [r"mcdonald"]
+    },
+    'burger_king': {
+        'label': 'Burger King items',
+        'subcategories': [],
+        'patterns': [r'burger king']
+    },
+    'subway': {
+        'label': 'Subway items',
+        'subcategories': [],
+        'patterns': [r'subway']
+    },
+}
+
+TAG_BITS = {tag: np.uint64(1) << np.uint64(bit) for bit, tag in enumerate(EXCLUSION_TAGS)}
+
+
+def compute_exclusion_bits(food_names, subcategories):
+    """
+    Pack every exclusion tag that applies to each row into one uint64.
+
+    Each tag is one vectorized regex/isin pass over the whole column, so the
+    cost is per tag rather than per row and keyword.
+
+    Args:
+        food_names (pd.Series): Food names
+        subcategories (pd.Series): Subcategories, aligned with food_names
+
+    Returns:
+        np.ndarray: uint64 bitset per row
+    """
+    # Object dtype keeps matching on Python's re (the patterns use lookbehinds)
+    names = food_names.astype(object).str.lower()
+    bits = np.zeros(len(names), dtype=np.uint64)
+
+    for tag, rule in EXCLUSION_TAGS.items():
+        matches = subcategories.isin(rule['subcategories']).to_numpy()
+        if rule['patterns']:
+            pattern = '|'.join(f'(?:{p})' for p in rule['patterns'])
+            matches = matches | names.str.contains(pattern, regex=True, flags=re.IGNORECASE).to_numpy()
+        bits[matches] |= TAG_BITS[tag]
+
+    return bits
+
+
+def exclusion_mask(tags):
+    """
+    Combine a user's excluded tags into a single mask.
+
+    Unknown tags are ignored, so profiles survive tags being retired.
+
+    Args:
+        tags (iterable): Tag names from EXCLUSION_TAGS
+
+    Returns:
+        np.uint64: Mask to AND against 'exclusion_bits'
+    """
+    mask = np.uint64(0)
+    for tag in tags:
+        if tag in TAG_BITS:
+            mask |= TAG_BITS[tag]
+    return mask
+
+
+def parse_exclusions(value):
+    """Split a stored comma-separated exclusion list into known tag names."""
+    if not value:
+        return []
+    return [tag for tag in value.split(',') if tag in EXCLUSION_TAGS]
+
+
+def exclude_from_pools(diet_pools, mask):
+    """
+    Drop excluded foods from every diet pool in one vectorized AND per pool.
+
+    Args:
+        diet_pools (dict): Diet type -> (core FoodPool, side FoodPool or None, meat ratio)
+        mask (np.uint64): Output of exclusion_mask
+
+    Returns:
+        dict: Pools without any row whose bits intersect the mask (the input
+              pools are returned unchanged when the mask is empty)
+    """
+    if not mask:
+        return diet_pools
+
+    def _keep(pool):
+        if pool is None:
+            return None
+        return pool.subset((pool.exclusion_bits & mask) == 0)
+
+    return {
+        diet_type: (_keep(core_foods), _keep(side_foods), meat_ratio)
+        for diet_type, (core_foods, side_foods, meat_ratio) in diet_pools.items()
+    }
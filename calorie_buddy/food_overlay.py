@@ -0,0 +1,202 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from catalog import FoodPool
+from data_processor import classify_foods
+from diets import diet_masks
+
+
+def build_overlay(custom_foods, catalog):
+    """
+    Classify a user's custom foods and lay them out like catalog rows.
+
+    Custom foods get negative ids (-CustomFood.id), so they can never collide
+    with catalog food ids when pools are combined. Subcategories are coded
+    with the catalog's codes.
+
+    Args:
+        custom_foods (list): Dicts with id, food, serving, calories and subcategory
+        catalog (FoodCatalog): Shared catalog the overlay sits on
+
+    Returns:
+        dict: 'flags' (classified DataFrame), 'pool' (FoodPool of every custom
+              food) and 'records' (food id -> display record)
+    """
+    raw = pd.DataFrame({
+        'Subcategory': [food['subcategory'] for food in custom_foods],
+        'Food': [food['food'] for food in custom_foods]
+    })
+    flags = classify_foods(raw)  # Also adds exclusion_bits
+
+    ids = np.array([-int(food['id']) for food in custom_foods], dtype=np.int32)
+    subcategory_codes = [catalog.subcategory_code(food['subcategory']) for food in custom_foods]
+    pool = FoodPool(
+        ids=ids,
+        name_ids=ids.copy(),  # Each custom food is its own food
+        calories=np.array([int(food['calories']) for food in custom_foods], dtype=np.int16),
+        subcategories=np.array([-1 if code is None else code for code in subcategory_codes], dtype=np.int16),
+        diet_bits=flags['diet_bits'].to_numpy(dtype=np.uint64),
+        exclusion_bits=flags['exclusion_bits'].to_numpy(dtype=np.uint64)
+    )
+
+    records = {
+        -int(food['id']): {
+            'food': food['food'],
+            'serving': food['serving'],
+            'calories': int(food['calories']),
+            'subcategory': food['subcategory']
+        }
+        for food in custom_foods
+    }
+
+    return {'flags': flags, 'pool': pool, 'records': records}
+
+
+def merge_diet_pools(base_pools, overlay):
+    """
+    Layer a user's overlay rows over the shared per-diet pools.
+
+    Only the overlay rows that belong to each diet are appended to that
+    diet's (already filtered) pools, mirroring build_diet_pools; the shared
+    catalog and its pools are never modified.
+
+    Args:
+        base_pools (dict): Output of meal_generator.build_diet_pools for the catalog
+        overlay (dict): Output of build_overlay
+
+    Returns:
+        dict: Diet type -> (core FoodPool, side FoodPool or None, meat ratio)
+    """
+    bits = overlay['pool'].diet_bits
+
+    merged = {}
+    for diet_type, (core_foods, side_foods, meat_ratio) in base_pools.items():
+        # Overlay foods join the pools whose diet selectors pick them
+        core_mask, side_mask = diet_masks(bits, diet_type)
+        if core_mask.any():
+            core_foods = FoodPool.concat([core_foods, overlay['pool'].subset(core_mask)])
+        if side_foods is not None and side_mask is not None and side_mask.any():
+            side_foods = FoodPool.concat([side_foods, overlay['pool'].subset(side_mask)])
+        merged[diet_type] = (core_foods, side_foods, meat_ratio)
+
+    return merged
+
+
+class CatalogView:
+    """
+    One user's view of the food catalog: shared catalog plus their overlay.
+
+    Holds the diet pools generation should use and resolves plan food ids
+    (catalog ids and negative custom food ids alike) for rendering.
+    """
+
+    def __init__(self, catalog, diet_pools, records=None):
+        self.catalog = catalog
+        self.diet_pools = diet_pools
+        self.records = records or {}
+
+    def ids_for_names(self, names):
+        """
+        Resolve food names (the user's own foods first, then the catalog) to ids.
+
+        Names neither knows are dropped.
+        """
+        custom_ids = {record['food']: food_id for food_id, record in self.records.items()}
+        food_ids = []
+        for name in names:
+            food_id = custom_ids.get(name)
+            if food_id is None:
+                food_id = self.catalog.id_for_name(name)
+            if food_id is not None:
+                food_ids.append(food_id)
+        return food_ids
+
+    def describe(self, food_ids):
+        """Resolve a plan's food ids to display records, in plan order (unknown ids are reported and left out)."""
+        catalog_ids = [food_id for food_id in food_ids if food_id >= 0]
+        known = [food_id for food_id, found in zip(catalog_ids, self.catalog.contains(catalog_ids)) if found]
+        resolved = dict(zip(known, self.catalog.describe(known)))
+        resolved.update({food_id: self.records[food_id] for food_id in food_ids if food_id in self.records})
+        unknown = [food_id for food_id in food_ids if food_id not in resolved]
+        if unknown:
+            print(f"Skipping unknown food ids: {unknown}")
+        return [resolved[food_id] for food_id in food_ids if food_id in resolved]
+
+
+class OverlayCache:
+    """
+    Per-user cache of catalog views, evicted when idle.
+
+    Users without custom foods share one view over the shared pools. For the
+    rest, the merged pools are built once and reused until the user changes
+    their foods (invalidate) or stops using the app for ``idle_seconds``.
+    """
+
+    def __init__(self, load_custom_foods, catalog, base_pools, idle_seconds=900, max_users=256):
+        """
+        Args:
+            load_custom_foods (callable): user_id -> list of custom food dicts
+            catalog (FoodCatalog): Shared catalog
+            base_pools (dict): Shared per-diet pools for the catalog
+            idle_seconds (int): Evict overlays unused for this long
+            max_users (int): Keep at most this many overlays (least recently used go first)
+        """
+        self.load_custom_foods = load_custom_foods
+        self.catalog = catalog
+        self.base_pools = base_pools
+        self.base_view = CatalogView(catalog, base_pools)
+        self.idle_seconds = idle_seconds
+        self.max_users = max_users
+        self._entries = OrderedDict()  # user_id -> (last used, view)
+        self._versions = {}  # user_id -> invalidation count, guards against stale rebuilds
+        self._lock = threading.Lock()
+
+    def view(self, user_id):
+        """Return the user's catalog view (diet pools plus id resolution)."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries[user_id] = (now, entry[1])
+                self._entries.move_to_end(user_id)
+                return entry[1]
+            version = self._versions.get(user_id, 0)
+
+        custom_foods = self.load_custom_foods(user_id)
+        if custom_foods:
+            overlay = build_overlay(custom_foods, self.catalog)
+            view = CatalogView(self.catalog, merge_diet_pools(self.base_pools, overlay), overlay['records'])
+        else:
+            view = self.base_view
+
+        with self._lock:
+            if self._versions.get(user_id, 0) != version:
+                # Foods changed while we were building; serve but don't cache
+                return view
+            self._entries[user_id] = (now, view)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+        return view
+
+    def invalidate(self, user_id):
+        """Drop a user's overlay after their custom foods change."""
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict_idle(self, now):
+        # Entries are kept in last-used order, so idle ones are at the front
+        while self._entries:
+            user_id, (last_used, _) = next(iter(self._entries.items()))
+            if now - last_used < self.idle_seconds:
+                break
+            del self._entries[user_id]
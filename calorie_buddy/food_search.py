@@ -0,0 +1,159 @@
+import re
+import unicodedata
+from bisect import bisect_left
+
+
+def normalize_food_name(name):
+    """
+    Normalize a food name for matching.
+
+    Lowercases, strips accents and replaces punctuation with single spaces,
+    e.g. "Crème Brûlée (Dessert)" -> "creme brulee dessert".
+    """
+    name = unicodedata.normalize('NFKD', str(name))
+    name = ''.join(ch for ch in name if not unicodedata.combining(ch))
+    name = re.sub(r'[^a-z0-9]+', ' ', name.lower())
+    return name.strip()
+
+
+def food_aliases(name):
+    """
+    Split a catalog name into its normalized aliases.
+
+    "Beef Fillet, Beef Tenderloin" -> ["beef fillet beef tenderloin", "beef fillet", "beef tenderloin"]
+    """
+    aliases = [normalize_food_name(name)]
+    for part in str(name).split(','):
+        alias = normalize_food_name(part)
+        if alias and alias not in aliases:
+            aliases.append(alias)
+    return [alias for alias in aliases if alias]
+
+
+def _trigrams(text, pad=True):
+    """Trigrams of a normalized string, padded so name starts are indexed too."""
+    if pad:
+        text = f' {text}'
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class FoodSearchIndex:
+    """
+    In-memory typeahead index over catalog food names and their aliases.
+
+    Lookups walk three structures in rank order and stop as soon as enough
+    results are found: a sorted alias list (names starting with the query),
+    a sorted word list (any word starting with the query) and trigram
+    posting sets (the query anywhere in the name). Sorted lists are searched
+    with bisect and posting sets are intersected smallest first, so lookups
+    stay fast as the catalog grows.
+    """
+
+    def __init__(self, catalog):
+        """
+        Build the index.
+
+        Args:
+            catalog (FoodCatalog): Compact food catalog
+        """
+        self.catalog = catalog
+
+        self.aliases = []  # normalized alias text
+        self.alias_rows = []  # catalog row position for each alias
+        self.postings = {}  # trigram -> set of alias ids
+        words = []
+
+        for position, name in enumerate(catalog.names):
+            for alias in food_aliases(name):
+                alias_id = len(self.aliases)
+                self.aliases.append(alias)
+                self.alias_rows.append(position)
+
+                for trigram in _trigrams(alias):
+                    self.postings.setdefault(trigram, set()).add(alias_id)
+                for word in alias.split():
+                    words.append((word, alias_id))
+
+        sorted_aliases = sorted((alias, alias_id) for alias_id, alias in enumerate(self.aliases))
+        self.alias_keys = [alias for alias, _ in sorted_aliases]
+        self.alias_order = [alias_id for _, alias_id in sorted_aliases]
+
+        words.sort()
+        self.words = [word for word, _ in words]
+        self.word_aliases = [alias_id for _, alias_id in words]
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def search(self, query, limit=10):
+        """
+        Find foods whose name or alias contains the query.
+
+        Names starting with the query rank first, then names with a word
+        starting with the query, then any other substring match (shorter
+        names first). Foods listed more than once are returned once.
+
+        Args:
+            query (str): User-typed text
+            limit (int): Maximum number of results
+
+        Returns:
+            list: Matching catalog records (food, serving, calories, subcategory)
+        """
+        query = normalize_food_name(query)
+        if not query or limit <= 0:
+            return []
+
+        food_ids = []
+        seen_names = set()
+        for alias_id in self._ranked_candidates(query):
+            position = self.alias_rows[alias_id]
+            name_id = self.catalog.name_ids[position]
+            if name_id in seen_names:
+                continue
+            seen_names.add(name_id)
+            food_ids.append(int(self.catalog.food_ids[position]))
+            if len(food_ids) >= limit:
+                break
+
+        return self.catalog.describe(food_ids)
+
+    def _ranked_candidates(self, query):
+        """Yield alias ids matching the query, best matches first."""
+        # Aliases starting with the query
+        yield from self._prefix_range(self.alias_keys, self.alias_order, query)
+
+        # Aliases with a later word starting with the query
+        yield from self._prefix_range(self.words, self.word_aliases, query)
+
+        # Anything else containing the query (needs at least one full trigram)
+        if len(query) >= 3:
+            candidates = [
+                alias_id for alias_id in self._trigram_candidates(query)
+                if query in self.aliases[alias_id]
+            ]
+            candidates.sort(key=lambda alias_id: len(self.aliases[alias_id]))
+            yield from candidates
+
+    @staticmethod
+    def _prefix_range(keys, values, query):
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + '\uffff')
+        for i in range(start, end):
+            yield values[i]
+
+    def _trigram_candidates(self, query):
+        postings = []
+        for trigram in _trigrams(query, pad=False):
+            posting = self.postings.get(trigram)
+            if posting is None:
+                return set()
+            postings.append(posting)
+
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                break
+        return candidates
@@ -0,0 +1,157 @@
+import csv
+import io
+import json
+from itertools import islice
+
+# Column order for exported (and importable) meal plan rows
+EXPORT_FIELDS = ['date', 'diet_type', 'target_calories', 'actual_calories', 'is_saved', 'foods']
+
+# Plausible calorie range for a stored plan's target and actual totals
+MAX_PLAN_CALORIES = 10000
+
+
+def chunked(iterable, size):
+    """Yield lists of up to ``size`` items from any iterable, lazily."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def csv_chunks(rows, flush_every=500):
+    """
+    Encode plan rows as CSV, yielding text every ``flush_every`` rows.
+
+    The food list goes in one column as a JSON array so the file can be
+    imported back without losing order or commas in food names.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+
+    for count, row in enumerate(rows, 1):
+        writer.writerow(dict(row, foods=json.dumps(row['foods'])))
+        if count % flush_every == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(rows, flush_every=500):
+    """Encode plan rows as newline-delimited JSON, yielding text every ``flush_every`` rows."""
+    for batch in chunked(rows, flush_every):
+        yield ''.join(json.dumps({field: row[field] for field in EXPORT_FIELDS}) + '\n' for row in batch)
+
+
+# Export format -> (mimetype, chunk encoder)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', csv_chunks),
+    'ndjson': ('application/x-ndjson', ndjson_chunks)
+}
+
+
+def _parse_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def normalize_entry(entry):
+    """
+    Coerce an imported row to the types MealPlan expects.
+
+    Raises:
+        ValueError: If calories are not integers between 0 and MAX_PLAN_CALORIES
+                    or foods is not a list
+    """
+    foods = entry.get('foods') or []
+    if isinstance(foods, str):
+        foods = json.loads(foods)
+    if not isinstance(foods, list):
+        raise ValueError('foods must be a list')
+
+    normalized = {
+        'target_calories': int(entry.get('target_calories') or 0),
+        'diet_type': str(entry.get('diet_type') or ''),
+        'actual_calories': int(entry.get('actual_calories') or 0),
+        'is_saved': _parse_bool(entry.get('is_saved', False)),
+        'foods': [str(food) for food in foods]
+    }
+    for field in ('target_calories', 'actual_calories'):
+        if not 0 <= normalized[field] <= MAX_PLAN_CALORIES:
+            raise ValueError(f'{field} must be between 0 and {MAX_PLAN_CALORIES}')
+    if entry.get('date'):
+        normalized['date'] = str(entry['date'])
+    return normalized
+
+
+def read_entries(stream, fmt):
+    """
+    Lazily parse an uploaded CSV or NDJSON export back into plan entries.
+
+    Args:
+        stream (file): Text stream
+        fmt (str): 'csv' or 'ndjson'
+
+    Yields:
+        dict: Normalized entries (see normalize_entry)
+
+    Raises:
+        ValueError: On a malformed line, naming the line number
+    """
+    rows = csv.DictReader(stream) if fmt == 'csv' else (
+        json.loads(line) for line in stream if line.strip()
+    )
+    line = 1
+    try:
+        for line, row in enumerate(rows, 2 if fmt == 'csv' else 1):
+            yield normalize_entry(row)
+    except csv.Error as error:
+        # Quoted fields can span lines, so take the reader's own count
+        raise ValueError(f'Line {rows.reader.line_num}: {error}') from error
+    except (ValueError, TypeError, AttributeError) as error:
+        raise ValueError(f'Line {line}: {error}') from error
+
+
+def legacy_user_entries(record):
+    """
+    Convert one user from the old user.json store into plan entries.
+
+    Old history entries are 'Mixed': one generation with an actual calorie
+    total per diet and no food lists. They become one history row per diet.
+    Old saved plans ({date, type, target, actual, foods}) map one to one.
+
+    Args:
+        record (dict): The user's value in user.json
+
+    Returns:
+        list: Normalized entries, history first
+    """
+    entries = []
+    for item in record.get('meal_history', []):
+        actual = item.get('actual_calories', 0)
+        per_diet = actual if isinstance(actual, dict) else {item.get('diet_type', ''): actual}
+        for diet_type, calories in per_diet.items():
+            entries.append(normalize_entry({
+                'date': item.get('date'),
+                'diet_type': diet_type,
+                'target_calories': item.get('target_calories'),
+                'actual_calories': calories,
+                'is_saved': False
+            }))
+
+    for item in record.get('saved_plans', []):
+        entries.append(normalize_entry({
+            'date': item.get('date'),
+            'diet_type': item.get('type'),
+            'target_calories': item.get('target'),
+            'actual_calories': item.get('actual'),
+            'is_saved': True,
+            'foods': item.get('foods', [])
+        }))
+
+    return entries
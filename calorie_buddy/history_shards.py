@@ -0,0 +1,131 @@
+import hashlib
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from flask import current_app, g
+from flask_login import current_user
+from flask_sqlalchemy.session import Session
+
+# Bind key of the meal history tables when history is sharded
+HISTORY_BIND = 'history'
+
+
+def shard_bind(shard):
+    """SQLALCHEMY_BINDS key of one history shard."""
+    return f'{HISTORY_BIND}_{shard}'
+
+
+def history_binds(shards, uri_template):
+    """
+    SQLALCHEMY_BINDS entries for the history shards.
+
+    Args:
+        shards (int): Number of shard databases (0 keeps history in the main database)
+        uri_template (str): Database URI with a {shard} placeholder
+
+    Returns:
+        dict: Bind key -> database URI
+    """
+    return {shard_bind(shard): uri_template.format(shard=shard) for shard in range(shards)}
+
+
+def shard_for_user(user_id, shards):
+    """Shard holding a user's history (a stable hash, so it never changes between processes)."""
+    digest = hashlib.blake2b(str(user_id).encode('ascii'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % shards
+
+
+def _is_history_table(table):
+    return isinstance(table, sa.Table) and table.metadata.info.get('bind_key') == HISTORY_BIND
+
+
+class HistoryRoutingSession(Session):
+    """
+    Session that sends meal history statements to the current user's shard.
+
+    History models carry ``__bind_key__ = HISTORY_BIND`` but there is no
+    engine under that key: each statement goes to the shard chosen with
+    use_history_shard (once per request, see init_history_routing) or
+    history_shard. Everything else is routed as usual.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            table = sa.inspect(mapper).local_table if mapper is not None else None
+            if table is None and isinstance(clause, sa.sql.dml.UpdateBase):
+                table = clause.table
+            elif table is None:
+                table = clause
+
+            if _is_history_table(table):
+                shard = g.get('history_shard')
+                if shard is None:
+                    raise RuntimeError('Meal history was accessed before choosing a shard (see use_history_shard)')
+                return self._db.engines[shard_bind(shard)]
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_history_shard(user_id):
+    """Route meal history statements to this user's shard for the rest of the app context."""
+    shards = current_app.config['HISTORY_SHARDS']
+    if shards:
+        g.history_shard = shard_for_user(user_id, shards)
+
+
+@contextmanager
+def history_shard(user_id):
+    """Route meal history statements to this user's shard inside the block only."""
+    previous = g.get('history_shard')
+    use_history_shard(user_id)
+    try:
+        yield
+    finally:
+        g.history_shard = previous
+
+
+def each_history_shard():
+    """
+    Visit every shard for admin-wide queries.
+
+    Yields once per shard with history routed to it (once, unrouted, when
+    history isn't sharded). Users never span shards, so per-user counts can
+    be summed. Use column queries here: ORM objects from different shards
+    can share primary keys.
+    """
+    shards = current_app.config['HISTORY_SHARDS']
+    previous = g.get('history_shard')
+    try:
+        for shard in range(shards) if shards else [None]:
+            g.history_shard = shard
+            yield shard
+    finally:
+        g.history_shard = previous
+
+
+def create_history_shards(db):
+    """Create the history tables in every shard (db.create_all only covers binds that have models)."""
+    metadata = db.metadatas.get(HISTORY_BIND)
+    if metadata is None:
+        return []
+
+    engines = [db.engines[shard_bind(shard)] for shard in range(current_app.config['HISTORY_SHARDS'])]
+    for engine in engines:
+        metadata.create_all(engine)
+    return engines
+
+
+def init_history_routing(app):
+    """
+    Route each request's meal history to the logged-in user's shard.
+
+    Only installed when history is sharded, so the unsharded app doesn't
+    load the user on requests that never touch history.
+    """
+    if not app.config.get('HISTORY_SHARDS'):
+        return
+
+    @app.before_request
+    def _route_user_history():
+        if current_user.is_authenticated:
+            use_history_shard(current_user.id)
@@ -0,0 +1,249 @@
+"""
+Load-test harness for the Calorie Buddy Flask app.
+
+Starts the app on a scratch SQLite database (or targets an already running
+local instance with --url), registers synthetic users, logs them in and
+drives a weighted mix of routes from concurrent clients. Reports requests
+per second, latency percentiles and error rates per route. Uses only the
+standard library on the client side.
+
+Usage (from the directory containing calories.csv):
+    python calorie_buddy/load_test.py --users 20 --duration 30
+    python calorie_buddy/load_test.py --mix meal_planner=1,analytics=3,profile=3
+    python calorie_buddy/load_test.py --url http://127.0.0.1:5010 --users 5
+"""
+import argparse
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, build_opener
+
+# Route name -> (method, path, form data builder)
+ROUTES = {
+    'meal_planner': ('POST', '/meal_planner', lambda: {'target_calories': random.randrange(1200, 3200, 100)}),
+    'meal_planner_view': ('GET', '/meal_planner', None),
+    'analytics': ('GET', '/analytics', None),
+    'profile': ('GET', '/profile', None),
+    'weekly_planner': ('POST', '/weekly_planner', lambda: {'target_calories': random.randrange(1200, 3200, 100)}),
+    'food_search': ('GET', '/api/foods/search?q=chi', None),
+}
+
+DEFAULT_MIX = 'meal_planner=4,analytics=2,profile=2,meal_planner_view=1'
+
+
+def parse_mix(mix):
+    """Parse 'route=weight,...' into parallel (routes, weights) lists."""
+    routes, weights = [], []
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ROUTES:
+            raise ValueError(f"Unknown route '{name}' (choose from {', '.join(ROUTES)})")
+        routes.append(name)
+        weights.append(float(weight or 1))
+    return routes, weights
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class VirtualUser:
+    """One logged-in synthetic user with its own cookie jar."""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()))
+        self.username = f'load_{uuid.uuid4().hex[:12]}'
+        self.password = uuid.uuid4().hex
+
+    def request(self, method, path, data=None):
+        """Send a request and return (status, final URL); redirects are followed."""
+        body = urlencode(data).encode('utf-8') if data is not None else None
+        if method == 'POST' and body is None:
+            body = b''
+        try:
+            with self.opener.open(self.base_url + path, data=body, timeout=self.timeout) as response:
+                response.read()
+                return response.status, response.geturl()
+        except HTTPError as error:
+            error.read()
+            return error.code, error.geturl()
+
+    def sign_up(self):
+        """Register and log in; raises RuntimeError if the session isn't authenticated."""
+        self.request('POST', '/register', {
+            'username': self.username,
+            'email': f'{self.username}@example.com',
+            'password': self.password
+        })
+        status, final_url = self.request('POST', '/login', {
+            'username': self.username,
+            'password': self.password
+        })
+        if status != 200 or '/login' in final_url:
+            raise RuntimeError(f'Could not log in as {self.username} (status {status})')
+
+
+def run_user(user, routes, weights, deadline, results, lock):
+    """Drive the route mix for one user until the deadline."""
+    local = {name: {'latencies': [], 'errors': 0} for name in routes}
+
+    while time.perf_counter() < deadline:
+        name = random.choices(routes, weights)[0]
+        method, path, build_data = ROUTES[name]
+        data = build_data() if build_data else None
+
+        started = time.perf_counter()
+        try:
+            status, final_url = user.request(method, path, data)
+            # Being bounced to the login page means the session was lost
+            failed = status >= 400 or '/login' in final_url
+        except (URLError, OSError):
+            failed = True
+        elapsed = time.perf_counter() - started
+
+        local[name]['latencies'].append(elapsed)
+        if failed:
+            local[name]['errors'] += 1
+
+    with lock:
+        for name, stats in local.items():
+            results[name]['latencies'].extend(stats['latencies'])
+            results[name]['errors'] += stats['errors']
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_local_app(database_path):
+    """Start app.py in a child process on a free port and wait until it answers."""
+    port = _free_port()
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    env['CALORIE_BUDDY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    env['PYTHONPATH'] = app_dir + os.pathsep + env.get('PYTHONPATH', '')
+
+    process = subprocess.Popen(
+        [sys.executable, '-c',
+         f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True, debug=False)"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('The app exited during startup (run from the directory containing calories.csv)')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError('The app did not start within 60 seconds')
+
+
+def print_report(results, wall_seconds, users):
+    """Print per-route and overall throughput, latency percentiles and error rate."""
+    header = f"{'route':<20}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>10}"
+    print(f'\n{users} users, {wall_seconds:.1f}s')
+    print(header)
+    print('-' * len(header))
+
+    all_latencies = []
+    total_errors = 0
+    for name, stats in results.items():
+        latencies = sorted(stats['latencies'])
+        all_latencies.extend(latencies)
+        total_errors += stats['errors']
+        _print_row(name, latencies, stats['errors'], wall_seconds)
+
+    print('-' * len(header))
+    _print_row('total', sorted(all_latencies), total_errors, wall_seconds)
+
+
+def _print_row(name, latencies, errors, wall_seconds):
+    count = len(latencies)
+    error_rate = (errors / count * 100) if count else 0.0
+    print(
+        f'{name:<20}{count:>10}{count / wall_seconds:>10.1f}'
+        f'{percentile(latencies, 50) * 1000:>10.1f}{percentile(latencies, 90) * 1000:>10.1f}'
+        f'{percentile(latencies, 99) * 1000:>10.1f}{(latencies[-1] if latencies else 0) * 1000:>10.1f}'
+        f'{error_rate:>9.1f}%'
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test the Calorie Buddy app with synthetic logged-in users.')
+    parser.add_argument('--users', type=int, default=10, help='Concurrent logged-in users')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds to run the mix for')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Weighted routes, e.g. {DEFAULT_MIX}')
+    parser.add_argument('--url', help='Target an already running local app instead of starting one')
+    parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, help='Seed for the route mix and calorie targets')
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    routes, weights = parse_mix(args.mix)
+
+    process = None
+    scratch_dir = None
+    base_url = args.url.rstrip('/') if args.url else None
+    if base_url is None:
+        scratch_dir = tempfile.TemporaryDirectory(prefix='calorie_buddy_load_')
+        process, base_url = start_local_app(os.path.join(scratch_dir.name, 'load_test.db'))
+        print(f'Started app at {base_url} on a scratch database')
+
+    try:
+        users = [VirtualUser(base_url, args.timeout) for _ in range(args.users)]
+        for user in users:
+            user.sign_up()
+        print(f'Registered and logged in {len(users)} users; running for {args.duration:.0f}s')
+
+        results = {name: {'latencies': [], 'errors': 0} for name in routes}
+        lock = threading.Lock()
+        started = time.perf_counter()
+        deadline = started + args.duration
+
+        threads = [
+            threading.Thread(target=run_user, args=(user, routes, weights, deadline, results, lock), daemon=True)
+            for user in users
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        print_report(results, time.perf_counter() - started, len(users))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        if scratch_dir is not None:
+            scratch_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
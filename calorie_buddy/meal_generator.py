@@ -1,164 +1,778 @@
-import random
-import pandas as pd
+import math
+import os
+import time
+import zlib
+from functools import partial
+from itertools import combinations
 import numpy as np
+from catalog import FoodPool
+from diets import DIETS, diet_masks, meat_mask
+from pair_index import pair_indexes
+from swap_index import swap_indexes
+from metrics import (
+    GENERATION_SECONDS, GENERATION_STAGE_SECONDS, GENERATION_ATTEMPTS, GENERATION_TOLERANCE,
+    GENERATION_ERROR, GENERATION_ITERATIONS, PLAN_SWAPS, apply_changes, changes_since,
+    snapshot as metrics_snapshot
+)
 
-def generate_meal_plans(food_data, target_calories, min_calories, max_calories):
+# Plans are tuples of food ids; names are only resolved when rendering
+# (FoodCatalog.describe / CatalogView.describe).
+PLAN_SIZE = 4
+
+def seed_sequence(seed, *keys):
     """
-    Generate four meal plans based on dietary preferences.
+    Seed sequence for one independent random stream of a generation run.
+    
+    Streams are derived from the seed plus keys that name what they are for
+    (diet type, day), never from the order things run in, so a seeded run
+    gives the same plans serially or spread over processes. Diet names are
+    hashed into the key; a None seed draws fresh entropy.
     
     Args:
-        food_data (pd.DataFrame): Processed food data
+        seed (int or np.random.SeedSequence): Run seed, or a parent sequence to extend
+        *keys (str or int): Stream names appended to the parent's spawn key
+        
+    Returns:
+        np.random.SeedSequence
+    """
+    words = tuple(zlib.crc32(key.encode('utf-8')) if isinstance(key, str) else int(key) for key in keys)
+    if isinstance(seed, np.random.SeedSequence):
+        return np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + words)
+    return np.random.SeedSequence(seed, spawn_key=words)
+
+def generate_meal_plans(catalog, target_calories, min_calories, max_calories, diet_pools=None, deadline_ms=None,
+                        seed=None, executor=None, samples=None, pair_index=False, cooccurrence=None):
+    """
+    Generate one meal plan per diet based on dietary preferences.
+    
+    Args:
+        catalog (FoodCatalog): Compact food catalog
         target_calories (int): Target calories for each meal plan
         min_calories (int): Minimum calories for each meal plan
         max_calories (int): Maximum calories for each meal plan
+        diet_pools (dict): Prebuilt pools from build_diet_pools (optionally with a
+                           user's overlay merged in); built from the catalog if omitted
+        deadline_ms (float): Per-diet time budget for the anytime solver; None uses
+                             the best-of-five greedy attempts
+        seed (int): Makes the plans reproducible; None draws fresh entropy. With a
+                    deadline, plans also depend on how far the search got in time
+        executor (concurrent.futures.Executor): Generate the diets concurrently on
+                                                this executor (e.g. a process pool);
+                                                plans are the same as serially, and
+                                                metrics workers record are sent back
+                                                to this process
+        samples (int): Use the sampled solver with this many candidates per diet
+                       (takes precedence over deadline_ms)
+        pair_index (bool): Look plans up in the pool's pair-sum index first; the
+                           other solvers only run when it finds no plan
+        cooccurrence (CooccurrenceModel): Saved-plan co-occurrence counts that bias
+                                          every solver's picks
         
     Returns:
-        dict: Four meal plans (Vegetarian, Non-Vegetarian, Seafood Mix, Vegan)
+        dict: One meal plan per diet pool (every registered diet by default),
+              each a tuple of food ids
     """
-    # Initialize meal plans
-    meal_plans = {
-        "Vegetarian": [],
-        "Non-Vegetarian": [],
-        "Seafood Mix": [],
-        "Vegan": []
+    # Build the candidate pools once and pick the best of several attempts per diet
+    if diet_pools is None:
+        with GENERATION_STAGE_SECONDS.time(stage='build_pools'):
+            diet_pools = build_diet_pools(catalog)
+    
+    seed = seed_sequence(seed)
+    jobs = {
+        diet_type: (diet_type, core_foods, side_foods, meat_ratio, target_calories, min_calories,
+                    max_calories, deadline_ms, samples, pair_index, cooccurrence, seed_sequence(seed, diet_type))
+        for diet_type, (core_foods, side_foods, meat_ratio) in diet_pools.items()
     }
     
-    # Filter data for each dietary preference
-    vegetarian_foods = food_data[food_data['is_vegetarian']].copy()
-    non_vegetarian_foods = food_data[food_data['is_non_vegetarian']].copy()
-    seafood_foods = food_data[food_data['is_seafood']].copy()
-    vegan_foods = food_data[food_data['is_vegan']].copy()
+    if executor is None:
+        return {diet_type: _generate_diet_plan(*job) for diet_type, job in jobs.items()}
+    
+    futures = {diet_type: executor.submit(_run_diet_job, os.getpid(), job) for diet_type, job in jobs.items()}
+    plans = {}
+    for diet_type, future in futures.items():
+        plans[diet_type], metric_changes = future.result()
+        if metric_changes:
+            apply_changes(metric_changes)
+    return plans
+
+def _run_diet_job(parent_pid, job):
+    """
+    Run _generate_diet_plan on an executor: (plan, metric changes or None).
     
-    # For non-vegetarian and seafood plans, include vegetarian options too
-    vegetarian_base = vegetarian_foods[~vegetarian_foods['is_vegan']].copy()  # Vegetarian but not vegan
+    Workers in another process record generation metrics into their own
+    registry, so they send what they recorded back with the plan. Threads
+    share the parent's registry and send nothing.
+    """
+    if os.getpid() == parent_pid:
+        return _generate_diet_plan(*job), None
+    before = metrics_snapshot()
+    plan = _generate_diet_plan(*job)
+    return plan, changes_since(before)
+
+def _generate_diet_plan(diet_type, core_foods, side_foods, meat_ratio, target_calories, min_calories,
+                        max_calories, deadline_ms, samples, pair_index, cooccurrence, seed):
+    """One diet's plan for generate_meal_plans (module level so process pools can run it)"""
+    with GENERATION_SECONDS.time(diet=diet_type):
+        if pair_index:
+            plan, _ = generate_pair_meal_plan(
+                core_foods,
+                side_foods,
+                target_calories,
+                meat_ratio=meat_ratio,
+                diet_type=diet_type,
+                seed=seed,
+                cooccurrence=cooccurrence
+            )
+            if plan:
+                return plan
+        
+        if samples is not None:
+            plans = generate_sampled_meal_plans(
+                core_foods,
+                side_foods,
+                target_calories,
+                samples=samples,
+                meat_ratio=meat_ratio,
+                diet_type=diet_type,
+                seed=seed,
+                cooccurrence=cooccurrence
+            )
+            plan = plans[0][0] if plans else ()
+        elif deadline_ms is None:
+            plan, _ = generate_best_meal_plan(
+                core_foods,
+                side_foods,
+                target_calories,
+                min_calories,
+                max_calories,
+                meat_ratio=meat_ratio,
+                diet_type=diet_type,
+                seed=seed,
+                cooccurrence=cooccurrence
+            )
+        else:
+            plan, _, _ = generate_anytime_meal_plan(
+                core_foods,
+                side_foods,
+                target_calories,
+                deadline_ms / 1000,
+                meat_ratio=meat_ratio,
+                diet_type=diet_type,
+                seed=seed,
+                cooccurrence=cooccurrence
+            )
+    return plan
+
+def build_diet_pools(catalog):
+    """
+    Split the catalog into the candidate pools of every registered diet.
     
-    # Set the acceptable calorie tolerance (how close we want to be to target)
-    # This represents 5% deviation from target in either direction
-    tolerance = 0.05
-    max_attempts = 5  # Try up to 5 times to get a better plan
+    Diets with side foods (see diets.DIETS; the meat-based ones draw a
+    random 70% of the vegetarian but not vegan foods on every attempt) get
+    a (core, side) pair of pools.
     
-    # Generate multiple vegetarian plans and pick the best one
-    best_vegetarian_plan = []
-    best_vegetarian_diff = float('inf')
+    Args:
+        catalog (FoodCatalog): Compact food catalog
+        
+    Returns:
+        dict: Diet type -> (core FoodPool, side FoodPool or None, meat ratio),
+              in registry order
+    """
+    diet_pools = {}
+    for diet_type, diet in DIETS.items():
+        core_mask, side_mask = diet_masks(catalog.diet_bits, diet_type)
+        side_foods = None if side_mask is None else catalog.pool(side_mask)
+        diet_pools[diet_type] = (catalog.pool(core_mask), side_foods, diet['meat_ratio'])
+    return diet_pools
+
+def generate_best_meal_plan(core_foods, side_foods, target_calories, min_calories, max_calories,
+                            meat_ratio=0.0, max_attempts=5, tolerance=0.05, diet_type='unknown', seed=None,
+                            cooccurrence=None):
+    """
+    Generate several meal plans from a diet pool and keep the closest one.
+    
+    Args:
+        core_foods (FoodPool): Foods always available to the diet
+        side_foods (FoodPool): Foods sampled (70%) into the pool on each attempt, or None
+        target_calories (int): Target calories for the meal plan
+        min_calories (int): Minimum calories for the meal plan
+        max_calories (int): Maximum calories for the meal plan
+        meat_ratio (float): Ratio of calories that should come from meat/seafood
+        max_attempts (int): Number of plans to try before giving up
+        tolerance (float): Stop early once a plan is within this fraction of the target
+        diet_type (str): Diet label used for metrics
+        seed (int or np.random.SeedSequence): Seed for reproducible plans (each
+                                              attempt gets its own stream)
+        cooccurrence (CooccurrenceModel): Biases picks towards foods saved together
+        
+    Returns:
+        tuple: (food ids of the best plan found, its total calories); the plan
+               is empty if none could be built
+    """
+    seed = seed_sequence(seed)
+    best_plan = ()
+    best_total = 0
+    best_diff = float('inf')
+    attempts = 0
     
     for _ in range(max_attempts):
-        plan = generate_balanced_meal_plan(
-            vegetarian_foods, 
-            target_calories, 
-            min_calories, 
-            max_calories
-        )
+        attempts += 1
+        rng = np.random.default_rng(seed.spawn(1)[0])  # The nth attempt always gets the nth child stream
+        if side_foods is None:
+            pool = core_foods
+        else:
+            pool = FoodPool.concat([core_foods, side_foods.sample(frac=0.7, rng=rng)])
         
-        if plan:
-            total_cals = sum(item['calories'] for item in plan)
+        with GENERATION_STAGE_SECONDS.time(stage='balanced_plan'):
+            positions = _balanced_plan_positions(pool, target_calories, meat_ratio, rng, cooccurrence)
+        
+        if positions:
+            total_cals = int(pool.calories[positions].sum())
             diff = abs(total_cals - target_calories)
             
-            if diff < best_vegetarian_diff:
-                best_vegetarian_diff = diff
-                best_vegetarian_plan = plan
+            if diff < best_diff:
+                best_diff = diff
+                best_plan = tuple(int(food_id) for food_id in pool.ids[positions])
+                best_total = total_cals
                 
                 # If we're within tolerance, stop trying
                 if diff <= target_calories * tolerance:
                     break
     
-    # Generate multiple non-vegetarian plans and pick the best one
-    best_non_veg_plan = []
-    best_non_veg_diff = float('inf')
+    GENERATION_ATTEMPTS.observe(attempts, diet=diet_type)
+    _record_plan_error(best_plan, best_total, target_calories, tolerance, diet_type, 'greedy')
     
-    for _ in range(max_attempts):
-        plan = generate_balanced_meal_plan(
-            pd.concat([non_vegetarian_foods, vegetarian_base.sample(frac=0.7)]), 
-            target_calories, 
-            min_calories, 
-            max_calories,
-            meat_ratio=0.4  # 40% of calories from meat
-        )
+    return best_plan, best_total
+
+def generate_anytime_meal_plan(core_foods, side_foods, target_calories, time_budget,
+                               meat_ratio=0.0, tolerance=0.05, diet_type='unknown', seed=None, cooccurrence=None):
+    """
+    Build one greedy plan, then improve it by local search until a deadline.
+    
+    The greedy plan seeds a simulated annealing walk over single-item swaps;
+    the best plan seen is returned when the time budget runs out (or as soon
+    as a plan hits the target exactly).
+    
+    Args:
+        core_foods (FoodPool): Foods always available to the diet
+        side_foods (FoodPool): Foods sampled (70%) into the pool, or None
+        target_calories (int): Target calories for the meal plan
+        time_budget (float): Seconds to spend, including the greedy seed
+        meat_ratio (float): Ratio of calories that should come from meat/seafood
+        tolerance (float): Fraction of the target counted as a hit in metrics
+        diet_type (str): Diet label used for metrics
+        seed (int or np.random.SeedSequence): Seed for the random choices; the
+                                              result also depends on how many
+                                              moves fit in the time budget
+        cooccurrence (CooccurrenceModel): Biases the greedy seed plan's picks
         
-        if plan:
-            total_cals = sum(item['calories'] for item in plan)
-            diff = abs(total_cals - target_calories)
-            
-            if diff < best_non_veg_diff:
-                best_non_veg_diff = diff
-                best_non_veg_plan = plan
-                
-                if diff <= target_calories * tolerance:
-                    break
+    Returns:
+        tuple: (food ids of the best plan, its total calories, relative error
+               |total - target| / target reached); the plan is empty if none
+               could be built
+    """
+    deadline = time.perf_counter() + time_budget
+    rng = np.random.default_rng(seed_sequence(seed))
     
-    # Generate multiple seafood plans and pick the best one
-    best_seafood_plan = []
-    best_seafood_diff = float('inf')
+    if side_foods is None:
+        pool = core_foods
+    else:
+        pool = FoodPool.concat([core_foods, side_foods.sample(frac=0.7, rng=rng)])
     
-    for _ in range(max_attempts):
-        plan = generate_balanced_meal_plan(
-            pd.concat([seafood_foods, vegetarian_base.sample(frac=0.7)]), 
-            target_calories, 
-            min_calories, 
-            max_calories,
-            meat_ratio=0.35  # 35% of calories from seafood
-        )
+    with GENERATION_STAGE_SECONDS.time(stage='balanced_plan'):
+        positions = _balanced_plan_positions(pool, target_calories, meat_ratio, rng, cooccurrence)
+    
+    if positions:
+        with GENERATION_STAGE_SECONDS.time(stage='local_search'):
+            positions, iterations = _anneal_plan(pool, positions, target_calories, meat_ratio, deadline, rng)
+        GENERATION_ITERATIONS.observe(iterations, diet=diet_type)
+    
+    plan = tuple(int(food_id) for food_id in pool.ids[positions])
+    total = int(pool.calories[positions].sum()) if positions else 0
+    error = _record_plan_error(plan, total, target_calories, tolerance, diet_type, 'anytime')
+    
+    return plan, total, error
+
+# Greedy picks: a food saved with the plan so far can be up to this fraction
+# of the target further from the ideal calories and still be preferred (the
+# sampled and pair-index solvers weigh whole plans' foods saved together alike)
+AFFINITY_WEIGHT = 0.05
+
+# Sampled solver scoring: penalty per subcategory a plan is short of PLAN_SIZE
+# (as a fraction of the target) and weight of the meat calorie shortfall/excess
+DIVERSITY_PENALTY = 0.05
+MEAT_SHARE_WEIGHT = 0.25
+
+def generate_sampled_meal_plans(core_foods, side_foods, target_calories, samples=4096, top_k=1,
+                                meat_ratio=0.0, tolerance=0.05, diet_type='unknown', seed=None,
+                                cooccurrence=None):
+    """
+    Draw many candidate plans at once and return the best scoring ones.
+    
+    Candidates are a (samples x 4) matrix of pool positions: each row picks
+    distinct subcategories and one food in each (two meat and two other
+    items for meat-based diets). All rows are scored together on calorie
+    error, subcategory variety, how often their foods were saved together
+    and, for meat-based diets, how far meat calories are from the meat
+    ratio; rows repeating a food are discarded. Asking for more
+    alternatives (top_k) costs about the same as asking for one.
+    
+    Args:
+        core_foods (FoodPool): Foods always available to the diet
+        side_foods (FoodPool): Extra foods available to the diet, or None
+        target_calories (int): Target calories for the meal plan
+        samples (int): Candidate plans to draw
+        top_k (int): Number of distinct plans to return
+        meat_ratio (float): Ratio of calories that should come from meat/seafood
+        tolerance (float): Fraction of the target counted as a hit in metrics
+        diet_type (str): Diet label used for metrics
+        seed (int or np.random.SeedSequence): Seed for reproducible plans
+        cooccurrence (CooccurrenceModel): Favours plans of foods saved together
         
-        if plan:
-            total_cals = sum(item['calories'] for item in plan)
-            diff = abs(total_cals - target_calories)
-            
-            if diff < best_seafood_diff:
-                best_seafood_diff = diff
-                best_seafood_plan = plan
-                
-                if diff <= target_calories * tolerance:
-                    break
+    Returns:
+        list: Up to top_k (food ids, total calories) pairs, best first; empty
+              if the pool can't make a plan
+    """
+    rng = np.random.default_rng(seed_sequence(seed))
+    pool = core_foods if side_foods is None else FoodPool.concat([core_foods, side_foods])
+    meat = _meat_mask(pool, meat_ratio)
     
-    # Generate multiple vegan plans and pick the best one
-    best_vegan_plan = []
-    best_vegan_diff = float('inf')
+    with GENERATION_STAGE_SECONDS.time(stage='sample_candidates'):
+        candidates = _sample_candidates(pool, samples, meat, rng)
     
-    for _ in range(max_attempts):
-        plan = generate_balanced_meal_plan(
-            vegan_foods, 
-            target_calories, 
-            min_calories, 
-            max_calories
-        )
+    plans = []
+    if candidates is not None:
+        with GENERATION_STAGE_SECONDS.time(stage='score_candidates'):
+            scores, totals = _score_candidates(pool, candidates, target_calories, meat_ratio, meat)
+            if cooccurrence is not None and len(cooccurrence):
+                scores -= _affinity_bonus(pool, candidates, target_calories, cooccurrence)
+            best = _top_distinct(candidates, scores, top_k)
+        plans = [(tuple(int(food_id) for food_id in pool.ids[candidates[row]]), int(totals[row])) for row in best]
+    
+    best_plan, best_total = plans[0] if plans else ((), 0)
+    _record_plan_error(best_plan, best_total, target_calories, tolerance, diet_type, 'sampled')
+    return plans
+
+def generate_pair_meal_plan(core_foods, side_foods, target_calories, meat_ratio=0.0, tolerance=0.05,
+                            diet_type='unknown', seed=None, cooccurrence=None):
+    """
+    Look up a plan in the pool's pair-sum index.
+    
+    A plan is two pairs of foods: random anchor pairs near the meat share
+    (or half) of the target are each completed by binary search for the pair
+    making up the rest, and the closest plan with four distinct subcategories
+    (allowing for foods saved together) wins. The index is built once per
+    distinct pool and cached, so a lookup costs a few binary searches
+    instead of repeated attempts.
+    
+    Args:
+        core_foods (FoodPool): Foods always available to the diet
+        side_foods (FoodPool): Extra foods available to the diet, or None
+        target_calories (int): Target calories for the meal plan
+        meat_ratio (float): Ratio of calories that should come from meat/seafood
+        tolerance (float): Fraction of the target counted as a hit in metrics
+        diet_type (str): Diet label used for metrics
+        seed (int or np.random.SeedSequence): Seed for the anchor choices
+        cooccurrence (CooccurrenceModel): Favours plans of foods saved together
         
-        if plan:
-            total_cals = sum(item['calories'] for item in plan)
-            diff = abs(total_cals - target_calories)
+    Returns:
+        tuple: (food ids of the plan, its total calories); the plan is empty if
+               the pool is too large to index or has no four-subcategory plan
+    """
+    rng = np.random.default_rng(seed_sequence(seed))
+    pool = core_foods if side_foods is None else FoodPool.concat([core_foods, side_foods])
+    
+    with GENERATION_STAGE_SECONDS.time(stage='pair_index'):
+        index = pair_indexes.get(pool, _meat_mask(pool, meat_ratio))
+    
+    bonus = None
+    if cooccurrence is not None and len(cooccurrence):
+        bonus = partial(_affinity_bonus, pool, target_calories=target_calories, cooccurrence=cooccurrence)
+    
+    found = None
+    if index is not None:
+        with GENERATION_STAGE_SECONDS.time(stage='pair_lookup'):
+            found = index.lookup(target_calories, target_calories * (meat_ratio or 0.5), rng, bonus=bonus)
+    
+    plan, total = ((), 0) if found is None else (tuple(int(food_id) for food_id in pool.ids[found[0]]), found[1])
+    _record_plan_error(plan, total, target_calories, tolerance, diet_type, 'pair_index')
+    return plan, total
+
+def swap_plan_item(core_foods, side_foods, meat_ratio, plan, slot, target_calories, tolerance=0.05, avoid=()):
+    """
+    Replace one item of a plan without generating a new one.
+    
+    The replacement comes from the diet's swap index (see SwapIndex.replacement):
+    a food not already in the plan, from the replaced item's subcategory when
+    one keeps the total within tolerance of the target.
+    
+    Args:
+        core_foods (FoodPool): Foods always available to the diet
+        side_foods (FoodPool): Extra foods available to the diet, or None
+        meat_ratio (float): Ratio of calories that should come from meat/seafood
+        plan (tuple): Food ids of the plan
+        slot (int): Index of the item to replace
+        target_calories (int): Target calories for the meal plan
+        tolerance (float): Allowed distance from the target, as a fraction of it
+        avoid (iterable): Food ids never to swap in
+        
+    Returns:
+        tuple: (food ids of the new plan, its total calories), or None if the
+               plan has foods the pool no longer holds or nothing fits
+    """
+    with GENERATION_STAGE_SECONDS.time(stage='swap_item'):
+        pool = core_foods if side_foods is None else FoodPool.concat([core_foods, side_foods])
+        index = swap_indexes.get(pool, _meat_mask(pool, meat_ratio))
+        positions = index.positions(plan)
+        found = None
+        if positions is not None and 0 <= slot < len(positions):
+            found = index.replacement(positions, slot, target_calories, tolerance, avoid)
+    
+    PLAN_SWAPS.inc(result='swapped' if found is not None else 'none')
+    if found is None:
+        return None
+    
+    position, total = found
+    new_plan = list(plan)
+    new_plan[slot] = int(pool.ids[position])
+    return tuple(new_plan), total
+
+def build_pair_indexes(diet_pools):
+    """Build (and cache) the pair-sum index of every diet pool so first lookups don't wait for it"""
+    for core_foods, side_foods, meat_ratio in diet_pools.values():
+        pool = core_foods if side_foods is None else FoodPool.concat([core_foods, side_foods])
+        pair_indexes.get(pool, _meat_mask(pool, meat_ratio))
+
+def _meat_mask(pool, meat_ratio):
+    """Foods counted as meat for a meat-ratio diet (seafood when the pool has any), or None"""
+    if meat_ratio <= 0:
+        return None
+    return meat_mask(pool.diet_bits)
+
+def _subcategory_groups(pool, mask):
+    """Positions within mask grouped by subcategory: (positions, group starts, group sizes)."""
+    positions = np.flatnonzero(mask)
+    positions = positions[np.argsort(pool.subcategories[positions], kind='stable')]
+    _, starts, counts = np.unique(pool.subcategories[positions], return_index=True, return_counts=True)
+    return positions, starts, counts
+
+def _draw_from_groups(groups, samples, slots, rng):
+    """(samples x slots) positions, one food from each of `slots` distinct groups per row (repeating groups only if there are too few)."""
+    positions, starts, counts = groups
+    if len(counts) >= slots:
+        chosen = np.argpartition(rng.random((samples, len(counts))), slots - 1, axis=1)[:, :slots]
+    else:
+        chosen = rng.integers(len(counts), size=(samples, slots))
+    offsets = (rng.random((samples, slots)) * counts[chosen]).astype(np.int64)
+    return positions[starts[chosen] + offsets]
+
+def _sample_candidates(pool, samples, meat, rng):
+    """Candidate matrix for generate_sampled_meal_plans, or None if the pool can't make a plan."""
+    if len(pool) == 0 or len(np.unique(pool.subcategories)) < 3:
+        return None
+    
+    if meat is not None and meat.any() and not meat.all():
+        meat_items = _draw_from_groups(_subcategory_groups(pool, meat), samples, 2, rng)
+        other_items = _draw_from_groups(_subcategory_groups(pool, ~meat), samples, PLAN_SIZE - 2, rng)
+        return np.hstack([meat_items, other_items])
+    
+    return _draw_from_groups(_subcategory_groups(pool, np.ones(len(pool), dtype=bool)), samples, PLAN_SIZE, rng)
+
+def _score_candidates(pool, candidates, target_calories, meat_ratio, meat):
+    """Scores (lower is better, inf for rows repeating a food) and calorie totals of every candidate."""
+    calories = pool.calories.astype(np.int64)[candidates]
+    totals = calories.sum(axis=1)
+    scores = np.abs(totals - target_calories).astype(np.float64)
+    
+    subcategories = np.sort(pool.subcategories[candidates], axis=1)
+    distinct = 1 + (np.diff(subcategories, axis=1) != 0).sum(axis=1)
+    scores += (PLAN_SIZE - distinct) * target_calories * DIVERSITY_PENALTY
+    
+    if meat is not None:
+        meat_calories = (calories * meat[candidates]).sum(axis=1)
+        scores += np.abs(meat_calories - target_calories * meat_ratio) * MEAT_SHARE_WEIGHT
+    
+    names = np.sort(pool.name_ids[candidates], axis=1)
+    scores[(np.diff(names, axis=1) == 0).any(axis=1)] = np.inf
+    return scores, totals
+
+def _affinity_bonus(pool, candidates, target_calories, cooccurrence):
+    """
+    Calories of fit each candidate plan may give up for its foods having been
+    saved together (summed over every pair of its foods, see AFFINITY_WEIGHT).
+    """
+    # Only foods that were ever saved can pair up, so the count matrix stays small
+    saved = np.unique(candidates)
+    saved = saved[cooccurrence.affinity(pool.ids[saved]) > 0]
+    affinity = np.zeros(len(candidates))
+    if len(saved) == 0:
+        return affinity
+    
+    counts = np.stack([cooccurrence.affinity(pool.ids[saved], [food_id]) for food_id in pool.ids[saved]])
+    rows = np.full(len(pool), -1)
+    rows[saved] = np.arange(len(saved))
+    rows = rows[candidates]
+    for first, second in combinations(range(candidates.shape[1]), 2):
+        both = (rows[:, first] >= 0) & (rows[:, second] >= 0)
+        affinity[both] += counts[rows[both, first], rows[both, second]]
+    return target_calories * AFFINITY_WEIGHT * affinity / (affinity + 1)
+
+def _top_distinct(candidates, scores, top_k):
+    """Rows of the top_k best scoring distinct plans (the same foods in another order count once)."""
+    ranked = np.flatnonzero(np.isfinite(scores))
+    shortlist = max(64, top_k * 8)  # Room for duplicates without sorting every row
+    if len(ranked) > shortlist:
+        ranked = ranked[np.argpartition(scores[ranked], shortlist - 1)[:shortlist]]
+    ranked = ranked[np.argsort(scores[ranked], kind='stable')]
+    _, first = np.unique(np.sort(candidates[ranked], axis=1), axis=0, return_index=True)
+    return ranked[np.sort(first)[:top_k]]
+
+def _record_plan_error(plan, total, target_calories, tolerance, diet_type, solver):
+    """Record hit/miss and relative error metrics for a returned plan; returns the error"""
+    error = abs(total - target_calories) / target_calories if plan and target_calories > 0 else 1.0
+    GENERATION_TOLERANCE.inc(diet=diet_type, result='hit' if error <= tolerance else 'miss')
+    GENERATION_ERROR.observe(error, diet=diet_type, solver=solver)
+    return error
+
+def _anneal_plan(pool, positions, target_calories, meat_ratio, deadline, rng):
+    """
+    Simulated annealing over single-item swaps, until the deadline.
+    
+    A move replaces one plan item with another food whose calories are
+    within the current temperature of what the plan needs. Swaps never
+    repeat a food, never reduce the number of subcategories in the plan and,
+    for meat-based diets, keep meat items swapping with meat items. The
+    temperature cools linearly from 5% of the target to 1 calorie.
+    
+    Returns:
+        tuple: (best positions found, number of moves tried)
+    """
+    calories = pool.calories.astype(np.int64)
+    meat = _meat_mask(pool, meat_ratio)
+    
+    plan = list(positions)
+    total = int(calories[plan].sum())
+    best_plan, best_diff = list(plan), abs(total - target_calories)
+    
+    start = time.perf_counter()
+    budget = max(deadline - start, 1e-9)
+    initial_temperature = max(1.0, target_calories * 0.05)
+    iterations = 0
+    
+    while best_diff > 0:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        iterations += 1
+        temperature = max(1.0, initial_temperature * (deadline - now) / budget)
+        
+        slot = int(rng.integers(len(plan)))
+        old = plan[slot]
+        others = plan[:slot] + plan[slot + 1:]
+        
+        eligible = ~np.isin(pool.name_ids, pool.name_ids[plan])
+        eligible &= (pool.subcategories == pool.subcategories[old]) | ~np.isin(pool.subcategories, pool.subcategories[others])
+        if meat is not None:
+            eligible &= meat == meat[old]
+        if not eligible.any():
+            continue
+        
+        # Propose a food near what the plan needs in this slot
+        needed = target_calories - (total - int(calories[old]))
+        near = eligible & (np.abs(calories - needed) <= temperature)
+        if near.any():
+            candidate = int(rng.choice(np.flatnonzero(near)))
+        else:
+            candidate = _closest_calories(calories, eligible, needed)
+        
+        new_total = total - int(calories[old]) + int(calories[candidate])
+        delta = abs(new_total - target_calories) - abs(total - target_calories)
+        if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+            plan[slot] = candidate
+            total = new_total
+            if abs(total - target_calories) < best_diff:
+                best_plan, best_diff = list(plan), abs(total - target_calories)
+    
+    return best_plan, iterations
+
+def generate_weekly_meal_plans(catalog, target_calories, min_calories, max_calories,
+                               diet_types=None, days=7, diet_pools=None, seed=None):
+    """
+    Generate a week of meal plans in one pass, without repeating foods.
+    
+    Each diet keeps a running mask of the foods it has already used this week
+    and of the subcategories used the previous day. Every day is generated
+    from the pool that is still available, so repeats are never produced and
+    no plan has to be thrown away and retried.
+    
+    Args:
+        catalog (FoodCatalog): Compact food catalog
+        target_calories (int): Target calories for each daily plan
+        min_calories (int): Minimum calories for each daily plan
+        max_calories (int): Maximum calories for each daily plan
+        diet_types (list): Diets to plan for (defaults to every registered diet)
+        days (int): Number of days to plan
+        diet_pools (dict): Prebuilt pools from build_diet_pools; built from the catalog if omitted
+        seed (int): Makes the week reproducible (each diet and day gets its own
+                    stream); None draws fresh entropy
+        
+    Returns:
+        dict: 'days' (list of {'day', 'plans', 'total_calories'}, plans being
+              tuples of food ids) and 'weekly_totals' (diet type -> calories
+              for the whole week)
+    
+    Raises:
+        ValueError: If a diet type has no pool
+    """
+    if diet_pools is None:
+        diet_pools = build_diet_pools(catalog)
+    if diet_types is None:
+        diet_types = list(diet_pools.keys())
+    unknown = [diet_type for diet_type in diet_types if diet_type not in diet_pools]
+    if unknown:
+        raise ValueError(f"Unknown diet type(s): {', '.join(map(str, unknown))} (choose from {', '.join(diet_pools)})")
+    
+    seed = seed_sequence(seed)
+    week = [{'day': day + 1, 'plans': {}, 'total_calories': {}} for day in range(days)]
+    weekly_totals = {}
+    
+    for diet_type in diet_types:
+        core_foods, side_foods, meat_ratio = diet_pools[diet_type]
+        
+        # Incremental state: foods still unused this week, and yesterday's subcategories
+        core_available = np.ones(len(core_foods), dtype=bool)
+        side_available = np.ones(len(side_foods), dtype=bool) if side_foods is not None else None
+        previous_subcategories = np.empty(0, dtype=np.int16)
+        weekly_totals[diet_type] = 0
+        
+        for day_plan in week:
+            core_pool, side_pool = _rotate_subcategories(
+                core_foods.subset(core_available),
+                None if side_foods is None else side_foods.subset(side_available),
+                previous_subcategories,
+                meat_ratio
+            )
             
-            if diff < best_vegan_diff:
-                best_vegan_diff = diff
-                best_vegan_plan = plan
-                
-                if diff <= target_calories * tolerance:
-                    break
+            plan, day_total = generate_best_meal_plan(
+                core_pool,
+                side_pool,
+                target_calories,
+                min_calories,
+                max_calories,
+                meat_ratio=meat_ratio,
+                diet_type=diet_type,
+                seed=seed_sequence(seed, diet_type, day_plan['day'])
+            )
+            
+            # Retire the chosen foods (under any subcategory) for the rest of the week
+            in_core = np.isin(core_foods.ids, plan)
+            day_names = core_foods.name_ids[in_core]
+            day_subcategories = core_foods.subcategories[in_core]
+            if side_foods is not None:
+                in_side = np.isin(side_foods.ids, plan)
+                day_names = np.concatenate([day_names, side_foods.name_ids[in_side]])
+                day_subcategories = np.concatenate([day_subcategories, side_foods.subcategories[in_side]])
+                side_available &= ~np.isin(side_foods.name_ids, day_names)
+            core_available &= ~np.isin(core_foods.name_ids, day_names)
+            previous_subcategories = day_subcategories
+            
+            day_plan['plans'][diet_type] = plan
+            day_plan['total_calories'][diet_type] = day_total
+            weekly_totals[diet_type] += day_total
+    
+    return {'days': week, 'weekly_totals': weekly_totals}
+
+def _rotate_subcategories(core_pool, side_pool, previous_subcategories, meat_ratio):
+    """
+    Drop yesterday's subcategories from a diet's pools when a full plan still fits.
     
-    # Update meal plans with the best ones found
-    meal_plans["Vegetarian"] = best_vegetarian_plan
-    meal_plans["Non-Vegetarian"] = best_non_veg_plan
-    meal_plans["Seafood Mix"] = best_seafood_plan
-    meal_plans["Vegan"] = best_vegan_plan
+    Falls back to the unrotated pools unless the rotated ones (together) still
+    hold PLAN_SIZE subcategories, so every item can come from its own, and,
+    for a meat-based diet, meat/seafood plus non-meat foods of at least two
+    subcategories.
     
-    return meal_plans
+    Returns:
+        tuple: (core FoodPool, side FoodPool or None)
+    """
+    if len(previous_subcategories) == 0:
+        return core_pool, side_pool
+    
+    def rotate(pool):
+        return pool.subset(~np.isin(pool.subcategories, previous_subcategories))
+    
+    rotated_core = rotate(core_pool)
+    rotated_side = None if side_pool is None else rotate(side_pool)
+    rotated = rotated_core if rotated_side is None else FoodPool.concat([rotated_core, rotated_side])
+    if len(np.unique(rotated.subcategories)) < PLAN_SIZE:
+        return core_pool, side_pool
+    if meat_ratio > 0:
+        meat = meat_mask(rotated.diet_bits)
+        if not meat.any() or len(np.unique(rotated.subcategories[~meat])) < 2:
+            return core_pool, side_pool
+    
+    return rotated_core, rotated_side
 
-def generate_balanced_meal_plan(foods_df, target_calories, min_calories, max_calories, meat_ratio=0.0):
+def generate_balanced_meal_plan(pool, target_calories, min_calories, max_calories, meat_ratio=0.0, seed=None):
     """
     Generate a balanced meal plan from the given food options.
     
     Args:
-        foods_df (pd.DataFrame): Foods to choose from
+        pool (FoodPool): Foods to choose from
         target_calories (int): Target calories for the meal plan
         min_calories (int): Minimum calories for the meal plan (not used in new algorithm)
         max_calories (int): Maximum calories for the meal plan (not used in new algorithm)
         meat_ratio (float): Ratio of calories that should come from meat/seafood
+        seed (int or np.random.SeedSequence): Seed for reproducible choices
         
     Returns:
-        list: Selected food items for the meal plan
+        tuple: Food ids of the selected items
+    """
+    positions = _balanced_plan_positions(pool, target_calories, meat_ratio, np.random.default_rng(seed_sequence(seed)))
+    return tuple(int(food_id) for food_id in pool.ids[positions])
+
+def _unique_in_order(values):
+    """Distinct values in order of first appearance (like pandas' unique)."""
+    _, first = np.unique(values, return_index=True)
+    return [values[i] for i in np.sort(first)]
+
+def _lowest_calories(calories, mask, count=5):
+    """Mask of the `count` lowest-calorie rows within mask."""
+    positions = np.flatnonzero(mask)
+    lowest = positions[np.argsort(calories[positions], kind='stable')[:count]]
+    result = np.zeros(len(mask), dtype=bool)
+    result[lowest] = True
+    return result
+
+def _closest_calories(calories, mask, target, bonus=None):
+    """Position of the row within mask whose calories are closest to target (less any bonus calories)."""
+    positions = np.flatnonzero(mask)
+    distance = np.abs(calories[positions] - target)
+    if bonus is not None:
+        distance = distance - bonus[positions]
+    return int(positions[np.argmin(distance)])
+
+def _sample(rng, values, count):
+    """`count` distinct items of a list, in random order (like random.sample)."""
+    return [values[i] for i in rng.choice(len(values), size=count, replace=False)]
+
+def _balanced_plan_positions(pool, target_calories, meat_ratio, rng, cooccurrence=None):
+    """
+    Pick up to four foods from a pool and return their positions.
+    
+    Works on boolean masks over the pool's arrays; a food is never picked
+    twice (even if it is listed under two subcategories). Every random
+    choice is drawn from rng. With a co-occurrence model, foods often saved
+    (first) or saved with the foods picked so far win over foods whose
+    calories fit only slightly better (see AFFINITY_WEIGHT).
     """
-    if foods_df.empty:
+    if len(pool) == 0:
         return []
     
+    calories = pool.calories.astype(np.int64)
+    subcats = pool.subcategories
+    
     # Ensure we have a variety of subcategories
-    subcategories = foods_df['subcategory'].unique()
+    subcategories = _unique_in_order(subcats)
     
     # If fewer than 3 subcategories available, return empty plan
     if len(subcategories) < 3:
@@ -166,32 +780,46 @@ def generate_balanced_meal_plan(foods_df, target_calories, min_calories, max_cal
     
     # Initialize meal plan
     meal_plan = []
+    taken = np.zeros(len(pool), dtype=bool)  # rows whose food is already in the plan
     remaining_calories = target_calories  # Start with full target calories
     used_subcategories = set()
     
+    # Co-occurrence counts with the plan so far (save counts before the first pick)
+    affinity = cooccurrence.affinity(pool.ids) if cooccurrence is not None and len(cooccurrence) else None
+    
+    def add(position):
+        nonlocal remaining_calories
+        meal_plan.append(position)
+        taken[pool.name_ids == pool.name_ids[position]] = True
+        remaining_calories -= int(calories[position])
+        used_subcategories.add(subcats[position])
+        if affinity is not None:
+            affinity[:] += cooccurrence.affinity(pool.ids, [pool.ids[position]])
+    
+    def bonus():
+        """Calories of fit a food may give up for its affinity, or None without a model"""
+        if affinity is None:
+            return None
+        return target_calories * AFFINITY_WEIGHT * affinity / (affinity + 1)
+    
     # Special handling for non-vegetarian/seafood meal plans
     if meat_ratio > 0:
         # Identify meat/seafood items
-        if 'is_seafood' in foods_df.columns and foods_df['is_seafood'].any():
-            meat_items = foods_df[foods_df['is_seafood']].copy()
-        else:
-            meat_items = foods_df[foods_df['is_non_vegetarian']].copy()
+        meat_items = meat_mask(pool.diet_bits)
         
         # Non-meat items
-        non_meat_items = foods_df[~foods_df.index.isin(meat_items.index)].copy()
+        non_meat_items = ~meat_items
         
         # Calculate target calories for meat/seafood
         meat_target_calories = int(target_calories * meat_ratio)
         
-        # Get unique subcategories for meat items
-        meat_subcategories = meat_items['subcategory'].unique()
-        
         # Ensure we choose from different meat subcategories if possible
+        meat_subcategories = _unique_in_order(subcats[meat_items])
         if len(meat_subcategories) >= 2:
-            chosen_meat_subcats = random.sample(list(meat_subcategories), min(2, len(meat_subcategories)))
-            meat_items_filtered = meat_items[meat_items['subcategory'].isin(chosen_meat_subcats)]
+            chosen_meat_subcats = _sample(rng, meat_subcategories, 2)
+            meat_items_filtered = meat_items & np.isin(subcats, chosen_meat_subcats)
             
-            if not meat_items_filtered.empty:
+            if meat_items_filtered.any():
                 meat_items = meat_items_filtered
         
         # Choose meat items that together approach the meat target calories
@@ -200,108 +828,74 @@ def generate_balanced_meal_plan(foods_df, target_calories, min_calories, max_cal
         max_meat_items = 2  # Limit to 2 meat items
         
         # Filter for reasonable meat items (not too high in calories)
-        reasonable_meat_items = meat_items[meat_items['calories'] < (meat_target_calories * 0.7)].copy()
-        if reasonable_meat_items.empty:
-            reasonable_meat_items = meat_items.copy()
+        reasonable_meat_items = meat_items & (calories < meat_target_calories * 0.7)
+        if not reasonable_meat_items.any():
+            reasonable_meat_items = meat_items
         
         while remaining_meat_calories > 0 and meat_count < max_meat_items:
             # Find a meat item close to remaining calories
-            suitable_items = reasonable_meat_items[reasonable_meat_items['calories'] <= remaining_meat_calories]
+            suitable_items = reasonable_meat_items & (calories <= remaining_meat_calories)
             
-            if suitable_items.empty:
+            if not suitable_items.any():
                 # If no items fit, take the one with lowest calories
-                suitable_items = reasonable_meat_items.sort_values('calories').head(5)
+                suitable_items = _lowest_calories(calories, reasonable_meat_items)
             
             # Exclude already selected foods
-            suitable_items = suitable_items[~suitable_items['food'].isin([item['food'] for item in meal_plan])]
+            suitable_items &= ~taken
             
-            if suitable_items.empty:
+            if not suitable_items.any():
                 break
-                
-            # Select item
-            selected_food = suitable_items.sample(1).iloc[0]
-            
-            # Add to meal plan
-            meal_plan.append({
-                'subcategory': selected_food['subcategory'],
-                'food': selected_food['food'],
-                'serving': selected_food['serving'],
-                'calories': selected_food['calories']
-            })
             
-            # Update tracking variables
-            remaining_meat_calories -= selected_food['calories']
-            remaining_calories -= selected_food['calories']
-            used_subcategories.add(selected_food['subcategory'])
+            # Select item (weighted towards foods saved with the plan so far)
+            candidates = np.flatnonzero(suitable_items)
+            if affinity is not None and affinity[candidates].any():
+                weights = 1 + affinity[candidates]
+                selected = int(rng.choice(candidates, p=weights / weights.sum()))
+            else:
+                selected = int(rng.choice(candidates))
+            remaining_meat_calories -= int(calories[selected])
+            add(selected)
             meat_count += 1
         
         # Now add non-meat items to complete the meal plan
-        available_subcats = [subcat for subcat in non_meat_items['subcategory'].unique() 
-                            if subcat not in used_subcategories]
+        available_subcats = [subcat for subcat in _unique_in_order(subcats[non_meat_items])
+                             if subcat not in used_subcategories]
         
         # Try to include different subcategories
+        non_meat_items_to_use = non_meat_items
         if len(available_subcats) >= 2:
-            chosen_subcats = random.sample(available_subcats, min(2, len(available_subcats)))
-            non_meat_filtered = non_meat_items[non_meat_items['subcategory'].isin(chosen_subcats)].copy()
+            chosen_subcats = _sample(rng, available_subcats, 2)
+            non_meat_filtered = non_meat_items & np.isin(subcats, chosen_subcats)
             
-            if not non_meat_filtered.empty:
+            if non_meat_filtered.any():
                 non_meat_items_to_use = non_meat_filtered
-            else:
-                non_meat_items_to_use = non_meat_items
-        else:
-            non_meat_items_to_use = non_meat_items
         
         # Choose non-meat items to complete the meal
-        max_total_items = 4  # Maximum items in final meal plan
-        while len(meal_plan) < max_total_items and remaining_calories > 0:
+        while len(meal_plan) < PLAN_SIZE and remaining_calories > 0:
             # Find items close to the remaining calories
-            suitable_items = non_meat_items_to_use[non_meat_items_to_use['calories'] <= remaining_calories]
+            suitable_items = non_meat_items_to_use & (calories <= remaining_calories)
             
-            if suitable_items.empty:
+            if not suitable_items.any():
                 # If no items fit, take ones with lowest calories
-                suitable_items = non_meat_items_to_use.sort_values('calories').head(5)
+                suitable_items = _lowest_calories(calories, non_meat_items_to_use)
             
             # Exclude already selected foods and prefer unused subcategories
-            unused_subcat_items = suitable_items[
-                (~suitable_items['food'].isin([item['food'] for item in meal_plan])) &
-                (~suitable_items['subcategory'].isin(used_subcategories))
-            ]
+            unused_subcat_items = suitable_items & ~taken & ~np.isin(subcats, list(used_subcategories))
             
-            if unused_subcat_items.empty:
+            if not unused_subcat_items.any():
                 # If no unused subcategories, just exclude selected foods
-                unused_subcat_items = suitable_items[
-                    ~suitable_items['food'].isin([item['food'] for item in meal_plan])
-                ]
+                unused_subcat_items = suitable_items & ~taken
             
-            if unused_subcat_items.empty:
+            if not unused_subcat_items.any():
                 break
-                
-            # Select item that best matches remaining calories
-            unused_subcat_items['calorie_diff'] = abs(unused_subcat_items['calories'] - remaining_calories/2)
-            selected_food = unused_subcat_items.sort_values('calorie_diff').iloc[0]
-            
-            # Add to meal plan
-            meal_plan.append({
-                'subcategory': selected_food['subcategory'],
-                'food': selected_food['food'],
-                'serving': selected_food['serving'],
-                'calories': selected_food['calories']
-            })
             
-            # Update tracking variables
-            remaining_calories -= selected_food['calories']
-            used_subcategories.add(selected_food['subcategory'])
+            # Select item that best matches remaining calories
+            add(_closest_calories(calories, unused_subcat_items, remaining_calories / 2, bonus()))
     
     else:
         # For vegetarian and vegan plans, select from different subcategories
-        # Group foods by subcategory
-        subcategory_groups = {}
-        for subcat in subcategories:
-            subcategory_groups[subcat] = foods_df[foods_df['subcategory'] == subcat].copy()
-        
         # Try to include items from at least 4 different subcategories if possible
-        target_num_subcats = min(4, len(subcategory_groups))
-        major_subcats = random.sample(list(subcategory_groups.keys()), target_num_subcats)
+        major_subcats = _sample(rng, subcategories, min(PLAN_SIZE, len(subcategories)))
         
         # Process one subcategory at a time to ensure variety
         for i, subcat in enumerate(major_subcats):
@@ -311,132 +905,47 @@ def generate_balanced_meal_plan(foods_df, target_calories, min_calories, max_cal
                 subcat_target_calories = remaining_calories
             else:
                 # Otherwise, allocate calories evenly with some randomness
-                subcat_target_calories = int(remaining_calories / (len(major_subcats) - i) * 
-                                          random.uniform(0.8, 1.2))
-                
+                subcat_target_calories = int(remaining_calories / (len(major_subcats) - i) *
+                                             rng.uniform(0.8, 1.2))
+            
             # Select an item from this subcategory
-            subcat_foods = subcategory_groups[subcat]
-            if not subcat_foods.empty:
+            subcat_foods = (subcats == subcat) & ~taken
+            if subcat_foods.any():
                 # Filter for reasonable calorie amounts relative to this subcategory's target
-                reasonable_foods = subcat_foods[subcat_foods['calories'] <= subcat_target_calories]
+                reasonable_foods = subcat_foods & (calories <= subcat_target_calories)
                 
-                if reasonable_foods.empty:
+                if not reasonable_foods.any():
                     # If no foods fit, get the lowest calorie options
-                    reasonable_foods = subcat_foods.sort_values('calories').head(5)
+                    reasonable_foods = _lowest_calories(calories, subcat_foods)
                 
                 # Find the food with closest calories to the target
-                reasonable_foods['calorie_diff'] = abs(reasonable_foods['calories'] - subcat_target_calories)
-                selected_food = reasonable_foods.sort_values('calorie_diff').iloc[0]
-                
-                meal_plan.append({
-                    'subcategory': selected_food['subcategory'],
-                    'food': selected_food['food'],
-                    'serving': selected_food['serving'],
-                    'calories': selected_food['calories']
-                })
-                
-                # Update remaining calories
-                remaining_calories -= selected_food['calories']
-                used_subcategories.add(selected_food['subcategory'])
+                add(_closest_calories(calories, reasonable_foods, subcat_target_calories, bonus()))
             
             # If we've run out of calories, stop adding items
             if remaining_calories <= 0:
                 break
     
     # Ensure we have exactly 4 items if possible
-    if len(meal_plan) < 4:
+    if len(meal_plan) < PLAN_SIZE:
         # We need to add more items to get to 4
         remaining_subcats = [subcat for subcat in subcategories if subcat not in used_subcategories]
-        remaining_foods = foods_df[
-            (~foods_df['food'].isin([item['food'] for item in meal_plan])) &
-            (foods_df['calories'] <= remaining_calories)
-        ]
+        remaining_foods = ~taken & (calories <= remaining_calories)
         
         # If we have subcategories left to use, prioritize those
-        if remaining_subcats and not remaining_foods.empty:
-            chosen_subcats = random.sample(remaining_subcats, min(4-len(meal_plan), len(remaining_subcats)))
-            additional_foods = remaining_foods[remaining_foods['subcategory'].isin(chosen_subcats)]
+        if remaining_subcats and remaining_foods.any():
+            chosen_subcats = _sample(rng, remaining_subcats, min(PLAN_SIZE - len(meal_plan), len(remaining_subcats)))
+            additional_foods = remaining_foods & np.isin(subcats, chosen_subcats)
             
-            if additional_foods.empty:
+            if not additional_foods.any():
                 additional_foods = remaining_foods
             
             # Add foods until we reach 4 items or run out of eligible foods
-            while len(meal_plan) < 4 and not additional_foods.empty:
+            while len(meal_plan) < PLAN_SIZE and additional_foods.any():
                 # Choose the item that best fits remaining calories
-                additional_foods['calorie_diff'] = abs(additional_foods['calories'] - remaining_calories/(4-len(meal_plan)))
-                selected_food = additional_foods.sort_values('calorie_diff').iloc[0]
-                
-                meal_plan.append({
-                    'subcategory': selected_food['subcategory'],
-                    'food': selected_food['food'],
-                    'serving': selected_food['serving'],
-                    'calories': selected_food['calories']
-                })
-                
-                # Update tracking
-                remaining_calories -= selected_food['calories']
-                used_subcategories.add(selected_food['subcategory'])
+                add(_closest_calories(calories, additional_foods,
+                                      remaining_calories / (PLAN_SIZE - len(meal_plan)), bonus()))
                 
                 # Remove this food from consideration
-                additional_foods = additional_foods[additional_foods['food'] != selected_food['food']]
-    
-    # If we somehow ended up with more than 4 items, keep only the best 4
-    if len(meal_plan) > 4:
-        # Calculate how far the total is from target
-        total_calories = sum(item['calories'] for item in meal_plan)
-        excess_calories = total_calories - target_calories
-        
-        # If we have excess calories, remove items to get closer to target
-        if excess_calories > 0:
-            # Try to find an item close to the excess
-            meal_plan_df = pd.DataFrame(meal_plan)
-            meal_plan_df['calorie_diff'] = abs(meal_plan_df['calories'] - excess_calories)
-            
-            # Sort by difference and try to keep items from different subcategories
-            meal_plan_df = meal_plan_df.sort_values('calorie_diff')
-            
-            # Start with all items
-            keep_items = meal_plan.copy()
-            
-            # Remove items until we have 4
-            while len(keep_items) > 4:
-                # Find the item that, when removed, keeps us closest to target
-                best_removal = None
-                best_diff = float('inf')
-                
-                for item in keep_items:
-                    # Calculate new total without this item
-                    new_total = sum(i['calories'] for i in keep_items if i != item)
-                    diff = abs(new_total - target_calories)
-                    
-                    if diff < best_diff:
-                        best_diff = diff
-                        best_removal = item
-                
-                if best_removal:
-                    keep_items.remove(best_removal)
-            
-            meal_plan = keep_items
-        else:
-            # We don't have excess calories, so keep the 4 items with best subcategory variety
-            used_subcats = set()
-            keep_items = []
-            
-            # First pass - keep one from each subcategory
-            for item in meal_plan:
-                if item['subcategory'] not in used_subcats and len(keep_items) < 4:
-                    keep_items.append(item)
-                    used_subcats.add(item['subcategory'])
-            
-            # If we still don't have 4, add remaining items based on calories
-            remaining_items = [item for item in meal_plan if item not in keep_items]
-            remaining_items.sort(key=lambda x: abs(target_calories/4 - x['calories']))
-            
-            while len(keep_items) < 4 and remaining_items:
-                keep_items.append(remaining_items.pop(0))
-            
-            meal_plan = keep_items
+                additional_foods &= ~taken
     
     return meal_plan
-
-
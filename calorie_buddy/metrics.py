@@ -0,0 +1,318 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Default histogram buckets (seconds), matching the Prometheus client defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+# All metrics created in this process, in registration order
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape_label(value):
+    """Escape a label value for the Prometheus text format."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    """Render a {name="value",...} label set (empty string if there are no labels)."""
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.extend(f'{name}="{_escape_label(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    """Render a sample value the way Prometheus expects."""
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class for labelled metrics stored in the process-wide registry."""
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _copy(self):
+        with self._lock:
+            return {key: self._copy_value(value) for key, value in self._values.items()}
+
+    @staticmethod
+    def _copy_value(value):
+        return value
+
+    # Changes between copies (None when unchanged), and applying them; numeric
+    # values by default, histograms override these
+    @staticmethod
+    def _difference(value, before):
+        return value - (before or 0) or None
+
+    def _apply(self, key, change):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + change
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.metric_type}'
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            lines.extend(self._render_sample(labelvalues, value))
+        return lines
+
+
+class Counter(_Metric):
+    """A monotonically increasing count, e.g. tolerance hits."""
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_sample(self, labelvalues, value):
+        return [f'{self.name}_total{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}']
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, e.g. requests waiting in a queue."""
+    metric_type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _render_sample(self, labelvalues, value):
+        return [f'{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}']
+
+
+class Histogram(_Metric):
+    """Cumulative bucketed observations, e.g. latencies."""
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the wrapped block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def _copy_value(state):
+        return {'counts': list(state['counts']), 'sum': state['sum']}
+
+    @staticmethod
+    def _difference(state, before):
+        before = before or {'counts': [0] * len(state['counts']), 'sum': 0.0}
+        counts = [count - earlier for count, earlier in zip(state['counts'], before['counts'])]
+        return {'counts': counts, 'sum': state['sum'] - before['sum']} if any(counts) else None
+
+    def _apply(self, key, change):
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0}
+            state['counts'] = [count + added for count, added in zip(state['counts'], change['counts'])]
+            state['sum'] += change['sum']
+
+    def _render_sample(self, labelvalues, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state['counts']):
+            cumulative += count
+            labels = _format_labels(self.labelnames, labelvalues, [('le', _format_value(bound))])
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, labelvalues)
+        lines.append(f'{self.name}_sum{labels} {_format_value(state["sum"])}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+def render_metrics():
+    """
+    Render every registered metric in the Prometheus text exposition format.
+
+    Returns:
+        str: Metrics text (content type ``text/plain; version=0.0.4``)
+    """
+    with _registry_lock:
+        metrics = list(_registry)
+
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def snapshot():
+    """Copy of every registered metric's values, for changes_since."""
+    with _registry_lock:
+        metrics = list(_registry)
+    return {metric.name: metric._copy() for metric in metrics}
+
+
+def changes_since(before):
+    """
+    What this process recorded since a snapshot, as plain picklable data.
+
+    Work run in another process (e.g. a process pool worker) records into
+    that process's registry; returning these changes with the result and
+    applying them in the parent keeps /metrics complete.
+
+    Args:
+        before (dict): Output of snapshot
+
+    Returns:
+        dict: Metric name -> {label values: change}, only what changed
+    """
+    with _registry_lock:
+        metrics = list(_registry)
+
+    changes = {}
+    for metric in metrics:
+        earlier = before.get(metric.name, {})
+        changed = {}
+        for key, value in metric._copy().items():
+            difference = metric._difference(value, earlier.get(key))
+            if difference is not None:
+                changed[key] = difference
+        if changed:
+            changes[metric.name] = changed
+    return changes
+
+
+def apply_changes(changes):
+    """Record changes from changes_since (made in another process) in this process's metrics."""
+    with _registry_lock:
+        metrics = {metric.name: metric for metric in _registry}
+    for name, changed in changes.items():
+        for key, change in changed.items():
+            metrics[name]._apply(key, change)
+
+
+# Meal generation
+GENERATION_SECONDS = Histogram(
+    'calorie_buddy_generation_seconds',
+    'Time spent generating the best meal plan for one diet.',
+    ['diet']
+)
+GENERATION_STAGE_SECONDS = Histogram(
+    'calorie_buddy_generation_stage_seconds',
+    'Time spent in each stage of meal plan generation.',
+    ['stage']
+)
+GENERATION_ATTEMPTS = Histogram(
+    'calorie_buddy_generation_attempts',
+    'Number of balanced plan attempts used before a plan was accepted.',
+    ['diet'],
+    buckets=(1, 2, 3, 4, 5, 10, 20)
+)
+GENERATION_TOLERANCE = Counter(
+    'calorie_buddy_generation_tolerance',
+    'Generated plans that landed within (hit) or outside (miss) the calorie tolerance.',
+    ['diet', 'result']
+)
+GENERATION_ERROR = Histogram(
+    'calorie_buddy_generation_error_ratio',
+    'Relative calorie error (|actual - target| / target) of the returned plan, by solver.',
+    ['diet', 'solver'],
+    buckets=(0, 0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 1)
+)
+GENERATION_ITERATIONS = Histogram(
+    'calorie_buddy_generation_iterations',
+    'Local search moves tried by the anytime solver before its deadline.',
+    ['diet'],
+    buckets=(10, 50, 100, 250, 500, 1000, 2500, 5000)
+)
+
+# Admission control in front of generation
+ADMISSION_QUEUE_SECONDS = Histogram(
+    'calorie_buddy_admission_queue_seconds',
+    'Time generation requests waited for a slot, by outcome (admitted / timeout).',
+    ['outcome']
+)
+ADMISSION_SHED = Counter(
+    'calorie_buddy_admission_shed',
+    'Generation requests turned away under load, by route and what they got instead (pooled / rejected).',
+    ['route', 'action']
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    'calorie_buddy_admission_in_flight',
+    'Generation requests currently running.'
+)
+ADMISSION_QUEUED = Gauge(
+    'calorie_buddy_admission_queued',
+    'Generation requests currently waiting for a slot.'
+)
+
+# Background prefetch of the next refresh
+PLAN_PREFETCH = Counter(
+    'calorie_buddy_plan_prefetch',
+    'Plan requests by what the prefetch buffer had for them (hit / miss / expired / skipped / error).',
+    ['result']
+)
+
+# Single-item swaps on the meal planner
+PLAN_SWAPS = Counter(
+    'calorie_buddy_plan_swaps',
+    'Single-item swap requests by outcome (swapped / none).',
+    ['result']
+)
+
+# Web app
+REQUEST_SECONDS = Histogram(
+    'calorie_buddy_request_seconds',
+    'Request latency by route.',
+    ['method', 'route', 'status']
+)
+DB_COMMIT_SECONDS = Histogram(
+    'calorie_buddy_db_commit_seconds',
+    'Time spent committing database sessions.'
+)
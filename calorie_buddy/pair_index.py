@@ -0,0 +1,164 @@
+import numpy as np
+
+from catalog import PoolIndexCache
+
+# Pools with more pairs than this aren't indexed (the solvers fall back to sampling)
+MAX_PAIRS = 4000000
+
+
+def subcategory_bits(subcategories):
+    """
+    One bit per subcategory code, so sets of subcategories are OR-ed masks.
+
+    Codes share a bit modulo 64; that only makes the disjointness check
+    stricter, never looser.
+    """
+    return np.left_shift(np.uint64(1), (subcategories.astype(np.int64) % 64).astype(np.uint64))
+
+
+class PairSumIndex:
+    """
+    Every two-food combination of a pool, sorted by total calories.
+
+    Only pairs of different foods from different subcategories are kept.
+    Each pair stores its pool positions, its calorie sum and its two
+    subcategories packed into bits (see subcategory_bits), so checking
+    whether two pairs make a four-subcategory plan is a single AND.
+    """
+
+    def __init__(self, pool, positions):
+        """
+        Args:
+            pool (FoodPool): Pool the positions refer to
+            positions (np.ndarray): Pool positions to pair up
+        """
+        first, second = np.triu_indices(len(positions), k=1)
+        first, second = positions[first], positions[second]
+        keep = ((pool.subcategories[first] != pool.subcategories[second])
+                & (pool.name_ids[first] != pool.name_ids[second]))
+        first, second = first[keep], second[keep]
+
+        sums = pool.calories[first].astype(np.int32) + pool.calories[second]
+        order = np.argsort(sums, kind='stable')
+        self.first = first[order].astype(np.int32)
+        self.second = second[order].astype(np.int32)
+        self.sums = sums[order]
+        bits = subcategory_bits(pool.subcategories)
+        self.bits = bits[self.first] | bits[self.second]
+
+    def __len__(self):
+        return len(self.sums)
+
+    def around(self, total, share=0.25, minimum=64):
+        """
+        Index range [start, stop) of pairs summing within ``share`` of total,
+        widened to the ``minimum`` nearest pairs when fewer are that close.
+        """
+        start, stop = (int(position) for position in np.searchsorted(self.sums, [total * (1 - share), total * (1 + share)]))
+        missing = min(minimum, len(self)) - (stop - start)
+        if missing > 0:
+            start = max(0, min(start - (missing + 1) // 2, len(self) - min(minimum, len(self))))
+            stop = start + min(minimum, len(self))
+        return start, stop
+
+
+class PlanPairIndex:
+    """
+    Meet-in-the-middle lookup of four-item plans: an anchor pair plus the
+    complement pair whose sum makes up the rest of the target.
+
+    Meat-based diets pair two meat foods with two others, so anchors come
+    from the meat pairs near the meat share of the target. Other diets use
+    one index for both halves, anchored near half the target.
+    """
+
+    def __init__(self, pool, meat=None):
+        """
+        Args:
+            pool (FoodPool): Diet pool (core and side foods together)
+            meat (np.ndarray): Boolean mask of meat foods for meat-based diets, or None
+        """
+        self.pool = pool
+        if meat is not None and meat.any() and not meat.all():
+            self.anchors = PairSumIndex(pool, np.flatnonzero(meat))
+            self.complements = PairSumIndex(pool, np.flatnonzero(~meat))
+        else:
+            self.anchors = self.complements = PairSumIndex(pool, np.arange(len(pool)))
+
+    @classmethod
+    def build(cls, pool, meat=None):
+        """The pool's index, or None if it would hold more than MAX_PAIRS pairs."""
+        if len(pool) * (len(pool) - 1) // 2 > MAX_PAIRS:
+            return None
+        return cls(pool, meat)
+
+    def lookup(self, target_calories, anchor_calories, rng, anchors=64, window=8, bonus=None):
+        """
+        Find the plan closest to the target among random anchors.
+
+        Each anchor's complement is found by binary search for the
+        remaining calories; the ``window`` pairs either side of it are
+        checked for clashing subcategories or foods, with the window placed
+        at random within a run of equal sums so refreshes vary.
+
+        Args:
+            target_calories (int): Calories of the whole plan
+            anchor_calories (float): Calories the anchor pair should have
+            rng (np.random.Generator): Source of the anchor choices
+            anchors (int): Anchor pairs to try
+            window (int): Complement pairs checked on each side of the match
+            bonus (callable): Maps an (n x 4) matrix of plans' pool positions to
+                              calories of error each plan is let off, or None
+
+        Returns:
+            tuple: (pool positions of the plan, its total calories), or None
+                   if no anchor has a compatible complement
+        """
+        if len(self.anchors) == 0 or len(self.complements) == 0:
+            return None
+
+        # Targets out of reach can leave every nearby anchor clashing with the
+        # extreme complements, so anchors are then drawn from the whole index
+        found = self._lookup(self.anchors.around(anchor_calories), target_calories, rng, anchors, window, bonus)
+        if found is None:
+            found = self._lookup((0, len(self.anchors)), target_calories, rng, anchors, window, bonus)
+        return found
+
+    def _lookup(self, anchor_range, target_calories, rng, anchors, window, bonus):
+        chosen = rng.integers(*anchor_range, size=anchors)
+        remaining = target_calories - self.anchors.sums[chosen]
+
+        sums = self.complements.sums
+        left = np.searchsorted(sums, remaining, side='left')
+        right = np.searchsorted(sums, remaining, side='right')
+        centers = left + (rng.random(anchors) * (right - left + 1)).astype(np.int64)
+        columns = np.clip(centers[:, None] + np.arange(-window, window), 0, len(sums) - 1)
+
+        errors = np.abs(self.anchors.sums[chosen][:, None] + sums[columns] - target_calories).astype(np.float64)
+        if bonus is not None:
+            plans = np.stack(np.broadcast_arrays(
+                self.anchors.first[chosen][:, None], self.anchors.second[chosen][:, None],
+                self.complements.first[columns], self.complements.second[columns]
+            ), axis=-1)
+            errors -= bonus(plans.reshape(-1, 4)).reshape(errors.shape)
+        clash = (self.anchors.bits[chosen][:, None] & self.complements.bits[columns]) != 0
+        names = self.pool.name_ids
+        for anchor_positions in (self.anchors.first[chosen], self.anchors.second[chosen]):
+            anchor_names = names[anchor_positions][:, None]
+            clash |= anchor_names == names[self.complements.first[columns]]
+            clash |= anchor_names == names[self.complements.second[columns]]
+        errors[clash] = np.inf
+
+        row, column = np.unravel_index(np.argmin(errors), errors.shape)
+        if not np.isfinite(errors[row, column]):
+            return None
+
+        anchor, complement = chosen[row], columns[row, column]
+        positions = [int(self.anchors.first[anchor]), int(self.anchors.second[anchor]),
+                     int(self.complements.first[complement]), int(self.complements.second[complement])]
+        total = int(self.anchors.sums[anchor]) + int(sums[complement])
+        return positions, total
+
+
+# Shared by every generation in the process
+pair_indexes = PoolIndexCache(PlanPairIndex.build)
@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from metrics import PLAN_PREFETCH
+
+
+class PlanPrefetcher:
+    """
+    Generates a user's next refresh in the background and buffers it.
+
+    After a user is shown plans for a target, ``schedule`` queues the next
+    set on a small thread pool. The next request for the same key takes it
+    from the buffer instead of generating in line. Each key holds at most
+    one set; entries expire after ``ttl_seconds`` and the buffer keeps at
+    most ``max_entries`` keys (least recently scheduled dropped first).
+    """
+
+    def __init__(self, workers=2, ttl_seconds=300, max_entries=1000):
+        """
+        Args:
+            workers (int): Background generation threads
+            ttl_seconds (int): Discard buffered plans older than this
+            max_entries (int): Keys buffered (or in flight) at most
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='plan-prefetch')
+        self._entries = OrderedDict()  # key -> (scheduled at, future)
+        self._lock = threading.Lock()
+
+    def take(self, key, wait=1.0):
+        """
+        Remove and return the buffered plans for a key, or None.
+
+        If the plans are still being generated, wait up to ``wait`` seconds
+        for them (the work is already partly done); queued work isn't waited on.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            PLAN_PREFETCH.inc(result='miss')
+            return None
+
+        scheduled_at, future = entry
+        if time.monotonic() - scheduled_at > self.ttl_seconds:
+            future.cancel()
+            PLAN_PREFETCH.inc(result='expired')
+            return None
+        if not future.done() and not future.running():
+            future.cancel()
+            PLAN_PREFETCH.inc(result='miss')
+            return None
+
+        try:
+            plans = future.result(timeout=wait)
+        except TimeoutError:
+            PLAN_PREFETCH.inc(result='miss')
+            return None
+        except Exception:
+            PLAN_PREFETCH.inc(result='error')
+            return None
+
+        PLAN_PREFETCH.inc(result='hit' if plans is not None else 'skipped')
+        return plans
+
+    def schedule(self, key, generate):
+        """Generate the next set for a key in the background (replacing any buffered set)."""
+        future = self._executor.submit(generate)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic(), future)
+            while len(self._entries) > self.max_entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                evicted.cancel()
+        if previous is not None:
+            previous[1].cancel()
+
+    def invalidate(self, user_id):
+        """Drop everything buffered for a user (keys start with the user id)."""
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == user_id]
+            for key in stale:
+                self._entries.pop(key)[1].cancel()
+
+    def __len__(self):
+        return len(self._entries)
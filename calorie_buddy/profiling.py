@@ -0,0 +1,133 @@
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+from flask import g, request
+
+# Only one request is profiled at a time: cProfile and tracemalloc are
+# process-wide, so overlapping captures would mix their results
+_capture_lock = threading.Lock()
+
+
+def init_profiling(app):
+    """
+    Install opt-in cProfile + tracemalloc capture for single requests.
+
+    A request is profiled when it carries the admin token in the profile
+    header, or when it is picked by the sampling rate. Each capture writes
+    ``<stamp>_<endpoint>.prof`` (pstats, for snakeviz or pstats.Stats) and a
+    ``.txt`` summary (top functions and allocation sites) to the profile
+    directory, and the response gets an ``X-Profile-Id`` header naming them.
+
+    With no token and a zero sampling rate nothing is installed, so the
+    mode costs nothing when it is off. When on, unprofiled requests pay one
+    header lookup and one random draw.
+
+    Config:
+        PROFILE_TOKEN (str): Secret that enables profiling via the header (default: disabled)
+        PROFILE_HEADER (str): Header carrying the token (default X-Profile-Token)
+        PROFILE_SAMPLE_RATE (float): Fraction of requests profiled at random (default 0)
+        PROFILE_DIR (str): Directory for captures (default 'profiles')
+        PROFILE_TOP (int): Functions / allocation sites listed in the summary (default 40)
+
+    Args:
+        app (Flask): Application to profile
+    """
+    app.config.setdefault('PROFILE_TOKEN', None)
+    app.config.setdefault('PROFILE_HEADER', 'X-Profile-Token')
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+    app.config.setdefault('PROFILE_DIR', 'profiles')
+    app.config.setdefault('PROFILE_TOP', 40)
+
+    token = app.config['PROFILE_TOKEN']
+    sample_rate = app.config['PROFILE_SAMPLE_RATE']
+    if not token and sample_rate <= 0:
+        return
+
+    def _requested():
+        supplied = request.headers.get(app.config['PROFILE_HEADER'])
+        if token and supplied and hmac.compare_digest(supplied, token):
+            return 'header'
+        if sample_rate > 0 and random.random() < sample_rate:
+            return 'sample'
+        return None
+
+    @app.before_request
+    def _start_profile():
+        trigger = _requested()
+        if trigger is None or not _capture_lock.acquire(blocking=False):
+            return
+
+        profiler = cProfile.Profile()
+        tracemalloc.start()
+        g.profile = {
+            'trigger': trigger,
+            'started': time.perf_counter(),
+            'profiler': profiler
+        }
+        profiler.enable()
+
+    @app.after_request
+    def _stop_profile(response):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            response.headers['X-Profile-Id'] = _finish(app, profile, response.status_code)
+        return response
+
+    @app.teardown_request
+    def _abandon_profile(error):
+        # after_request doesn't run when a view raises; still release the capture
+        profile = g.pop('profile', None)
+        if profile is not None:
+            _finish(app, profile, 500)
+
+
+def _finish(app, profile, status):
+    """Stop a capture, write it to PROFILE_DIR and return its file stem."""
+    try:
+        profile['profiler'].disable()
+        wall_ms = (time.perf_counter() - profile['started']) * 1000
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+        _capture_lock.release()
+
+    directory = app.config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    endpoint = re.sub(r'[^A-Za-z0-9_]+', '_', request.endpoint or 'unmatched')
+    stem = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{endpoint}"
+    top = app.config['PROFILE_TOP']
+
+    profile['profiler'].dump_stats(os.path.join(directory, f'{stem}.prof'))
+
+    functions = io.StringIO()
+    stats = pstats.Stats(profile['profiler'], stream=functions)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(top)
+
+    allocations = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>')
+    ]).statistics('lineno')[:top]
+
+    with open(os.path.join(directory, f'{stem}.txt'), 'w', encoding='utf-8') as f:
+        f.write(f'{request.method} {request.full_path.rstrip("?")} -> {status}\n')
+        f.write(f'trigger: {profile["trigger"]}\n')
+        f.write(f'wall: {wall_ms:.2f} ms\n')
+        f.write(f'memory: {current / 1024:.1f} KiB still allocated, {peak / 1024:.1f} KiB peak '
+                f'(all threads while the capture ran)\n\n')
+        f.write(f'Top {top} allocation sites by size\n')
+        for stat in allocations:
+            f.write(f'{stat}\n')
+        f.write('\n')
+        f.write(functions.getvalue())
+
+    return stem
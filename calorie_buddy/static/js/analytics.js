@@ -0,0 +1,95 @@
+// Draws the analytics charts from the compact series returned by
+// /api/analytics/series (diet types with parallel averages and counts).
+(function () {
+    // Plotly's default qualitative palette
+    var COLORS = ['#636EFA', '#EF553B', '#00CC96', '#AB63FA', '#FFA15A',
+                  '#19D3F3', '#FF6692', '#B6E880', '#FF97FF', '#FECB52'];
+
+    function averageCaloriesChart(series) {
+        var traces = series.diet_types.map(function (diet, i) {
+            return {
+                type: 'bar',
+                x: [diet],
+                y: [series.avg_actual[i]],
+                name: diet,
+                marker: {color: COLORS[i % COLORS.length]},
+                text: [series.avg_actual[i]],
+                textposition: 'outside'
+            };
+        });
+        Plotly.newPlot('chart1', traces, {
+            title: {text: 'Average Calories by Diet Type'},
+            xaxis: {title: {text: 'Diet Type'}},
+            yaxis: {title: {text: 'Average Calories'}},
+            height: 400,
+            showlegend: true
+        });
+    }
+
+    function targetVsActualChart(series) {
+        var x = series.diet_types;
+        var traces = [
+            {type: 'bar', name: 'Target', x: x, y: series.avg_target, marker: {color: 'red'},
+             text: series.avg_target, textposition: 'outside', xaxis: 'x', yaxis: 'y'},
+            {type: 'bar', name: 'Actual', x: x, y: series.avg_actual, marker: {color: 'blue'},
+             text: series.avg_actual, textposition: 'outside', xaxis: 'x', yaxis: 'y'},
+            {type: 'bar', name: 'Accuracy (%)', x: x, y: series.avg_accuracy, marker: {color: 'green'},
+             text: series.avg_accuracy.map(function (acc) { return acc + '%'; }),
+             textposition: 'outside', xaxis: 'x2', yaxis: 'y2'}
+        ];
+        var maxCalories = Math.max.apply(null, series.avg_target.concat(series.avg_actual));
+        Plotly.newPlot('chart2', traces, {
+            height: 400,
+            showlegend: true,
+            legend: {orientation: 'h', yanchor: 'bottom', y: 1.02, xanchor: 'right', x: 1},
+            xaxis: {domain: [0, 0.45]},
+            yaxis: {range: [0, maxCalories * 1.15]},
+            xaxis2: {domain: [0.55, 1], anchor: 'y2'},
+            yaxis2: {range: [0, 110], anchor: 'x2'},
+            annotations: [
+                {text: 'Target vs Actual Calories', x: 0.225, y: 1, xref: 'paper', yref: 'paper',
+                 xanchor: 'center', yanchor: 'bottom', showarrow: false, font: {size: 16}},
+                {text: 'Accuracy by Diet Type', x: 0.775, y: 1, xref: 'paper', yref: 'paper',
+                 xanchor: 'center', yanchor: 'bottom', showarrow: false, font: {size: 16}}
+            ],
+            // 90% accuracy reference line
+            shapes: [{type: 'line', xref: 'x2', yref: 'y2', x0: -0.5, x1: x.length - 0.5, y0: 90, y1: 90,
+                      line: {color: 'red', width: 2, dash: 'dash'}}]
+        });
+    }
+
+    function distributionChart(series) {
+        Plotly.newPlot('chart3', [{
+            type: 'pie',
+            labels: series.diet_types,
+            values: series.counts,
+            hole: 0.3,
+            textinfo: 'label+percent',
+            hoverinfo: 'label+value+percent',
+            textposition: 'outside',
+            pull: series.diet_types.map(function () { return 0.05; }),
+            marker: {
+                colors: COLORS.slice(0, series.diet_types.length),
+                line: {color: 'white', width: 2}
+            }
+        }], {
+            title: {text: 'Diet Type Distribution'},
+            height: 400,
+            showlegend: true,
+            legend: {orientation: 'h', yanchor: 'top', y: -0.1, xanchor: 'center', x: 0.5}
+        });
+    }
+
+    window.drawAnalyticsCharts = function (url) {
+        fetch(url, {credentials: 'same-origin'})
+            .then(function (response) { return response.json(); })
+            .then(function (series) {
+                if (!series.diet_types.length) {
+                    return;
+                }
+                averageCaloriesChart(series);
+                targetVsActualChart(series);
+                distributionChart(series);
+            });
+    };
+})();
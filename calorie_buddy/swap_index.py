@@ -0,0 +1,119 @@
+import numpy as np
+
+from catalog import PoolIndexCache
+
+# Subcategory codes and calories are packed into one sort key: code (shifted
+# past the -1 of uncategorized custom foods) in the high bits, calories below
+_CALORIE_BITS = 16
+_CALORIE_LIMIT = (1 << _CALORIE_BITS) - 1
+
+
+class SwapIndex:
+    """
+    A pool's foods sorted by subcategory, then calories.
+
+    Finding the food of a subcategory closest to a calorie figure is one
+    binary search on the packed (subcategory, calories) keys, so a single
+    replacement can be checked against every subcategory at once.
+    """
+
+    def __init__(self, pool, meat=None):
+        """
+        Args:
+            pool (FoodPool): Diet pool (core and side foods together)
+            meat (np.ndarray): Boolean mask of meat foods for meat-based diets, or None
+        """
+        self.pool = pool
+        self.meat = meat
+        self.order = np.lexsort((pool.calories, pool.subcategories))
+        self.keys = self._pack(pool.subcategories[self.order], pool.calories[self.order])
+        self.codes, self.starts = np.unique(pool.subcategories[self.order], return_index=True)
+        self.stops = np.append(self.starts[1:], len(self.order))
+        self._ids_order = np.argsort(pool.ids, kind='stable')
+
+    @staticmethod
+    def _pack(subcategories, calories):
+        codes = subcategories.astype(np.int64) + 1
+        return (codes << _CALORIE_BITS) | np.clip(calories, 0, _CALORIE_LIMIT).astype(np.int64)
+
+    def positions(self, food_ids):
+        """Pool positions of food ids, or None if any of them isn't in the pool."""
+        food_ids = np.asarray(food_ids, dtype=self.pool.ids.dtype)
+        found = np.searchsorted(self.pool.ids, food_ids, sorter=self._ids_order)
+        found = self._ids_order[np.clip(found, 0, len(self._ids_order) - 1)]
+        if len(found) == 0 or (self.pool.ids[found] != food_ids).any():
+            return None
+        return found
+
+    def replacement(self, plan_positions, slot, target_calories, tolerance=0.05, avoid=(), window=4):
+        """
+        Best food to put in place of one plan item.
+
+        The replacement's subcategory is either the replaced item's or one
+        the rest of the plan doesn't use, it is never a food already in the
+        plan (or in ``avoid``) and, for meat-based diets, it is meat exactly
+        when the replaced item was. Among those, a food from the same
+        subcategory is preferred while the new total stays within tolerance
+        of the target (or no further off than the current plan); otherwise
+        the closest total wins.
+
+        Args:
+            plan_positions (np.ndarray): Pool positions of the plan's foods
+            slot (int): Index of the item to replace
+            target_calories (int): Target calories of the plan
+            tolerance (float): Allowed distance from the target, as a fraction of it
+            avoid (iterable): Food ids that must not be picked (e.g. foods the
+                              user already swapped out)
+            window (int): Foods first checked on each side of the closest calorie
+                          match; doubled until nothing past it can do better
+
+        Returns:
+            tuple: (pool position of the replacement, new plan total), or None
+                   if no food keeps the total close enough
+        """
+        pool = self.pool
+        calories = pool.calories.astype(np.int64)
+        replaced = plan_positions[slot]
+        kept = np.delete(plan_positions, slot)
+        needed = target_calories - int(calories[kept].sum())
+        allowed_error = max(target_calories * tolerance, abs(needed - int(calories[replaced])))
+
+        # One binary search per allowed subcategory, then a small window around each match
+        groups = np.flatnonzero(
+            (self.codes == pool.subcategories[replaced]) | ~np.isin(self.codes, pool.subcategories[kept])
+        )
+        matches = np.searchsorted(self.keys, self._pack(self.codes[groups], np.full(len(groups), needed)))
+        avoid = np.asarray(list(avoid), dtype=pool.ids.dtype)
+        while True:
+            columns = matches[:, None] + np.arange(-window, window + 1)
+            inside = (columns >= self.starts[groups][:, None]) & (columns < self.stops[groups][:, None])
+            candidates = self.order[np.clip(columns, 0, len(self.order) - 1)]
+
+            distances = np.abs(calories[candidates] - needed).astype(np.float64)
+            distances[~inside] = np.inf
+            taken = np.isin(pool.name_ids[candidates], pool.name_ids[plan_positions])
+            taken |= np.isin(pool.ids[candidates], avoid)
+            if self.meat is not None:
+                taken |= self.meat[candidates] != self.meat[replaced]
+            errors = np.where(taken | (distances > allowed_error), np.inf, distances)
+
+            # Foods past the window are at least as far off as its edges, so it
+            # is wide enough once no subcategory's edge could still do better
+            edges = np.minimum(distances[:, 0], distances[:, -1])
+            if window >= len(self.order) or not ((edges <= allowed_error) & (edges < errors.min(axis=1))).any():
+                break
+            window *= 2
+
+        # Same-subcategory foods win whenever they're close enough
+        same = pool.subcategories[candidates] == pool.subcategories[replaced]
+        scores = errors + np.where(same, 0, allowed_error + 1)
+        best = np.unravel_index(np.argmin(scores), scores.shape)
+        if not np.isfinite(scores[best]):
+            return None
+
+        position = int(candidates[best])
+        return position, int(calories[kept].sum() + calories[position])
+
+
+# Shared by every request in the process
+swap_indexes = PoolIndexCache(SwapIndex)
@@ -0,0 +1,228 @@
+"""
+Synthetic data for testing Calorie Buddy at production scale.
+
+'catalog' writes a food catalog of any size whose subcategory mix, servings
+and calorie distribution follow calories.csv: every synthetic food is a
+variant of a random real food with its calories jittered, so the
+classification rules see realistic names. The output has the processed
+catalog columns (see catalog_merge.py) and is written in chunks, so a
+million foods take little memory.
+
+'history' adds synthetic users with years of meal plan history to the
+database the app is configured for (CALORIE_BUDDY_DATABASE_URI, sharded or
+not). Plans come from the real generator, one pool per target calorie
+level, and rows go in with executemany bulk inserts.
+
+Usage (from the directory containing calories.csv):
+    python calorie_buddy/synthetic_data.py catalog --foods 1000000 --output synthetic_calories.csv
+    CALORIE_BUDDY_DATABASE_URI=sqlite:////tmp/scale.db \\
+        python calorie_buddy/synthetic_data.py history --users 2000 --years 3
+"""
+import argparse
+import csv
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from catalog_merge import OUTPUT_FIELDS
+
+# Target calorie levels synthetic users pick from (the planner's usual range)
+TARGET_LEVELS = np.arange(1200, 3201, 100)
+
+
+def synthetic_catalog(source, foods, output, seed=None, chunk_size=100000):
+    """
+    Write a synthetic catalog modeled on a real one.
+
+    Args:
+        source (str): Raw catalog CSV to model (Subcategory, Food, Serving, Calories)
+        foods (int): Number of foods to write
+        output (str): Output CSV path
+        seed (int): Seed for a reproducible catalog
+        chunk_size (int): Foods generated and written per chunk
+
+    Returns:
+        int: Foods written
+    """
+    rng = np.random.default_rng(seed)
+    real = pd.read_csv(source)
+    subcategories = real['Subcategory'].to_numpy(dtype=object)
+    names = real['Food'].to_numpy(dtype=object)
+    servings = real['Serving'].to_numpy(dtype=object)
+    calories = real['Calories'].map(lambda value: int(str(value).split()[0])).to_numpy()
+
+    with open(output, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(OUTPUT_FIELDS)
+
+        for start in range(0, foods, chunk_size):
+            size = min(chunk_size, foods - start)
+            # Drawing real rows uniformly keeps the subcategory mix and the
+            # per-subcategory calorie distribution; the jitter smooths it
+            rows = rng.integers(len(real), size=size)
+            jitter = rng.lognormal(mean=0.0, sigma=0.15, size=size)
+            food_calories = np.clip(np.rint(calories[rows] * jitter), 0, 5000).astype(int)
+            food_ids = np.arange(start, start + size)
+
+            writer.writerows(zip(
+                food_ids.tolist(),
+                subcategories[rows],
+                (f'{name} #{food_id}' for name, food_id in zip(names[rows], food_ids.tolist())),
+                servings[rows],
+                (f'{value} Cal' for value in food_calories.tolist())
+            ))
+
+    return foods
+
+
+def _plan_pools(plans_per_level, seed):
+    """Generated plan sets per target level: (target -> [(diet -> food ids, diet -> total)], all plans)."""
+    from app import food_catalog, base_diet_pools
+    from meal_generator import generate_meal_plans, seed_sequence
+
+    pools = {}
+    plans = []
+    for target in TARGET_LEVELS.tolist():
+        level = []
+        for index in range(plans_per_level):
+            meal_plans = generate_meal_plans(
+                food_catalog,
+                target_calories=target,
+                min_calories=int(target * 0.95),
+                max_calories=int(target * 1.05),
+                diet_pools=base_diet_pools,
+                seed=seed_sequence(seed, target, index)
+            )
+            totals = {
+                diet_type: int(food_catalog.calories[food_catalog.positions(food_ids)].sum()) if food_ids else 0
+                for diet_type, food_ids in meal_plans.items()
+            }
+            level.append((meal_plans, totals))
+            plans.extend(meal_plans.values())
+        pools[target] = level
+    return pools, plans
+
+
+def _user_rows(user_id, pools, content_hashes, first_day, days, rng):
+    """One synthetic user's history: a generation (one row per diet) on each active day."""
+    target = int(np.clip(np.rint(rng.normal(2000, 350) / 100) * 100, TARGET_LEVELS[0], TARGET_LEVELS[-1]))
+    activity = rng.beta(2, 5)  # Share of days the user generates plans
+    active_days = np.flatnonzero(rng.random(days) < activity)
+    picks = rng.integers(len(pools[target]), size=len(active_days))
+    saves = rng.random(len(active_days)) < 0.03
+
+    rows = []
+    for day, pick, saved in zip(active_days.tolist(), picks.tolist(), saves.tolist()):
+        meal_plans, totals = pools[target][pick]
+        plan_date = (first_day + timedelta(days=day)).isoformat()
+        for diet_type, food_ids in meal_plans.items():
+            row = {
+                'user_id': user_id,
+                'date': plan_date,
+                'target_calories': target,
+                'diet_type': diet_type,
+                'actual_calories': totals[diet_type],
+                'content_hash': content_hashes[food_ids],
+                'is_saved': False
+            }
+            rows.append(row)
+        if saved:
+            diet_type = list(meal_plans)[int(rng.integers(len(meal_plans)))]
+            rows.append(dict(rows[-len(meal_plans)], diet_type=diet_type,
+                             actual_calories=totals[diet_type],
+                             content_hash=content_hashes[meal_plans[diet_type]], is_saved=True))
+    return rows
+
+
+def synthetic_history(users, years, seed=None, plans_per_level=50, batch_size=5000,
+                      prefix='synthetic', password='synthetic'):
+    """
+    Add synthetic users with meal plan history to the app's database.
+
+    Users are named <prefix><n>, numbered after any synthetic users already
+    there, and share one password. Each user has a target level, an activity
+    rate (share of days with a generation) and saves about 3% of generations.
+
+    Args:
+        users (int): Users to add
+        years (float): Years of history per user, ending today
+        seed (int): Seed for reproducible data
+        plans_per_level (int): Distinct plan sets generated per target level
+        batch_size (int): Rows per insert statement
+        prefix (str): Username prefix
+        password (str): Password of every synthetic user
+
+    Returns:
+        dict: Users and meal plans inserted
+    """
+    # Importing app opens the configured database, so only the history command does it
+    from werkzeug.security import generate_password_hash
+    from app import app, db, User, MealPlan, store_plan_contents, plan_content_key
+    from history_io import chunked
+    from history_shards import history_shard, each_history_shard
+
+    rng = np.random.default_rng(seed)
+    days = int(years * 365)
+    first_day = date.today() - timedelta(days=days - 1)
+
+    with app.app_context():
+        pools, plans = _plan_pools(plans_per_level, seed)
+        content_hashes = {food_ids: plan_content_key(food_ids)[0] for food_ids in plans}
+        for _ in each_history_shard():
+            for batch in chunked(plans, batch_size):
+                store_plan_contents(batch)
+
+        start = db.session.query(User).filter(User.username.like(f'{prefix}%')).count()
+        usernames = [f'{prefix}{number}' for number in range(start, start + users)]
+        password_hash = generate_password_hash(password)
+        created_at = time.strftime('%Y-%m-%d %H:%M:%S')
+        for batch in chunked(usernames, batch_size):
+            db.session.execute(db.insert(User), [
+                {'username': username, 'email': f'{username}@example.com', 'password_hash': password_hash,
+                 'created_at': created_at, 'exclusions': ''}
+                for username in batch
+            ])
+        user_ids = [user_id for user_id, in db.session.query(User.id).filter(User.username.in_(usernames))]
+
+        inserted = 0
+        for user_id in user_ids:
+            with history_shard(user_id):
+                for batch in chunked(_user_rows(user_id, pools, content_hashes, first_day, days, rng), batch_size):
+                    db.session.execute(db.insert(MealPlan), batch)
+                    inserted += len(batch)
+        db.session.commit()
+
+    return {'users': len(user_ids), 'plans': inserted}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic Calorie Buddy data for scale testing.')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for reproducible data')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    catalog = commands.add_parser('catalog', help='Write a synthetic food catalog')
+    catalog.add_argument('--foods', type=int, default=1000000, help='Foods to generate')
+    catalog.add_argument('--source', default='calories.csv', help='Real catalog to model')
+    catalog.add_argument('--output', default='synthetic_calories.csv', help='Output CSV')
+
+    history = commands.add_parser('history', help='Add synthetic users with meal plan history')
+    history.add_argument('--users', type=int, default=1000, help='Users to add')
+    history.add_argument('--years', type=float, default=3, help='Years of history per user')
+    history.add_argument('--plans-per-level', type=int, default=50, help='Plan sets generated per target level')
+    history.add_argument('--batch-size', type=int, default=5000, help='Rows per insert statement')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == 'catalog':
+        written = synthetic_catalog(args.source, args.foods, args.output, args.seed)
+        print(f'Wrote {written} foods to {args.output} in {time.perf_counter() - started:.1f}s')
+    else:
+        result = synthetic_history(args.users, args.years, args.seed, args.plans_per_level, args.batch_size)
+        print(f"Added {result['users']} users and {result['plans']} meal plans "
+              f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
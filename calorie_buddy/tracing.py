@@ -0,0 +1,131 @@
+import json
+import logging
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Structured (one JSON object per line) log of slow or suspicious requests
+slow_request_logger = logging.getLogger('calorie_buddy.slow_requests')
+
+
+def init_tracing(app):
+    """
+    Install per-request SQL tracing on a Flask app.
+
+    Every request records how many SQL statements it ran, how long they took
+    and how much of the request was spent in Python instead. Statements that
+    repeat within one request (typically lazy loads in a loop) are flagged as
+    N+1 patterns. Slow or flagged requests are written as JSON lines to the
+    ``calorie_buddy.slow_requests`` logger.
+
+    Config:
+        TRACE_SLOW_REQUEST_MS (int): Log requests slower than this (default 500)
+        TRACE_N_PLUS_ONE_THRESHOLD (int): Repeats of one statement that count as N+1 (default 5)
+        TRACE_LOG_FILE (str): File for the slow request log (default: no file handler)
+        TRACE_SERVER_TIMING (bool): Send the SQL/app split as a Server-Timing
+                                    header (default: only in debug mode)
+
+    Args:
+        app (Flask): Application to trace
+    """
+    app.config.setdefault('TRACE_SLOW_REQUEST_MS', 500)
+    app.config.setdefault('TRACE_N_PLUS_ONE_THRESHOLD', 5)
+    app.config.setdefault('TRACE_LOG_FILE', None)
+    app.config.setdefault('TRACE_SERVER_TIMING', False)
+
+    log_file = app.config['TRACE_LOG_FILE']
+    if log_file and not slow_request_logger.handlers:
+        handler = logging.FileHandler(log_file)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        slow_request_logger.addHandler(handler)
+        slow_request_logger.setLevel(logging.INFO)
+
+    # Listening on the Engine class covers every engine the app creates
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    @app.before_request
+    def _start_trace():
+        g.trace = {
+            'started': time.perf_counter(),
+            'cpu_started': time.process_time(),
+            'sql_count': 0,
+            'sql_seconds': 0.0,
+            'statements': Counter()
+        }
+
+    @app.after_request
+    def _finish_trace(response):
+        trace = g.pop('trace', None)
+        if trace is None:
+            return response
+
+        total_ms = (time.perf_counter() - trace['started']) * 1000
+        sql_ms = trace['sql_seconds'] * 1000
+        python_ms = max(0.0, total_ms - sql_ms)
+        cpu_ms = (time.process_time() - trace['cpu_started']) * 1000
+
+        # Browser dev tools show this split per request; it reveals query
+        # counts and timings, so it is only sent when asked for
+        if app.debug or app.config['TRACE_SERVER_TIMING']:
+            response.headers['Server-Timing'] = (
+                f'sql;dur={sql_ms:.2f};desc="{trace["sql_count"]} queries", '
+                f'app;dur={python_ms:.2f}'
+            )
+
+        threshold = app.config['TRACE_N_PLUS_ONE_THRESHOLD']
+        n_plus_one = [
+            {'statement': statement[:200], 'count': count}
+            for statement, count in trace['statements'].most_common()
+            if count >= threshold
+        ]
+
+        if total_ms >= app.config['TRACE_SLOW_REQUEST_MS'] or n_plus_one:
+            slow_request_logger.warning(json.dumps({
+                'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'total_ms': round(total_ms, 2),
+                'sql_ms': round(sql_ms, 2),
+                'python_ms': round(python_ms, 2),
+                'cpu_ms': round(cpu_ms, 2),
+                'sql_count': trace['sql_count'],
+                'n_plus_one': n_plus_one
+            }))
+
+        return response
+
+
+# Start times are keyed by cursor, so a failed statement's start can't be
+# picked up by the next statement on the connection
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('trace_query_start', {})[id(cursor)] = time.perf_counter()
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    cursor = getattr(exception_context.execution_context, 'cursor', None)
+    if connection is not None and cursor is not None:
+        connection.info.get('trace_query_start', {}).pop(id(cursor), None)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['trace_query_start'].pop(id(cursor))
+    if not has_request_context():
+        return
+    trace = g.get('trace')
+    if trace is None:
+        return
+
+    # Statements are parameterized, so identical text means the same query shape
+    trace['sql_count'] += 1
+    trace['sql_seconds'] += time.perf_counter() - started
+    trace['statements'][statement] += 1
@@ -1,6 +1,12 @@
+import argparse
 import json
 from datetime import datetime
-from app import db, User, MealPlan
+from app import (
+    app, db, User, MealPlan, LEGACY_HASH_PREFIX, food_catalog, overlay_cache,
+    plan_content_key, store_meal_plan, bulk_insert_meal_plans, plan_cooccurrence
+)
+from history_shards import use_history_shard, history_shard, each_history_shard
+from history_io import chunked, legacy_user_entries
 
 
 def register_user(username: str, password: str, email: str):
@@ -32,13 +38,12 @@ def get_user_data(username: str) -> dict:
     if not user:
         return {}
 
+    view = overlay_cache.view(user.id)
+    use_history_shard(user.id)
+
     # Helper to serialize a MealPlan
     def _serialize(plan: MealPlan) -> dict:
-        # Parse JSON foods field
-        try:
-            foods = json.loads(plan.foods)
-        except Exception:
-            foods = []
+        foods = [item['food'] for item in view.describe(plan.food_ids)]
 
         return {
             'id': plan.id,
@@ -63,23 +68,32 @@ def get_user_data(username: str) -> dict:
 
 
 def save_meal_plan(username: str, plan_data: dict, is_saved: bool = True) -> bool:
-    """Save a new meal plan for the given user."""
+    """
+    Save a new meal plan for the given user.
+
+    The plan's foods are its 'food_ids' when given, otherwise its 'foods'
+    names resolved against the user's foods and the catalog. Saved plans
+    are counted into the co-occurrence model once committed (see
+    app.store_meal_plan).
+    """
     user = User.query.filter_by(username=username).first()
     if not user:
         return False
 
-    foods_json = json.dumps(plan_data.get('foods', []))
-    plan = MealPlan(
-        user_id=user.id,
-        date=plan_data.get('date', datetime.now().strftime("%Y-%m-%d")),
-        target_calories=plan_data.get('target_calories', 0),
+    food_ids = plan_data.get('food_ids')
+    if food_ids is None:
+        food_ids = overlay_cache.view(user.id).ids_for_names(plan_data.get('foods', []))
+
+    use_history_shard(user.id)
+    store_meal_plan(
+        user.id,
+        food_ids,
         diet_type=plan_data.get('diet_type', ''),
+        target_calories=plan_data.get('target_calories', 0),
         actual_calories=plan_data.get('actual_calories', 0),
-        foods=foods_json,
+        date=plan_data.get('date'),
         is_saved=is_saved
     )
-    db.session.add(plan)
-    db.session.commit()
     return True
 
 
@@ -89,22 +103,84 @@ def update_meal_history(username: str, new_history: list[dict]) -> bool:
     if not user:
         return False
 
-    # Delete existing non-saved history
+    use_history_shard(user.id)
+
+    # Delete existing non-saved history in one statement
     MealPlan.query.filter_by(user_id=user.id, is_saved=False).delete()
 
-    # Insert new history entries
-    for entry in new_history:
-        foods_json = json.dumps(entry.get('foods', []))
-        plan = MealPlan(
-            user_id=user.id,
-            date=entry.get('date', datetime.now().strftime("%Y-%m-%d")),
-            target_calories=entry.get('target_calories', 0),
-            diet_type=entry.get('diet_type', ''),
-            actual_calories=entry.get('actual_calories', 0),
-            foods=foods_json,
-            is_saved=False
-        )
-        db.session.add(plan)
+    # Insert new history entries in batches
+    bulk_insert_meal_plans(user.id, [dict(entry, is_saved=False) for entry in new_history])
 
     db.session.commit()
     return True
+
+
+def count_plan_savers(foods: list) -> int:
+    """Count how many distinct users have saved a plan with exactly these catalog foods."""
+    food_ids = [food_catalog.id_for_name(food) for food in foods]
+    if None in food_ids:
+        return 0
+    content_hash, _ = plan_content_key(food_ids)
+
+    # Users never span history shards, so the per-shard counts add up
+    return sum(
+        db.session.query(db.func.count(db.distinct(MealPlan.user_id)))
+        .filter(MealPlan.content_hash == content_hash, MealPlan.is_saved.is_(True))
+        .scalar()
+        for _ in each_history_shard()
+    )
+
+
+def migrate_user_json(path: str, batch_size: int = 1000) -> dict:
+    """
+    Import users, history and saved plans from the old user.json store.
+
+    Users that already exist are skipped (with their plans), so the
+    migration can be re-run safely. Passwords keep their old unsalted
+    SHA-256 hash and are re-hashed on first login.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        legacy_users = json.load(f)
+
+    existing = {
+        username for (username,) in
+        db.session.query(User.username).filter(User.username.in_(list(legacy_users)))
+    }
+    new_usernames = [username for username in legacy_users if username not in existing]
+
+    for batch in chunked(new_usernames, batch_size):
+        db.session.execute(db.insert(User), [
+            {
+                'username': username,
+                'email': legacy_users[username].get('email', ''),
+                'password_hash': LEGACY_HASH_PREFIX + legacy_users[username].get('password_hash', ''),
+                'created_at': legacy_users[username].get('created_at') or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'exclusions': ''
+            }
+            for username in batch
+        ])
+
+    user_ids = dict(db.session.query(User.username, User.id).filter(User.username.in_(new_usernames)))
+    plans = 0
+    saved_plans = []
+    for username in new_usernames:
+        with history_shard(user_ids[username]):
+            plans += bulk_insert_meal_plans(user_ids[username], legacy_user_entries(legacy_users[username]),
+                                            batch_size, saved_plans=saved_plans)
+
+    db.session.commit()
+    for food_ids in saved_plans:
+        plan_cooccurrence.add_plan(food_ids)
+    return {'users': len(new_usernames), 'skipped_users': len(existing), 'plans': plans}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migrate the old user.json store into the database.')
+    parser.add_argument('path', nargs='?', default='user.json', help='Path to user.json')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Rows per insert statement')
+    args = parser.parse_args()
+
+    with app.app_context():
+        result = migrate_user_json(args.path, args.batch_size)
+    print(f"Imported {result['users']} users and {result['plans']} meal plans "
+          f"({result['skipped_users']} existing users skipped)")
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules import each other flat (from catalog import ...), as when run from calorie_buddy/
+sys.path.insert(0, os.path.join(ROOT, 'calorie_buddy'))
+
+
+@pytest.fixture(scope='session')
+def catalog():
+    from catalog import load_catalog
+    return load_catalog(os.path.join(ROOT, 'calories.csv'))
+
+
+@pytest.fixture(scope='session')
+def flask_app(tmp_path_factory):
+    """The app on a throwaway database (it loads calories.csv relative to the repo root)."""
+    directory = tmp_path_factory.mktemp('app')
+    os.environ['CALORIE_BUDDY_DATABASE_URI'] = f"sqlite:///{directory / 'calorie_buddy.db'}"
+    os.environ['CALORIE_BUDDY_TRACE_LOG'] = str(directory / 'slow_requests.log')
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        from app import app
+    finally:
+        os.chdir(cwd)
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def client(flask_app):
+    """Test client logged in as a fresh user."""
+    client = flask_app.test_client()
+    username = f'user{os.urandom(4).hex()}'
+    client.post('/register', data={'username': username, 'email': f'{username}@example.com',
+                                   'password': 'password123', 'confirm_password': 'password123'})
+    client.post('/login', data={'username': username, 'password': 'password123'})
+    return client
@@ -0,0 +1,46 @@
+def saved_food_ids(flask_app, diet_type):
+    from app import MealPlan, PlanContent, decode_food_ids
+    with flask_app.app_context():
+        plan = MealPlan.query.filter_by(diet_type=diet_type, is_saved=True).order_by(MealPlan.id.desc()).first()
+        return decode_food_ids(PlanContent.query.get(plan.content_hash).food_ids)
+
+
+def test_save_keeps_session_food_ids(flask_app, client):
+    from app import food_catalog
+    # A row that isn't the first listed for its name would resolve to another id by name
+    first_ids = {food_catalog.id_for_name(name) for name in food_catalog.names}
+    repeated = next(int(food_id) for food_id in food_catalog.food_ids if int(food_id) not in first_ids)
+    others = [int(food_id) for food_id in food_catalog.food_ids[:3]]
+    food_ids = [repeated] + others
+
+    with client.session_transaction() as session:
+        session['meal_plans'] = {'Vegetarian': {'foods': [], 'total_calories': 0, 'food_ids': food_ids}}
+    client.post('/save_meal_plan', data={'diet_type': 'Vegetarian', 'target_calories': 2000, 'actual_calories': 2000})
+
+    assert list(saved_food_ids(flask_app, 'Vegetarian')) == food_ids
+
+
+def test_save_without_plan_in_session_is_refused(flask_app, client):
+    from app import MealPlan
+    with flask_app.app_context():
+        before = MealPlan.query.filter_by(is_saved=True).count()
+    response = client.post('/save_meal_plan', data={'diet_type': 'Vegan', 'target_calories': 2000, 'actual_calories': 2000})
+    assert response.status_code == 302
+    with flask_app.app_context():
+        assert MealPlan.query.filter_by(is_saved=True).count() == before
+
+
+def test_swapped_out_foods_are_capped(client):
+    from app import SWAPPED_OUT_LIMIT
+    client.post('/meal_planner', data={'target_calories': 2000})
+    with client.session_transaction() as session:
+        plans = session['meal_plans']
+        plans['Vegan']['swapped_out'] = list(range(-SWAPPED_OUT_LIMIT, 0))
+        swapped = plans['Vegan']['food_ids'][0]
+        session['meal_plans'] = plans
+
+    client.post('/meal_planner/swap', data={'diet_type': 'Vegan', 'position': 0})
+    with client.session_transaction() as session:
+        swapped_out = session['meal_plans']['Vegan']['swapped_out']
+    assert len(swapped_out) == SWAPPED_OUT_LIMIT
+    assert swapped_out[-1] == swapped
@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+from catalog import FoodCatalog
+from data_processor import load_and_process_data
+from food_overlay import CatalogView
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def gapped_catalog():
+    """Catalog whose ids skip 5 (a food dropped by a later merge)."""
+    food_data = load_and_process_data(os.path.join(ROOT, 'calories.csv')).head(10)
+    food_data['food_id'] = range(len(food_data))
+    return FoodCatalog(food_data[food_data['food_id'] != 5])
+
+
+def test_positions_reject_unknown_ids(gapped_catalog):
+    assert gapped_catalog.positions([4, 6]).tolist() == [4, 5]
+    for stale in (5, 10, -3):
+        with pytest.raises(KeyError):
+            gapped_catalog.positions([4, stale])
+
+
+def test_describe_skips_unknown_ids(gapped_catalog):
+    names = gapped_catalog.names
+    described = gapped_catalog.describe([6, 5, 10, 0])
+    assert [item['food'] for item in described] == [names[5], names[0]]
+
+
+def test_view_describe_skips_unknown_ids(gapped_catalog):
+    view = CatalogView(gapped_catalog, {}, {-1: {'food': 'Custom', 'serving': '1', 'calories': 1, 'subcategory': ''}})
+    described = view.describe([5, -1, -2, 9])
+    assert [item['food'] for item in described] == ['Custom', gapped_catalog.names[8]]
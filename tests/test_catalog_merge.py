@@ -0,0 +1,50 @@
+import csv
+import json
+
+from catalog_merge import merge_catalog
+
+HEADER = 'Subcategory,Food,Serving,Calories\n'
+
+
+def read_ids(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return {(row['Subcategory'], row['Food']): int(row['food_id']) for row in csv.DictReader(f)}
+
+
+def test_remerge_keeps_food_ids(tmp_path):
+    source = tmp_path / 'source.csv'
+    config = tmp_path / 'catalog_sources.json'
+    config.write_text(json.dumps({'sources': ['source.csv'], 'output': 'catalog.csv'}))
+
+    source.write_text(HEADER + 'Fruit,Apple,100 g,52 Cal\n'
+                               'Fruit,Banana,100 g,89 Cal\n'
+                               'Nuts & Seeds,Almonds,100 g,579 Cal\n'
+                               'Fruit,Almonds,100 g,579 Cal\n')
+    merge_catalog(str(config))
+    before = read_ids(tmp_path / 'catalog.csv')
+
+    # A new food sorting first would shift every position-assigned id
+    source.write_text(HEADER + 'Fruit,Apricot,100 g,48 Cal\n'
+                      + source.read_text()[len(HEADER):])
+    stats = merge_catalog(str(config))
+    after = read_ids(tmp_path / 'catalog.csv')
+
+    assert stats['new'] == 1
+    assert {food: after[food] for food in before} == before
+    assert after[('Fruit', 'Apricot')] == max(before.values()) + 1
+
+
+def test_first_merge_keeps_row_position_ids(tmp_path):
+    # Catalogs without a food_id column are addressed by row position
+    (tmp_path / 'catalog.csv').write_text(HEADER + 'Fruit,Banana,100 g,89 Cal\n'
+                                                   'Fruit,Apple,100 g,52 Cal\n')
+    (tmp_path / 'source.csv').write_text(HEADER + 'Fruit,Apple,100 g,52 Cal\n'
+                                                  'Fruit,Kiwi,100 g,61 Cal\n')
+    config = tmp_path / 'catalog_sources.json'
+    config.write_text(json.dumps({'sources': ['source.csv', 'catalog.csv'], 'output': 'catalog.csv'}))
+
+    merge_catalog(str(config))
+
+    assert read_ids(tmp_path / 'catalog.csv') == {
+        ('Fruit', 'Apple'): 1, ('Fruit', 'Banana'): 0, ('Fruit', 'Kiwi'): 2
+    }
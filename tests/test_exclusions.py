@@ -0,0 +1,24 @@
+import pandas as pd
+import pytest
+
+from exclusions import TAG_BITS, compute_exclusion_bits
+
+
+def tagged(name, tag):
+    bits = compute_exclusion_bits(pd.Series([name]), pd.Series(['Other']))
+    return bool(bits[0] & TAG_BITS[tag])
+
+
+@pytest.mark.parametrize('name', [
+    'Peanut Butter', 'Almond Butter', 'Cashew Butter', 'Sunbutter', 'Soy Nut Butter', 'Peanut Butter Sandwich',
+    'Butternut Squash', 'Butterfish'
+])
+def test_plant_butters_are_not_dairy(name):
+    assert not tagged(name, 'dairy')
+
+
+@pytest.mark.parametrize('name', [
+    'Butter', 'Buttermilk', 'Toast, Butter Toast', 'Croissant, Butter Croissant', 'Mashed Potato, with Milk and Butter'
+])
+def test_butter_is_dairy(name):
+    assert tagged(name, 'dairy')
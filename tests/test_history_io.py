@@ -0,0 +1,40 @@
+import csv
+import io
+
+import pytest
+
+from history_io import MAX_PLAN_CALORIES, normalize_entry, read_entries
+
+HEADER = 'date,diet_type,target_calories,actual_calories,is_saved,foods\n'
+
+
+@pytest.fixture
+def small_field_limit():
+    limit = csv.field_size_limit(100)
+    yield
+    csv.field_size_limit(limit)
+
+
+def test_csv_errors_name_the_line(small_field_limit):
+    stream = io.StringIO(HEADER + '2024-01-01,Vegan,2000,1990,true,"[]"\n'
+                         f'2024-01-02,Vegan,2000,1990,true,"[{"x" * 200}]"\n')
+
+    with pytest.raises(ValueError, match='^Line 3: field larger than field limit'):
+        list(read_entries(stream, 'csv'))
+
+
+@pytest.mark.parametrize('field, value', [
+    ('target_calories', -1),
+    ('actual_calories', MAX_PLAN_CALORIES + 1),
+])
+def test_calories_out_of_range_are_rejected(field, value):
+    entry = dict({'diet_type': 'Vegan', 'target_calories': 2000, 'actual_calories': 1990}, **{field: value})
+    with pytest.raises(ValueError, match=field):
+        normalize_entry(entry)
+
+
+def test_out_of_range_line_is_named():
+    stream = io.StringIO('{"diet_type": "Vegan", "target_calories": 2000, "actual_calories": 1990}\n'
+                         '{"diet_type": "Vegan", "target_calories": 2000, "actual_calories": 99999999}\n')
+    with pytest.raises(ValueError, match='^Line 2: actual_calories'):
+        list(read_entries(stream, 'ndjson'))
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from cooccurrence import CooccurrenceModel
+from meal_generator import (
+    build_diet_pools, generate_meal_plans, generate_pair_meal_plan, generate_sampled_meal_plans,
+    generate_weekly_meal_plans
+)
+
+
+def test_weekly_plans_reject_unknown_diet(catalog):
+    with pytest.raises(ValueError, match='Keto'):
+        generate_weekly_meal_plans(catalog, 2000, 1900, 2100, diet_types=['Keto'],
+                                   diet_pools=build_diet_pools(catalog))
+
+
+def test_weekly_planner_route_rejects_unknown_diet(client):
+    response = client.post('/weekly_planner', data={'target_calories': '2000', 'diet_type': 'Keto'})
+    assert response.status_code == 400
+    assert 'Keto' in response.get_json()['error']
+
+
+def test_weekly_planner_route_plans_known_diet(client):
+    response = client.post('/weekly_planner', data={'target_calories': '2000', 'diet_type': 'Vegan'})
+    assert response.status_code == 200
+    assert all(list(day['plans']) == ['Vegan'] for day in response.get_json()['days'])
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_weekly_days_are_full_plans(catalog, seed):
+    diet_pools = build_diet_pools(catalog)
+    daily = generate_meal_plans(catalog, 2000, 1900, 2100, diet_pools=diet_pools, seed=seed)
+    week = generate_weekly_meal_plans(catalog, 2000, 1900, 2100, diet_pools=diet_pools, seed=seed)
+    for day in week['days']:
+        assert {diet: len(plan) for diet, plan in day['plans'].items()} == {
+            diet: len(plan) for diet, plan in daily.items()
+        }
+
+
+@pytest.mark.parametrize('solver', [
+    lambda core, side, ratio, seed, model: generate_sampled_meal_plans(
+        core, side, 2000, meat_ratio=ratio, seed=seed, cooccurrence=model)[0][0],
+    lambda core, side, ratio, seed, model: generate_pair_meal_plan(
+        core, side, 2000, meat_ratio=ratio, seed=seed, cooccurrence=model)[0],
+], ids=['sampled', 'pair_index'])
+def test_saved_plans_bias_vectorized_solvers(catalog, solver):
+    core_foods, side_foods, meat_ratio = build_diet_pools(catalog)['Vegan']
+    saved_plan = set(generate_pair_meal_plan(core_foods, side_foods, 2000, seed=123)[0])
+    model = CooccurrenceModel()
+    for _ in range(50):
+        model.add_plan(saved_plan)
+
+    def shared_foods(model):
+        return np.mean([len(saved_plan & set(solver(core_foods, side_foods, meat_ratio, seed, model)))
+                        for seed in range(20)])
+
+    assert shared_foods(model) > shared_foods(None)
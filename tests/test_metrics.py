@@ -0,0 +1,40 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from meal_generator import build_diet_pools, generate_meal_plans
+from metrics import GENERATION_SECONDS, GENERATION_STAGE_SECONDS, Counter, apply_changes, changes_since, snapshot
+
+
+def generation_counts():
+    return {name: sum(sum(state['counts']) for state in histogram._copy().values())
+            for name, histogram in [('total', GENERATION_SECONDS), ('stages', GENERATION_STAGE_SECONDS)]}
+
+
+def recorded(catalog, diet_pools, executor=None):
+    before = generation_counts()
+    generate_meal_plans(catalog, 2000, 1900, 2100, diet_pools=diet_pools, seed=1, executor=executor)
+    return {name: count - before[name] for name, count in generation_counts().items()}
+
+
+@pytest.mark.parametrize('executor_class', [ProcessPoolExecutor, ThreadPoolExecutor])
+def test_executor_runs_are_recorded_once(catalog, executor_class):
+    diet_pools = build_diet_pools(catalog)
+    serial = recorded(catalog, diet_pools)
+    assert serial['total'] == len(diet_pools)
+
+    with executor_class(max_workers=2) as executor:
+        assert recorded(catalog, diet_pools, executor) == serial
+
+
+def test_changes_round_trip():
+    counter = Counter('test_round_trip', 'Test counter.', ['result'])
+    counter.inc(result='kept')
+    before = snapshot()
+    counter.inc(2, result='kept')
+    counter.inc(result='new')
+
+    changes = changes_since(before)
+    assert changes == {'test_round_trip': {('kept',): 2, ('new',): 1}}
+    apply_changes(changes)
+    assert counter._copy() == {('kept',): 5, ('new',): 2}
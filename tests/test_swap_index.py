@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from catalog import FoodPool
+from meal_generator import PLAN_SIZE, _meat_mask, build_diet_pools
+from swap_index import SwapIndex
+
+
+def brute_force_score(index, plan_positions, slot, target_calories, tolerance, avoid):
+    """Best replacement score over every food in the pool, per SwapIndex.replacement's rules."""
+    pool = index.pool
+    calories = pool.calories.astype(np.int64)
+    replaced = plan_positions[slot]
+    kept = np.delete(plan_positions, slot)
+    needed = target_calories - int(calories[kept].sum())
+    allowed_error = max(target_calories * tolerance, abs(needed - int(calories[replaced])))
+
+    same = pool.subcategories == pool.subcategories[replaced]
+    errors = np.abs(calories - needed).astype(np.float64)
+    valid = (same | ~np.isin(pool.subcategories, pool.subcategories[kept])) & (errors <= allowed_error)
+    valid &= ~np.isin(pool.name_ids, pool.name_ids[plan_positions]) & ~np.isin(pool.ids, list(avoid))
+    if index.meat is not None:
+        valid &= index.meat == index.meat[replaced]
+    if not valid.any():
+        return None
+    return (errors + np.where(same, 0, allowed_error + 1))[valid].min()
+
+
+@pytest.mark.parametrize('window', [1, 4])
+def test_replacement_matches_brute_force(catalog, window):
+    rng = np.random.default_rng(0)
+    for core_foods, side_foods, meat_ratio in build_diet_pools(catalog).values():
+        pool = core_foods if side_foods is None else FoodPool.concat([core_foods, side_foods])
+        index = SwapIndex(pool, _meat_mask(pool, meat_ratio))
+        for _ in range(100):
+            plan_positions = rng.choice(len(pool.ids), PLAN_SIZE, replace=False)
+            slot = int(rng.integers(PLAN_SIZE))
+            target = int(pool.calories[plan_positions].sum() + rng.integers(-300, 300))
+            # Avoiding many foods leaves gaps around the closest matches
+            avoid = rng.choice(pool.ids, len(pool.ids) // 3, replace=False)
+
+            found = index.replacement(plan_positions, slot, target, avoid=avoid, window=window)
+            expected = brute_force_score(index, plan_positions, slot, target, 0.05, avoid)
+            if expected is None:
+                assert found is None
+                continue
+
+            assert found is not None
+            needed = target - int(pool.calories[np.delete(plan_positions, slot)].sum())
+            error = abs(int(pool.calories[found[0]]) - needed)
+            same = pool.subcategories[found[0]] == pool.subcategories[plan_positions[slot]]
+            allowed_error = max(target * 0.05, abs(needed - int(pool.calories[plan_positions[slot]])))
+            assert error + (0 if same else allowed_error + 1) == expected
@@ -0,0 +1,39 @@
+import pytest
+from flask import Flask, g
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from tracing import init_tracing
+
+
+def test_failed_statement_does_not_skew_later_timings():
+    app = Flask(__name__)
+    init_tracing(app)
+    engine = create_engine('sqlite://')
+
+    with app.test_request_context('/'):
+        app.preprocess_request()
+        with engine.connect() as connection:
+            with pytest.raises(OperationalError):
+                connection.execute(text('SELECT * FROM missing_table'))
+            assert connection.info['trace_query_start'] == {}
+
+            connection.execute(text('SELECT 1'))
+            assert connection.info['trace_query_start'] == {}
+        assert g.trace['sql_count'] == 1
+
+
+@pytest.mark.parametrize('debug, enabled, sent', [
+    (False, False, False),
+    (True, False, True),
+    (False, True, True),
+])
+def test_server_timing_is_opt_in(debug, enabled, sent):
+    app = Flask(__name__)
+    app.debug = debug
+    app.config['TRACE_SERVER_TIMING'] = enabled
+    init_tracing(app)
+    app.add_url_rule('/', 'index', lambda: 'ok')
+
+    response = app.test_client().get('/')
+    assert ('Server-Timing' in response.headers) == sent
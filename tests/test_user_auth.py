@@ -0,0 +1,42 @@
+import io
+import json
+
+
+def pair_count(model, food_id, other_id):
+    ids, counts = model.row(food_id)
+    return int(counts[ids == other_id].sum())
+
+
+def test_save_through_helper_updates_cooccurrence(flask_app):
+    from app import plan_cooccurrence
+    from user_auth import register_user, save_meal_plan
+
+    food_ids = [11, 22, 33, 44]
+    with flask_app.app_context():
+        register_user('helper_saver', 'password123', 'helper_saver@example.com')
+        before = pair_count(plan_cooccurrence, 11, 22), pair_count(plan_cooccurrence, 33, 44)
+
+        assert save_meal_plan('helper_saver', {'diet_type': 'Vegan', 'food_ids': food_ids})
+        assert (pair_count(plan_cooccurrence, 11, 22), pair_count(plan_cooccurrence, 33, 44)) == (before[0] + 1, before[1] + 1)
+
+        # History entries aren't saves
+        assert save_meal_plan('helper_saver', {'diet_type': 'Vegan', 'food_ids': food_ids}, is_saved=False)
+        assert pair_count(plan_cooccurrence, 11, 22) == before[0] + 1
+
+
+def test_history_import_updates_cooccurrence(flask_app, client):
+    from app import food_catalog, plan_cooccurrence
+
+    names = [food_catalog.names[position] for position in (0, 1)]
+    food_ids = [food_catalog.id_for_name(name) for name in names]
+    before = pair_count(plan_cooccurrence, *food_ids)
+
+    lines = [
+        {'diet_type': 'Vegan', 'target_calories': 2000, 'actual_calories': 1900, 'is_saved': True, 'foods': names},
+        {'diet_type': 'Vegan', 'target_calories': 2000, 'actual_calories': 1900, 'is_saved': False, 'foods': names}
+    ]
+    upload = io.BytesIO('\n'.join(json.dumps(line) for line in lines).encode('utf-8'))
+    client.post('/import/history', data={'history_file': (upload, 'history.ndjson')},
+                content_type='multipart/form-data')
+
+    assert pair_count(plan_cooccurrence, *food_ids) == before + 1